@@ -1,31 +1,542 @@
 # -*- coding: utf-8 -*-
 import sys, os
 import yaml
+import warnings
+from concurrent.futures import ProcessPoolExecutor
 from bag.design.module import Module
 from bag.util.search import FloatBinaryIterator
+from bag.io import load_sim_results
 from verification.mos.query import MOSDBDiscrete
-from typing import Tuple, Mapping, Any, List
+from typing import Tuple, Mapping, Any, List, Iterable, Iterator
 import numpy as np
-from pprint import pprint
+from pprint import pformat
+from collections import OrderedDict
+import heapq
+import hashlib, json, pickle
+import asyncio, functools, threading
+import contextlib, time
+import logging
+
+# Shared by every disable_print call, opened on first use
+_devnull = None
+_stdout_stack = []
 
 def disable_print():
-    sys.stdout = open(os.devnull, 'w')
+    """Sends stdout to os.devnull until the matching enable_print.
+    Calls can be nested. See also quiet_output.
+    """
+    global _devnull
+    if _devnull == None:
+        _devnull = open(os.devnull, 'w')
+    _stdout_stack.append(sys.stdout)
+    sys.stdout = _devnull
 
 def enable_print():
-    sys.stdout = sys.__stdout__
-
-def get_mos_db(spec_file, intent, lch=None, interp_method='spline', sim_env='tt') -> MOSDBDiscrete:
-    # Initialize transistor database from simulation data
-    mos_db = MOSDBDiscrete([spec_file], interp_method=interp_method)
-    # Set process corners
-    mos_db.env_list = [sim_env]
-    # Set layout parameters
-    mos_db.set_dsn_params(intent=intent)
-    
-    if lch != None:
-        mos_db.set_dsn_params(lch=lch)
-    
-    return mos_db
+    sys.stdout = _stdout_stack.pop() if len(_stdout_stack) > 0 else sys.__stdout__
+
+# Operating point cache shared by every database (and so every DesignModule)
+# in the process. Keys are the database identity plus bias voltages
+# quantized to op_cache_params['vres'].
+_op_cache = OrderedDict()
+op_cache_params = dict(max_size=200000, vres=1e-6)
+_op_cache_stats = dict(hits=0, misses=0)
+
+def set_op_cache_params(max_size:int=None, vres:float=None) -> None:
+    """
+    Inputs:
+        max_size: Maximum number of cached operating points. 0 disables caching.
+        vres: Voltage quantization (in volts) applied to vgs, vds, and vbs
+            before lookup.
+    """
+    if max_size != None:
+        op_cache_params['max_size'] = max_size
+    if vres != None:
+        op_cache_params['vres'] = vres
+    clear_op_cache()
+
+def clear_op_cache() -> None:
+    _op_cache.clear()
+    _op_cache_stats.update(hits=0, misses=0)
+
+def get_op_cache_stats() -> Mapping[str,int]:
+    return dict(size=len(_op_cache), **op_cache_params, **_op_cache_stats)
+
+# Opt-in profiling of hot paths, see DesignModule.design(profile=True).
+# Entries are {name : [calls, seconds]}; counters only add to calls.
+# Disabled, a timed block costs one dictionary lookup.
+profile_params = dict(enabled=False)
+_profile_stats = dict()
+
+def set_profile_enabled(enabled:bool) -> None:
+    profile_params['enabled'] = enabled
+
+def clear_profile() -> None:
+    _profile_stats.clear()
+
+def get_profile() -> Mapping[str,Mapping[str,float]]:
+    return {k:dict(calls=calls, time=t) for k, (calls, t) in _profile_stats.items()}
+
+def merge_profile(profile:Mapping[str,Mapping[str,float]]) -> None:
+    """Adds a get_profile result, e.g. from a worker process, to this one.
+    """
+    for name, entry in profile.items():
+        stats = _profile_stats.setdefault(name, [0, 0.0])
+        stats[0] += entry['calls']
+        stats[1] += entry['time']
+
+class _ProfileTimer(object):
+    __slots__ = ('name', 't_start')
+
+    def __init__(self, name:str):
+        self.name = name
+
+    def __enter__(self):
+        self.t_start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        stats = _profile_stats.setdefault(self.name, [0, 0.0])
+        stats[0] += 1
+        stats[1] += time.perf_counter() - self.t_start
+        return False
+
+_null_timer = contextlib.nullcontext()
+
+def profile_timer(name:str):
+    """Context manager which times its block under name, e.g.
+        with profile_timer('stb'):
+            pm = get_stability_margins(num, den)
+    """
+    if not profile_params['enabled']:
+        return _null_timer
+    return _ProfileTimer(name)
+
+def profile_count(name:str, num:int=1) -> None:
+    """Counts num occurrences of name, e.g. points in a sweep level.
+    """
+    if profile_params['enabled']:
+        _profile_stats.setdefault(name, [0, 0.0])[0] += num
+
+def profiled(name:str=None):
+    """Decorator version of profile_timer. name defaults to the
+    function's qualified name.
+    """
+    def decorator(fn):
+        label = fn.__qualname__ if name == None else name
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not profile_params['enabled']:
+                return fn(*args, **kwargs)
+            with _ProfileTimer(label):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def print_profile(profile:Mapping[str,Mapping[str,float]]=None, total_name:str=None) -> None:
+    """Logs a get_profile result (at INFO) as a table, slowest first. Timed
+    blocks can be nested, so times don't add up.
+    Inputs:
+        profile: Defaults to the current profile.
+        total_name: Entry to give percentages of, e.g. the design() time.
+    """
+    if profile == None:
+        profile = get_profile()
+    total = profile[total_name]['time'] if total_name in profile else 0
+    logger.info('%-48s%12s%12s%16s%8s', 'name', 'calls', 'time (s)', 'per call (us)', '%')
+    for name, entry in sorted(profile.items(), key=lambda x: (-x[1]['time'], x[0])):
+        calls, t = entry['calls'], entry['time']
+        per_call = f'{1e6*t/calls:.2f}' if calls > 0 and t > 0 else '-'
+        percent = f'{100*t/total:.1f}' if total > 0 and t > 0 else '-'
+        logger.info('%-48s%12d%12.4f%16s%8s', name, calls, t, per_call, percent)
+
+class _StdoutHandler(logging.StreamHandler):
+    """Writes to whatever sys.stdout is when a record is emitted, so
+    disable_print and redirect_stdout apply to log messages as they do
+    to print.
+    """
+
+    def __init__(self):
+        super().__init__()
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+    @profiled('log.emit')
+    def emit(self, record):
+        super().emit(record)
+
+# Parent of every module's logger. Rejected candidates are logged at DEBUG,
+# progress at INFO. Messages go to stdout like the prints they replace.
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.addHandler(_StdoutHandler())
+logger.propagate = False
+
+def set_log_level(level) -> None:
+    """
+    Inputs:
+        level: logging level for every scripts_dsn module, e.g. logging.DEBUG
+            to see each rejected candidate or logging.WARNING for quiet runs.
+    """
+    logger.setLevel(level)
+
+@contextlib.contextmanager
+def quiet_output():
+    """Silences printing and logging in the block, e.g. around child
+    designs. Log records below WARNING are dropped before they're formatted.
+    """
+    level = logger.level
+    logger.setLevel(max(logger.getEffectiveLevel(), logging.WARNING))
+    disable_print()
+    try:
+        yield
+    finally:
+        enable_print()
+        logger.setLevel(level)
+
+# On-disk cache of design() results, keyed on the spec
+design_cache_params = dict(cache_dir=None)
+
+# Unfiltered candidates for incremental re-design, keyed on the spec without
+# performance limits. Values are (candidates, other_params, files named in
+# the spec), least recently used first.
+_prefilter_cache = OrderedDict()
+prefilter_cache_params = dict(max_size=16)
+
+def set_prefilter_cache_params(max_size:int=None) -> None:
+    """
+    Inputs:
+        max_size: Maximum number of sweeps kept in memory for
+            DesignModule.meet_spec_incremental. 0 keeps none.
+    """
+    if max_size != None:
+        prefilter_cache_params['max_size'] = max_size
+    clear_prefilter_cache()
+
+def clear_prefilter_cache() -> None:
+    _prefilter_cache.clear()
+
+def _put_prefilter_cache(key:str, op_list, other_params, file_list:List[str]) -> None:
+    _prefilter_cache[key] = (op_list, other_params, set(os.path.abspath(f) for f in file_list))
+    _prefilter_cache.move_to_end(key)
+    while len(_prefilter_cache) > prefilter_cache_params['max_size']:
+        _prefilter_cache.popitem(last=False)
+
+def set_design_cache_dir(cache_dir:str=None) -> None:
+    """Sets the default cache directory for DesignModule.design, so designs
+    run from inside other designs are cached too. None disables caching.
+    """
+    design_cache_params['cache_dir'] = cache_dir
+
+def _normalize_params(val):
+    """Converts a parameter structure into something JSON-serializable whose
+    representation doesn't depend on dictionary order or container types.
+    """
+    if isinstance(val, Mapping):
+        return [[str(k), _normalize_params(val[k])] for k in sorted(val.keys(), key=str)]
+    if isinstance(val, (list, tuple)):
+        return [_normalize_params(v) for v in val]
+    if isinstance(val, np.ndarray):
+        return _normalize_params(val.tolist())
+    if isinstance(val, np.generic):
+        return _normalize_params(val.item())
+    if isinstance(val, float):
+        return repr(val)
+    if val == None or isinstance(val, (bool, int, str)):
+        return val
+    return repr(val)
+
+def round_params(val, rtol:float):
+    """Rounds every float in a parameter structure to a relative tolerance,
+    so parameters which only differ by numerical noise compare equal.
+    """
+    if isinstance(val, Mapping):
+        return {k:round_params(v, rtol) for k, v in val.items()}
+    if isinstance(val, (list, tuple)):
+        return type(val)(round_params(v, rtol) for v in val)
+    if isinstance(val, np.ndarray):
+        return round_params(val.tolist(), rtol)
+    if isinstance(val, (float, np.floating)):
+        num_digits = max(1, int(np.ceil(-np.log10(rtol))))
+        return float(f'{float(val):.{num_digits}g}')
+    return val
+
+def _hash_file(file_name:str) -> str:
+    file_hash = hashlib.sha256()
+    with open(file_name, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+# Stamps of the characterization data each spec file points to, see
+# _get_data_stamp. Cleared by invalidate_mos_db.
+_data_stamp_cache = dict() # {spec file absolute path : stamp}
+
+def _get_data_stamp(file_name:str) -> List[Any]:
+    """Summarizes the data a yaml spec file points to (e.g. the root_dir
+    of a device characterization) as [[path, number of files, latest
+    modification time]], so re-characterizing a device without editing its
+    spec file still changes get_design_key. Empty for other files.
+    """
+    spec_path = os.path.abspath(file_name)
+    if spec_path in _data_stamp_cache:
+        return _data_stamp_cache[spec_path]
+
+    data_paths = []
+    if spec_path.endswith(('.yaml', '.yml')):
+        try:
+            with open(spec_path, 'r') as f:
+                spec = yaml.safe_load(f)
+        except (OSError, yaml.YAMLError):
+            spec = None
+        def find_paths(val):
+            if isinstance(val, Mapping):
+                val = list(val.values())
+            if isinstance(val, list):
+                for v in val:
+                    find_paths(v)
+            elif isinstance(val, str):
+                # Relative paths may be relative to the spec file
+                for path in (val, os.path.join(os.path.dirname(spec_path), val)):
+                    path = os.path.abspath(path)
+                    # Not e.g. '.', which would cover the spec file itself
+                    if os.path.exists(path) and os.path.commonpath((path, spec_path)) != path:
+                        data_paths.append(path)
+                        break
+        find_paths(spec)
+
+    stamp = []
+    for path in sorted(set(data_paths)):
+        num_files, mtime = 1, os.path.getmtime(path)
+        for dir_name, _, file_names in os.walk(path):
+            for name in file_names:
+                num_files += 1
+                mtime = max(mtime, os.path.getmtime(os.path.join(dir_name, name)))
+        stamp.append([path, num_files, repr(mtime)])
+    _data_stamp_cache[spec_path] = stamp
+    return stamp
+
+def _get_param_files(params) -> List[str]:
+    """Returns the strings anywhere in a parameter structure which name
+    files, e.g. device spec files, sorted and without duplicates.
+    """
+    file_list = []
+    def find_files(val):
+        if isinstance(val, list):
+            for v in val:
+                find_files(v)
+        elif isinstance(val, str) and os.path.isfile(val):
+            file_list.append(val)
+    find_files(_normalize_params(params))
+    return sorted(set(file_list))
+
+def get_design_key(dsn_cls, params:Mapping[str,Any]) -> str:
+    """Returns the cache key for running dsn_cls().design(**params). Covers
+    the parameters, the contents of any files they name (e.g. device spec
+    files) along with the modification times of the data those point to,
+    and the source of the design script and of every module in scripts_dsn,
+    since design scripts call into each other. Data modification times are
+    read once per process per spec file, so call invalidate_mos_db after
+    re-characterizing a device in a running process.
+    """
+    params_norm = _normalize_params(params)
+    file_list = _get_param_files(params_norm)
+
+    src_dir = os.path.dirname(os.path.abspath(__file__))
+    src_list = set(os.path.join(src_dir, f) for f in os.listdir(src_dir) if f.endswith('.py'))
+    src_list.add(os.path.abspath(sys.modules[dsn_cls.__module__].__file__))
+    src_list = sorted(src_list)
+    key_info = dict(dsn_cls=f'{dsn_cls.__module__}.{dsn_cls.__qualname__}',
+                    params=params_norm,
+                    files=[[f, _hash_file(f), _get_data_stamp(f)] for f in file_list],
+                    src=[[os.path.relpath(f, src_dir), _hash_file(f)] for f in src_list])
+    return hashlib.sha256(json.dumps(key_info, sort_keys=True).encode()).hexdigest()
+
+class CachedMOSDB(object):
+    """Handle to a MOSDBDiscrete that is only loaded on first use, and which
+    only interpolates queries of the same (quantized) bias point once.
+    Everything other than query is passed through to the underlying database.
+    Get these through get_mos_db rather than constructing them directly.
+    """
+
+    def __init__(self, db_key:Tuple):
+        self._db = None
+        self._db_key = db_key
+        self._generation = _mos_db_generation.setdefault(db_key, 0)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.get_db(), name)
+
+    def __reduce__(self):
+        # Re-resolve through the pool of whichever process unpickles this
+        spec_file, interp_method, sim_env, intent, lch = self._db_key
+        return (get_mos_db, (spec_file, intent, lch, interp_method, sim_env))
+
+    def get_db(self) -> MOSDBDiscrete:
+        # Reload if invalidate_mos_db was called since this was loaded
+        generation = _mos_db_generation[self._db_key]
+        if self._generation != generation:
+            self._db = None
+            self._generation = generation
+        if self._db == None:
+            spec_file, interp_method, sim_env, intent, lch = self._db_key
+            # Initialize transistor database from simulation data
+            mos_db = MOSDBDiscrete([spec_file], interp_method=interp_method)
+            # Set process corners
+            mos_db.env_list = [sim_env]
+            # Set layout parameters
+            mos_db.set_dsn_params(intent=intent)
+
+            if lch != None:
+                mos_db.set_dsn_params(lch=lch)
+            self._db = mos_db
+        return self._db
+
+    def unload(self) -> None:
+        self._db = None
+
+    @profiled('db.query')
+    def query(self, vgs:float, vds:float, vbs:float, **kwargs) -> Mapping[str,float]:
+        db = self.get_db()
+        max_size = op_cache_params['max_size']
+        if kwargs or max_size <= 0:
+            return db.query(vgs=vgs, vds=vds, vbs=vbs, **kwargs)
+
+        # Query at the quantized point so results don't depend on query order
+        vres = op_cache_params['vres']
+        vgs_q, vds_q, vbs_q = (int(round(v/vres)) for v in (vgs, vds, vbs))
+        key = (self._db_key, vgs_q, vds_q, vbs_q)
+
+        op = _op_cache.get(key, None)
+        if op == None:
+            _op_cache_stats['misses'] += 1
+            op = db.query(vgs=vgs_q*vres, vds=vds_q*vres, vbs=vbs_q*vres)
+            _op_cache[key] = op
+            if len(_op_cache) > max_size:
+                _op_cache.popitem(last=False)
+        else:
+            _op_cache_stats['hits'] += 1
+            _op_cache.move_to_end(key)
+
+        return dict(op)
+
+# Databases shared by every design in the process,
+# keyed on (spec_file, interp_method, sim_env, intent, lch)
+_mos_db_pool = dict()
+# Bumped by invalidate_mos_db, so handles designers already hold reload too
+_mos_db_generation = dict() # {db_key : generation}
+
+def get_mos_db(spec_file, intent, lch=None, interp_method='spline', sim_env='tt') -> CachedMOSDB:
+    """Returns the shared database handle for this device. The characterization
+    data is loaded the first time the handle is used, and only once per process.
+    """
+    db_key = (spec_file, interp_method, sim_env, intent, lch)
+    if db_key not in _mos_db_pool:
+        _mos_db_pool[db_key] = CachedMOSDB(db_key)
+    return _mos_db_pool[db_key]
+
+def invalidate_mos_db(spec_file:str=None) -> None:
+    """Forces databases to be reloaded from disk the next time they're used,
+    e.g. after re-characterizing a device, including through handles
+    designers already hold. Cached operating points for those
+    databases are dropped as well, along with their inverse lookup tables
+    and the in-memory candidates of meet_spec_incremental sweeps using
+    those spec files. The characterization data is checked again for
+    get_design_key, so on-disk design caches aren't reused either.
+    Inputs:
+        spec_file: Only invalidate databases from this spec file. None
+            invalidates everything.
+    """
+    db_keys = [k for k in _mos_db_generation.keys() if spec_file in (None, k[0])]
+    for db_key in db_keys:
+        _mos_db_generation[db_key] += 1
+
+    op_keys = [k for k in _op_cache.keys() if k[0] in db_keys]
+    for op_key in op_keys:
+        del _op_cache[op_key]
+
+    lut_keys = [k for k in _vgs_lut_pool.keys() if k[0] in db_keys]
+    for lut_key in lut_keys:
+        del _vgs_lut_pool[lut_key]
+
+    spec_path = None if spec_file == None else os.path.abspath(spec_file)
+    if spec_path == None:
+        _data_stamp_cache.clear()
+    else:
+        _data_stamp_cache.pop(spec_path, None)
+    prefilter_keys = [k for k, v in _prefilter_cache.items() if spec_path == None or spec_path in v[2]]
+    for prefilter_key in prefilter_keys:
+        del _prefilter_cache[prefilter_key]
+
+@profiled()
+def query_batch(db:MOSDBDiscrete, vgs, vds, vbs) -> Mapping[str,np.ndarray]:
+    """Vectorized version of db.query. Evaluates every operating point
+    in a single interpolation call per parameter rather than one
+    db.query call per point.
+    Inputs:
+        db: MOSDBDiscrete associated with the device.
+        vgs: Scalar or array of gate-source voltages.
+        vds: Scalar or array of drain-source voltages.
+        vbs: Scalar or array of bulk/body-source voltages.
+    Returns:
+        op_batch: Dictionary with the same keys as db.query (ibias, gm, gds,
+            cgg, vstar, ...) whose values are arrays with the broadcast
+            shape of vgs, vds, and vbs. Empty if there are no points.
+    """
+    vgs, vds, vbs = np.broadcast_arrays(np.asarray(vgs, dtype=float),
+                                        np.asarray(vds, dtype=float),
+                                        np.asarray(vbs, dtype=float))
+    shape = vgs.shape
+    if vgs.size == 0:
+        return dict()
+
+    # Single point query to find out which parameters the database provides
+    names = db.query(vgs=vgs.flat[0], vds=vds.flat[0], vbs=vbs.flat[0]).keys()
+
+    # Last axis of the function argument is the sweep parameter axis
+    fun_arg = db.get_fun_arg(vgs=vgs.ravel(), vds=vds.ravel(), vbs=vbs.ravel())
+    fun_arg = np.moveaxis(np.asarray(fun_arg), 0, -1)
+
+    return {k:np.asarray(db.get_function(k)(fun_arg)).reshape(shape) for k in names}
+
+def op_from_batch(op_batch:Mapping[str,np.ndarray], idx) -> Mapping[str,float]:
+    """Pulls a single operating point out of the result of query_batch
+    in the same format as db.query.
+    """
+    return {k:float(v[idx]) for k, v in op_batch.items()}
+
+def get_sim_env_list(sim_env) -> List[str]:
+    """Normalizes a sim_env parameter to a list of corners. A single
+    corner name gives a list of one; the first entry is the nominal corner.
+    """
+    if isinstance(sim_env, str):
+        return [sim_env]
+    sim_env_list = list(sim_env)
+    if len(sim_env_list) < 1:
+        raise ValueError('sim_env needs at least one corner')
+    return sim_env_list
+
+def query_batch_corners(db_list:List[MOSDBDiscrete], vgs, vds, vbs) -> Mapping[str,np.ndarray]:
+    """query_batch for the same bias points in several databases of one
+    device, e.g. one per process corner.
+    Inputs:
+        db_list: Databases to query, one per corner.
+        vgs, vds, vbs: Same as query_batch.
+    Returns:
+        op_batch: Same as query_batch, but with an extra leading axis
+            for the corner. Empty if there are no points.
+    """
+    op_batch_list = [query_batch(db, vgs=vgs, vds=vds, vbs=vbs) for db in db_list]
+    if len(op_batch_list[0]) < 1:
+        return dict()
+    return {k:np.stack([op_batch[k] for op_batch in op_batch_list]) for k in op_batch_list[0].keys()}
 
 def estimate_vth(db:MOSDBDiscrete, vgs:float, vbs:float, is_nch:bool, lch:float) -> float:
     """Estimates the threshold voltage of a device.
@@ -49,6 +560,7 @@ def estimate_vth(db:MOSDBDiscrete, vgs:float, vbs:float, is_nch:bool, lch:float)
     else:
         return vgs + vov
 
+@profiled()
 def match_vgs(db, is_nch:bool, itarget:float, nf:int, vds:float, vbs:float, vdd:float):
     '''
     Binary search to find the vgs associated with a particular
@@ -81,6 +593,208 @@ def match_vgs(db, is_nch:bool, itarget:float, nf:int, vds:float, vbs:float, vdd:
     return True, vgs
 
 
+@profiled()
+def match_vgs_vec(db, is_nch:bool, itarget, nf, vds, vbs, vdd:float) -> Tuple[np.ndarray,np.ndarray]:
+    """Array version of match_vgs. Runs the binary search for every target
+    current at once, so each step is a single query_batch call instead of
+    one FloatBinaryIterator loop per target.
+    Inputs:
+        itarget, nf, vds, vbs: Scalars or arrays, broadcast against one another.
+    Outputs:
+        success: Boolean array, same as the first output of match_vgs.
+        vgs: Array of gate-source voltages.
+    """
+    itarget, nf, vds, vbs = np.broadcast_arrays(np.asarray(itarget, dtype=float),
+                                                np.asarray(nf, dtype=float),
+                                                np.asarray(vds, dtype=float),
+                                                np.asarray(vbs, dtype=float))
+    vgs_min = np.full(itarget.shape, -vdd if not is_nch else 0.0)
+    vgs_max = np.full(itarget.shape, vdd if is_nch else 0.0)
+    vgs = (vgs_min + vgs_max)/2
+    if itarget.size == 0:
+        return np.ones(itarget.shape, dtype=bool), vgs
+
+    tol = vdd/1000
+    while np.any(vgs_max - vgs_min > tol):
+        vgs = (vgs_min + vgs_max)/2
+        ibias = query_batch(db, vgs=vgs, vds=vds, vbs=vbs)['ibias']*nf
+
+        # More current means less gate drive for NMOS, more for PMOS
+        too_high = ibias > itarget
+        too_low = ibias < itarget
+        go_up = too_low if is_nch else too_high
+        go_down = too_high if is_nch else too_low
+        vgs_min = np.where(go_up, vgs, vgs_min)
+        vgs_max = np.where(go_down, vgs, vgs_max)
+
+        # Exact match
+        exact = ~(go_up | go_down)
+        vgs_min = np.where(exact, vgs, vgs_min)
+        vgs_max = np.where(exact, vgs, vgs_max)
+
+    success = vgs <= vdd if is_nch else vgs >= -vdd
+    return success, vgs
+
+
+def _get_grid_weights(grid:np.ndarray, val:np.ndarray) -> Tuple[np.ndarray,np.ndarray,np.ndarray]:
+    """Lower grid index and weight of the upper neighbor for linear
+    interpolation on an ascending grid. Points off the grid are clamped
+    to its edges and flagged in in_range.
+    """
+    if len(grid) < 2:
+        return np.zeros(val.shape, dtype=int), np.zeros(val.shape), np.isclose(val, grid[0])
+    idx = np.clip(np.searchsorted(grid, val, side='right')-1, 0, len(grid)-2)
+    weight = (val - grid[idx])/(grid[idx+1] - grid[idx])
+    in_range = (weight > -1e-9) & (weight < 1+1e-9)
+    return idx, np.clip(weight, 0, 1), in_range
+
+class VgsLUT(object):
+    """Inverse lookup table from bias current or gm/Id to gate-source voltage
+    on a grid of vds and vbs. The forward data is queried once with query_batch,
+    after which every lookup is a vectorized interpolation instead of a binary
+    search over db.query calls like match_vgs. Lookups off the vds/vbs grid
+    are blended bilinearly from the neighboring grid points.
+    Get these through get_vgs_lut rather than constructing them directly.
+    """
+
+    def __init__(self, db, is_nch:bool, vdd:float, vds_vec, vbs_vec, num_vgs:int=1001):
+        self.db = db
+        self.is_nch = is_nch
+        self.vdd = vdd
+        self.vds_vec = np.unique(np.asarray(vds_vec, dtype=float))
+        self.vbs_vec = np.unique(np.asarray(vbs_vec, dtype=float))
+
+        # Gate drive increases along the last axis, same range as match_vgs
+        drive_vec = np.linspace(0, vdd, num_vgs)
+        self.vgs_vec = drive_vec if is_nch else -drive_vec
+        vds, vbs, vgs = np.meshgrid(self.vds_vec, self.vbs_vec, self.vgs_vec, indexing='ij')
+        op = query_batch(db, vgs=vgs, vds=vds, vbs=vbs)
+
+        # Force each row to be monotonic so the inverse is well defined.
+        # Current is interpolated in log so weak inversion stays accurate,
+        # and gm/Id is negated so both tables increase with gate drive
+        ibias = np.maximum(op['ibias'], 1e-30)
+        log_ibias = np.maximum.accumulate(np.log(ibias), axis=-1)
+        gm_id = np.minimum.accumulate(op['gm']/ibias, axis=-1)
+        self._table_dict = {k:self._make_table(v) for k,v in (('ibias', log_ibias), ('gm_id', -gm_id))}
+
+    @staticmethod
+    def _make_table(val:np.ndarray) -> Mapping[str,np.ndarray]:
+        """Flattens a table so every row can be searched with a single
+        np.searchsorted call: each row is rescaled to [0, 1] and offset by
+        twice its row number.
+        """
+        val = val.reshape(-1, val.shape[-1])
+        num_rows = val.shape[0]
+        val_min = val[:, 0]
+        val_span = np.maximum(val[:, -1] - val_min, 1e-30)
+        key = 2*np.arange(num_rows)[:, None] + (val - val_min[:, None])/val_span[:, None]
+        return dict(key=key.ravel(), val_min=val_min, val_max=val[:, -1], val_span=val_span)
+
+    def _invert(self, name:str, target, vds, vbs) -> Tuple[np.ndarray,np.ndarray]:
+        target, vds, vbs = np.broadcast_arrays(np.asarray(target, dtype=float),
+                                               np.asarray(vds, dtype=float),
+                                               np.asarray(vbs, dtype=float))
+        table = self._table_dict[name]
+        num_vgs = len(self.vgs_vec)
+        idx_vds, w_vds, success = _get_grid_weights(self.vds_vec, vds)
+        idx_vbs, w_vbs, in_range = _get_grid_weights(self.vbs_vec, vbs)
+        success = success & in_range
+
+        vgs = np.zeros(target.shape)
+        for step_vds, weight_vds in ((0, 1-w_vds), (1, w_vds)):
+            for step_vbs, weight_vbs in ((0, 1-w_vbs), (1, w_vbs)):
+                row = (np.minimum(idx_vds+step_vds, len(self.vds_vec)-1)*len(self.vbs_vec)
+                       + np.minimum(idx_vbs+step_vbs, len(self.vbs_vec)-1))
+                val_min = table['val_min'][row]
+                success &= (target >= val_min) & (target <= table['val_max'][row])
+
+                # Bracket the target within its row and interpolate linearly
+                key = 2*row + np.clip((target - val_min)/table['val_span'][row], 0, 1)
+                idx = np.searchsorted(table['key'], key, side='left') - row*num_vgs
+                idx = np.clip(idx, 1, num_vgs-1)
+                key_lo = table['key'][row*num_vgs + idx-1]
+                key_hi = table['key'][row*num_vgs + idx]
+                frac = np.where(key_hi > key_lo, (key - key_lo)/np.maximum(key_hi - key_lo, 1e-30), 0)
+                vgs_corner = self.vgs_vec[idx-1] + frac*(self.vgs_vec[idx] - self.vgs_vec[idx-1])
+                vgs = vgs + weight_vds*weight_vbs*vgs_corner
+        return success, vgs
+
+    def get_vgs(self, itarget, vds, vbs, nf=1) -> Tuple[np.ndarray,np.ndarray]:
+        """Table version of match_vgs_vec.
+        Inputs:
+            itarget, vds, vbs, nf: Scalars or arrays, broadcast against one another.
+        Outputs:
+            success: Boolean array. False where the target current or the
+                vds/vbs point are outside the table.
+            vgs: Array of gate-source voltages.
+        """
+        ibias = np.asarray(itarget, dtype=float)/np.asarray(nf, dtype=float)
+        return self._invert('ibias', np.log(np.maximum(ibias, 1e-30)), vds, vbs)
+
+    def get_vgs_gm_id(self, gm_id, vds, vbs) -> Tuple[np.ndarray,np.ndarray]:
+        """Same as get_vgs, for a target gm/Id in 1/V.
+        """
+        return self._invert('gm_id', -np.asarray(gm_id, dtype=float), vds, vbs)
+
+# Tables shared by every design in the process
+_vgs_lut_pool = dict()
+
+def get_vgs_lut(db, is_nch:bool, vdd:float, vds_vec, vbs_vec=(0,), num_vgs:int=1001) -> VgsLUT:
+    """Returns the shared inverse lookup table for this device and grid,
+    building it on first use.
+    Inputs:
+        db: Database of the device, e.g. from get_mos_db.
+        is_nch: Boolean. True for NMOS, false otherwise.
+        vdd: Supply voltage. The table covers |vgs| from 0 to vdd.
+        vds_vec, vbs_vec: Grid of drain-source and bulk/body-source voltages.
+        num_vgs: Number of gate voltage points. The default matches the
+            resolution of match_vgs.
+    """
+    db_key = getattr(db, '_db_key', id(db))
+    key = (db_key, is_nch, vdd, tuple(np.unique(np.asarray(vds_vec, dtype=float))),
+           tuple(np.unique(np.asarray(vbs_vec, dtype=float))), num_vgs)
+    if key not in _vgs_lut_pool:
+        _vgs_lut_pool[key] = VgsLUT(db, is_nch=is_nch, vdd=vdd, vds_vec=vds_vec,
+                                    vbs_vec=vbs_vec, num_vgs=num_vgs)
+    return _vgs_lut_pool[key]
+
+def verify_vgs_lut(lut:VgsLUT, itarget, vds, vbs, nf=1) -> Mapping[str,float]:
+    """Compares VgsLUT.get_vgs against the binary search in match_vgs_vec.
+    Inputs:
+        lut: Table to check.
+        itarget, vds, vbs, nf: Same as VgsLUT.get_vgs.
+    Outputs:
+        err_dict: Dictionary with
+            num_points: Points where both found a solution
+            num_missed: Points only the binary search found a solution for
+            vgs_err_max, vgs_err_rms: Difference from the binary search vgs in volts
+            ibias_err_max: Worst relative error in the current at the table vgs
+            ibias_err_ref_max: Same for the binary search vgs, which has its own
+                vdd/1000 resolution
+    """
+    success, vgs = lut.get_vgs(itarget, vds=vds, vbs=vbs, nf=nf)
+    success_ref, vgs_ref = match_vgs_vec(lut.db, lut.is_nch, itarget, nf, vds, vbs, lut.vdd)
+    itarget, vds, vbs, nf = np.broadcast_arrays(np.asarray(itarget, dtype=float),
+                                                np.asarray(vds, dtype=float),
+                                                np.asarray(vbs, dtype=float),
+                                                np.asarray(nf, dtype=float))
+    both = success & success_ref
+    err_dict = dict(num_points=int(np.sum(both)),
+                    num_missed=int(np.sum(success_ref & ~success)))
+    if err_dict['num_points'] < 1:
+        return err_dict
+
+    vgs_err = vgs[both] - vgs_ref[both]
+    ibias = query_batch(lut.db, vgs=vgs[both], vds=vds[both], vbs=vbs[both])['ibias']*nf[both]
+    ibias_ref = query_batch(lut.db, vgs=vgs_ref[both], vds=vds[both], vbs=vbs[both])['ibias']*nf[both]
+    err_dict.update(vgs_err_max=float(np.max(np.abs(vgs_err))),
+                    vgs_err_rms=float(np.sqrt(np.mean(vgs_err**2))),
+                    ibias_err_max=float(np.max(np.abs(ibias/itarget[both] - 1))),
+                    ibias_err_ref_max=float(np.max(np.abs(ibias_ref/itarget[both] - 1))))
+    return err_dict
+
+@profiled()
 def verify_ratio(ibase_A:float, ibase_B:float,
         nf_A:int, error_tol:float) -> Tuple[bool,int]:
     """
@@ -115,6 +829,292 @@ def verify_ratio(ibase_A:float, ibase_B:float,
 
     return True, nf_B
 
+@profiled()
+def verify_ratio_vec(ibase_A, ibase_B, nf_A, error_tol:float) -> Tuple[np.ndarray,np.ndarray]:
+    """Array version of verify_ratio. ibase_A, ibase_B, and nf_A can be
+    scalars or arrays and are broadcast against one another, e.g. to check
+    every candidate finger count or every bias point at once.
+    Outputs:
+        meets_tol: Boolean array, True where the ratio is possible and
+            meets the error tolerance.
+        nf_B: Integer array of the number of fingers for device B
+            (0 where fewer than 1 finger would be needed).
+    """
+    ibase_A = np.asarray(ibase_A, dtype=float)
+    ibase_B = np.asarray(ibase_B, dtype=float)
+    nf_A = np.asarray(nf_A)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        nf_B_float = np.rint(nf_A * (ibase_A/ibase_B))
+        valid = np.isfinite(nf_B_float) & (nf_B_float >= 1)
+        nf_B = np.where(valid, nf_B_float, 0).astype(int)
+
+        # Check current mismatch given quantization
+        id_A = nf_A * ibase_A
+        id_B = nf_B * ibase_B
+        error = np.abs(id_A - id_B)/np.abs(id_A)
+
+    meets_tol = valid & (error <= error_tol)
+    return meets_tol, nf_B
+
+@profiled()
+def find_ratio_match(ibase_A:float, ibase_B:float, nf_A_vec, error_tol:float) -> Tuple[bool,int,int]:
+    """Equivalent to calling verify_ratio for each element of nf_A_vec in
+    order and stopping at the first success.
+    Outputs:
+        meets_tol: True if any element of nf_A_vec works.
+        nf_A: The first working number of fingers for device A (0 if none).
+        nf_B: The matching number of fingers for device B (0 if none).
+    """
+    nf_A_vec = np.asarray(nf_A_vec)
+    meets_tol, nf_B = verify_ratio_vec(ibase_A, ibase_B, nf_A_vec, error_tol)
+    idx_match = np.flatnonzero(meets_tol)
+    if len(idx_match) < 1:
+        return False, 0, 0
+    return True, int(nf_A_vec[idx_match[0]]), int(nf_B[idx_match[0]])
+
+def enumerate_ratio_pairs(ibase_A:float, ibase_B:float, error_tol:float,
+        nf_A_max:int, nf_A_min:int=1) -> Tuple[np.ndarray,np.ndarray]:
+    """Finds every finger count of device A (from nf_A_min up to but not
+    including nf_A_max, like np.arange) for which verify_ratio succeeds.
+    Inputs:
+        ibase_A/B: The drain current of a single A- or B-device.
+        error_tol: Fractional tolerance for the current error.
+        nf_A_max, nf_A_min: Range of finger counts for device A.
+    Outputs:
+        nf_A: Integer array of admissible finger counts for device A, increasing.
+        nf_B: Integer array of the matching finger counts for device B.
+    """
+    nf_A = np.arange(max(1, nf_A_min), max(1, nf_A_max), dtype=int)
+    meets_tol, nf_B = verify_ratio_vec(ibase_A, ibase_B, nf_A, error_tol)
+    return nf_A[meets_tol], nf_B[meets_tol]
+
+def get_crossings(t_vec, sig_vec, threshold:float) -> Tuple[np.ndarray,np.ndarray]:
+    """Finds every time a waveform crosses a threshold, linearly interpolating
+    between samples.
+    Inputs:
+        t_vec: Sample times, e.g. results['time'] from load_sim_results.
+        sig_vec: Signal value at each time.
+        threshold: Signal value which counts as an edge.
+    Outputs:
+        t_cross: Crossing times, in order.
+        rising: Boolean array, True where the crossing is a rising edge.
+            Rising and falling edges alternate.
+    """
+    t_vec = np.asarray(t_vec, dtype=float)
+    sig_vec = np.asarray(sig_vec, dtype=float) - threshold
+    if np.any(t_vec[1:] < t_vec[:-1]):
+        order = np.argsort(t_vec, kind='stable')
+        t_vec, sig_vec = t_vec[order], sig_vec[order]
+
+    below = np.signbit(sig_vec)
+    cross_idx = np.flatnonzero(below[1:] != below[:-1])
+    val_start = sig_vec[cross_idx]
+    val_stop = sig_vec[cross_idx+1]
+
+    # Only equal for -0 and +0, i.e. exactly on the threshold
+    val_diff = val_start - val_stop
+    frac = np.divide(val_start, val_diff, out=np.zeros_like(val_start), where=val_diff!=0)
+    t_start = t_vec[cross_idx]
+    t_cross = t_start + frac * (t_vec[cross_idx+1] - t_start)
+    return t_cross, below[cross_idx]
+
+def _get_pulse_edges(t_vec, sig_vec, threshold:float, posedge:bool) -> Tuple[np.ndarray,np.ndarray]:
+    """Returns the start and end times of pulses. There's one more start
+    than end if the waveform finishes mid-pulse.
+    """
+    t_cross, rising = get_crossings(t_vec, sig_vec, threshold)
+    # Skip an end edge before the first pulse starts
+    if len(t_cross) > 0 and rising[0] != posedge:
+        t_cross = t_cross[1:]
+    return t_cross[0::2], t_cross[1::2]
+
+def get_pulse_widths(t_vec, sig_vec, threshold:float, posedge:bool=True) -> np.ndarray:
+    """
+    Inputs:
+        t_vec: Sample times.
+        sig_vec: Signal value at each time.
+        threshold: Signal value which counts as an edge.
+        posedge: True if a rising edge starts a pulse, False if pulses
+            are active low.
+    Outputs:
+        Widths of every complete pulse, in the order they appear.
+    """
+    t_start, t_end = _get_pulse_edges(t_vec, sig_vec, threshold, posedge)
+    return t_end - t_start[:len(t_end)]
+
+def get_periods(t_vec, sig_vec, threshold:float, posedge:bool=True) -> np.ndarray:
+    """Returns the time between consecutive rising (posedge) or falling edges.
+    """
+    t_cross, rising = get_crossings(t_vec, sig_vec, threshold)
+    return np.diff(t_cross[rising == posedge])
+
+def get_duty_cycles(t_vec, sig_vec, threshold:float, posedge:bool=True) -> np.ndarray:
+    """Returns pulse width over period for every complete period, where a
+    period runs from the start of one pulse to the start of the next.
+    """
+    t_start, t_end = _get_pulse_edges(t_vec, sig_vec, threshold, posedge)
+    num_periods = min(len(t_end), len(t_start)-1)
+    if num_periods < 1:
+        return np.zeros(0)
+    t_start_next = t_start[1:num_periods+1]
+    t_start = t_start[:num_periods]
+    return (t_end[:num_periods] - t_start) / (t_start_next - t_start)
+
+# Monte Carlo pulse measurements, one record per pulse. A run without any
+# pulses has one record with pulse -1 and a NaN width, so it isn't lost.
+mc_record_dtype = np.dtype([('code', '<i4'), ('seed', '<i8'), ('pulse', '<i4'), ('width', '<f8')])
+
+def make_mc_records(code:int, seed_list:List[int], widths_list:List[List[float]]) -> np.ndarray:
+    """
+    Inputs:
+        code: Digital code the runs were for.
+        seed_list: Monte Carlo seed (idx_run) of each run.
+        widths_list: Pulse widths of each run.
+    Outputs:
+        Structured array of mc_record_dtype.
+    """
+    num_pulses = np.array([max(1, len(w)) for w in widths_list], dtype=int)
+    records = np.zeros(int(np.sum(num_pulses)), dtype=mc_record_dtype)
+    records['code'] = code
+    records['seed'] = np.repeat(np.asarray(seed_list, dtype=int), num_pulses)
+    # Pulse index within each run
+    run_start = np.cumsum(num_pulses) - num_pulses
+    records['pulse'] = np.arange(len(records)) - np.repeat(run_start, num_pulses)
+    records['width'] = np.nan
+    for start, widths in zip(run_start, widths_list):
+        if len(widths) < 1:
+            records['pulse'][start] = -1
+        else:
+            records['width'][start:start+len(widths)] = widths
+    return records
+
+def append_mc_records(fname:str, records:np.ndarray) -> None:
+    """Appends records to a raw binary file, see load_mc_records.
+    """
+    with open(fname, 'ab') as f:
+        np.asarray(records, dtype=mc_record_dtype).tofile(f)
+
+def load_mc_records(fname:str) -> np.ndarray:
+    """Maps a file from append_mc_records into memory (read-only) without
+    parsing it.
+    """
+    if os.path.getsize(fname) < mc_record_dtype.itemsize:
+        return np.zeros(0, dtype=mc_record_dtype)
+    return np.memmap(fname, dtype=mc_record_dtype, mode='r')
+
+def split_mc_records(records:np.ndarray) -> Mapping[int,np.ndarray]:
+    """Returns {code : records for that code}, each sorted by seed then pulse.
+    """
+    order = np.lexsort((records['pulse'], records['seed'], records['code']))
+    records = np.asarray(records[order])
+    codes, code_start = np.unique(records['code'], return_index=True)
+    return {int(c):r for c, r in zip(codes, np.split(records, code_start[1:]))}
+
+class RunningStats(object):
+    """Mean, variance, min, and max of a stream of values, without keeping
+    them (Welford's algorithm, with Chan's update for batches). NaNs are
+    ignored. Stats from different workers combine with merge.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0 # Sum of squared differences from the mean
+        self.min = np.inf
+        self.max = -np.inf
+
+    def add(self, val) -> None:
+        val = np.asarray(val, dtype=float).ravel()
+        val = val[~np.isnan(val)]
+        if len(val) < 1:
+            return
+        batch = RunningStats()
+        batch.count = len(val)
+        batch.mean = float(np.mean(val))
+        batch.m2 = float(np.sum((val - batch.mean)**2))
+        batch.min = float(np.min(val))
+        batch.max = float(np.max(val))
+        self.merge(batch)
+
+    def merge(self, other:'RunningStats') -> None:
+        if other.count < 1:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * other.count / count
+        self.m2 = self.m2 + other.m2 + delta**2 * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    @property
+    def std(self) -> float:
+        """Sample standard deviation.
+        """
+        return np.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else np.nan
+
+    def ci_halfwidth(self, z:float=1.96) -> float:
+        """Half-width of the normal-approximation confidence interval on
+        the mean, z standard errors (1.96 for 95%).
+        """
+        return z * self.std / np.sqrt(self.count) if self.count > 1 else np.inf
+
+class QuantileSketch(object):
+    """Approximate quantiles of a stream of values in bounded memory. Values
+    are counted in logarithmically spaced bins (as in DDSketch), so every
+    quantile is within rel_acc of the true value's magnitude. Sketches with
+    the same rel_acc combine exactly with merge. NaNs are ignored.
+    """
+
+    def __init__(self, rel_acc:float=0.01):
+        self.rel_acc = rel_acc
+        self.gamma = (1 + rel_acc) / (1 - rel_acc)
+        self.count = 0
+        self.zero_count = 0
+        self.pos_bins = dict() # {bin index : count}, bin k is (gamma^(k-1), gamma^k]
+        self.neg_bins = dict() # Same, by magnitude
+
+    def _add_bins(self, bins:Mapping[int,int], mag:np.ndarray) -> None:
+        bin_idx = np.ceil(np.log(mag) / np.log(self.gamma)).astype(int)
+        for k, num in zip(*np.unique(bin_idx, return_counts=True)):
+            bins[int(k)] = bins.get(int(k), 0) + int(num)
+
+    def add(self, val) -> None:
+        val = np.asarray(val, dtype=float).ravel()
+        val = val[~np.isnan(val)]
+        self.count += len(val)
+        self.zero_count += int(np.sum(val == 0))
+        self._add_bins(self.pos_bins, val[val > 0])
+        self._add_bins(self.neg_bins, -val[val < 0])
+
+    def merge(self, other:'QuantileSketch') -> None:
+        assert other.rel_acc == self.rel_acc, f'Can only merge sketches with the same accuracy ({other.rel_acc} vs. {self.rel_acc})'
+        self.count += other.count
+        self.zero_count += other.zero_count
+        for bins, other_bins in ((self.pos_bins, other.pos_bins), (self.neg_bins, other.neg_bins)):
+            for k, num in other_bins.items():
+                bins[k] = bins.get(k, 0) + num
+
+    def quantile(self, q:float) -> float:
+        """Returns the q (between 0 and 1) quantile, NaN if nothing was added.
+        """
+        if self.count < 1:
+            return np.nan
+        # Bins from the most negative value up
+        bin_val = lambda k: 2 * self.gamma**k / (self.gamma + 1)
+        bin_list = [(-bin_val(k), num) for k, num in sorted(self.neg_bins.items(), reverse=True)]
+        bin_list.append((0.0, self.zero_count))
+        bin_list.extend((bin_val(k), num) for k, num in sorted(self.pos_bins.items()))
+
+        rank = q * (self.count - 1)
+        num_below = 0
+        for val, num in bin_list:
+            num_below += num
+            if num_below > rank:
+                return val
+        return bin_list[-1][0]
+
 def parallel(*args):
     if 0 in args:
         return 0
@@ -139,13 +1139,755 @@ def num_den_add(num1, num2, den1, den2):
 
     return num_new, den_new
 
+class SmallSignalBatch(object):
+    """Drop-in for LTICircuit when building many circuits with the same
+    topology, e.g. one per candidate in a sweep. Element values can be
+    scalars or arrays (one entry per circuit), so transistors take
+    query_batch output and arrays of finger counts directly.
+
+    Instead of forming transfer functions, the nodal equations
+    (G + jwC)v = 0 are solved numerically for the whole batch at once.
+    """
+
+    def __init__(self):
+        self._node_list = []
+        self._stamp_list = []
+
+    def _add_stamp(self, kind:str, val, p_name:str, n_name:str, cp_name:str, cn_name:str) -> None:
+        for name in (p_name, n_name, cp_name, cn_name):
+            if name != 'gnd' and name not in self._node_list:
+                self._node_list.append(name)
+        self._stamp_list.append((kind, np.asarray(val, dtype=float), p_name, n_name, cp_name, cn_name))
+
+    def add_vccs(self, gm, p_name:str, n_name:str, cp_name:str, cn_name:str='gnd') -> None:
+        """Current gm*(v(cp)-v(cn)) flows from p through the element to n.
+        """
+        self._add_stamp('g', gm, p_name, n_name, cp_name, cn_name)
+
+    def add_conductance(self, g, p_name:str, n_name:str) -> None:
+        self._add_stamp('g', g, p_name, n_name, p_name, n_name)
+
+    def add_res(self, res, p_name:str, n_name:str) -> None:
+        self.add_conductance(1/np.asarray(res, dtype=float), p_name, n_name)
+
+    def add_cap(self, cap, p_name:str, n_name:str) -> None:
+        self._add_stamp('c', cap, p_name, n_name, p_name, n_name)
+
+    def add_transistor(self, tran_info:Mapping[str,Any], d_name:str, g_name:str, s_name:str,
+                       b_name:str='gnd', fg=1, neg_cap:bool=True) -> None:
+        """Same small-signal model as LTICircuit.add_transistor.
+        """
+        fg = np.asarray(fg, dtype=float)
+        self.add_vccs(np.asarray(tran_info['gm'])*fg, d_name, s_name, g_name, s_name)
+        self.add_vccs(np.asarray(tran_info['gb'])*fg, d_name, s_name, b_name, s_name)
+        self.add_conductance(np.asarray(tran_info['gds'])*fg, d_name, s_name)
+
+        cap_conn_list = [('cgd', g_name, d_name),
+                         ('cgs', g_name, s_name),
+                         ('cgb', g_name, b_name),
+                         ('cds', d_name, s_name),
+                         ('cdb', d_name, b_name),
+                         ('csb', s_name, b_name)]
+        for cap_name, p_name, n_name in cap_conn_list:
+            cap = np.asarray(tran_info[cap_name])*fg
+            if not neg_cap:
+                cap = np.maximum(cap, 0)
+            self.add_cap(cap, p_name, n_name)
+
+    def _get_matrices(self, in_list:List[str]) -> Tuple[np.ndarray,np.ndarray,Tuple[int,...],List[str]]:
+        """Stamps the conductance and capacitance matrices. Driven nodes
+        (in_list) go last so they can be partitioned out.
+        """
+        node_list = [n for n in self._node_list if n not in in_list] + list(in_list)
+        node_idx = {n:i for i, n in enumerate(node_list)}
+        shape = np.broadcast_shapes(*(s[1].shape for s in self._stamp_list))
+        num_batch = int(np.prod(shape))
+
+        G = np.zeros((num_batch, len(node_list), len(node_list)))
+        C = np.zeros((num_batch, len(node_list), len(node_list)))
+        for kind, val, p_name, n_name, cp_name, cn_name in self._stamp_list:
+            mat = G if kind=='g' else C
+            val = np.broadcast_to(val, shape).reshape(-1)
+            for row, sgn_row in ((p_name, 1), (n_name, -1)):
+                if row == 'gnd':
+                    continue
+                for col, sgn_col in ((cp_name, 1), (cn_name, -1)):
+                    if col == 'gnd':
+                        continue
+                    mat[:, node_idx[row], node_idx[col]] += sgn_row*sgn_col*val
+        return G, C, shape, node_list
+
+    @profiled()
+    def get_specs(self, in_dict:Mapping[str,float], out_name:str, f_min:float=1.0,
+                  f_max:float=1e12, pts_per_dec:int=10, num_iter:int=30) -> Tuple[np.ndarray,np.ndarray,np.ndarray,np.ndarray]:
+        """Computes the figures of merit of every circuit in the batch.
+        Inputs:
+            in_dict: {Driven node name : weight}. Driven nodes are ideal voltage
+                sources, e.g. {'inp' : 0.5, 'inn' : -0.5} for a differential input.
+            out_name: Output node name.
+            f_min, f_max: Frequency range (Hz) to look for crossings in.
+            pts_per_dec: Points per decade of the grid used to bracket crossings.
+            num_iter: Number of bisection steps used to refine each crossing.
+        Outputs:
+            gain: DC gain in V/V.
+            fbw: 3dB frequency in Hz, 0 if not found.
+            ugf: Unity gain frequency in Hz, 0 if not found.
+            pm: Phase margin in degrees, with the phase taken relative to
+                the sign of the DC gain. inf if the gain never crosses 1.
+        """
+        in_list = list(in_dict.keys())
+        G, C, shape, node_list = self._get_matrices(in_list)
+        num_free = len(node_list) - len(in_list)
+        out_idx = node_list.index(out_name)
+        vin = np.array([in_dict[k] for k in in_list], dtype=float)
+
+        def get_tf(f):
+            # f is (num_batch,) or (num_batch, num_freq)
+            f = np.asarray(f, dtype=float)
+            f_exp = f.reshape(f.shape + (1, 1))
+            G_exp = G.reshape((G.shape[0],) + (1,)*(f.ndim-1) + G.shape[1:])
+            C_exp = C.reshape((C.shape[0],) + (1,)*(f.ndim-1) + C.shape[1:])
+            Y = G_exp + 2j*np.pi*f_exp*C_exp
+            rhs = -Y[..., :num_free, num_free:] @ vin
+            v = np.linalg.solve(Y[..., :num_free, :num_free], rhs[..., None])[..., 0]
+            return v[..., out_idx]
+
+        num_batch = G.shape[0]
+        H0 = get_tf(np.zeros(num_batch)).real
+        gain = H0
+
+        num_pts = int(np.ceil(np.log10(f_max/f_min)*pts_per_dec)) + 1
+        f_grid = np.logspace(np.log10(f_min), np.log10(f_max), num_pts)
+        H_grid = get_tf(np.broadcast_to(f_grid, (num_batch, num_pts)))
+        mag_grid = np.abs(H_grid)
+
+        def find_crossing(target):
+            # Bisect in log frequency on the first grid interval where |H|
+            # drops to target
+            below = mag_grid <= target[:, None]
+            found = below.any(axis=1)
+            idx_hi = np.argmax(below, axis=1)
+            lo = np.log10(f_grid[np.maximum(idx_hi-1, 0)])
+            hi = np.log10(f_grid[idx_hi])
+            for _ in range(num_iter):
+                mid = (lo+hi)/2
+                above = np.abs(get_tf(10**mid)) > target
+                lo = np.where(above, mid, lo)
+                hi = np.where(above, hi, mid)
+            return found, idx_hi, 10**((lo+hi)/2)
+
+        found_3db, _, f_3db = find_crossing(np.abs(H0)/np.sqrt(2))
+        fbw = np.where(found_3db, f_3db, 0)
+
+        found_ugf, idx_ugf, f_ugf = find_crossing(np.ones(num_batch))
+        found_ugf = found_ugf & (np.abs(H0) > 1)
+        ugf = np.where(found_ugf, f_ugf, 0)
+
+        # Unwrapped phase relative to DC, continued from the last grid point
+        # before the crossing
+        sgn = np.where(H0 < 0, -1, 1)
+        phase_grid = np.unwrap(np.angle(np.concatenate((H0[:, None], H_grid), axis=1)*sgn[:, None]), axis=1)
+        idx_prev = idx_ugf
+        phase_prev = phase_grid[np.arange(num_batch), idx_prev]
+        H_prev = np.where(idx_prev > 0, H_grid[np.arange(num_batch), np.maximum(idx_prev-1, 0)], H0)
+        dphase = np.angle(get_tf(f_ugf)/H_prev)
+        pm = np.where(found_ugf, 180 + np.degrees(phase_prev + dphase), np.inf)
+
+        return tuple(x.reshape(shape) for x in (gain, fbw, ugf, pm))
+
+@profiled()
+def verify_ss(ss_ref:Tuple[float,float,float,float], ss_batch:Tuple[float,float,float,float],
+              rtol:float=1e-3, pm_atol:float=0.5) -> bool:
+    """Compares (gain, fbw, ugf, pm) from SmallSignalBatch against the
+    LTICircuit values and warns if they disagree.
+    Inputs:
+        ss_ref: (gain, fbw, ugf, pm) from the LTICircuit path.
+        ss_batch: (gain, fbw, ugf, pm) from SmallSignalBatch.
+        rtol: Relative tolerance on gain, fbw, and ugf.
+        pm_atol: Absolute tolerance on phase margin, in degrees.
+    Outputs:
+        Returns True if everything agrees to within tolerance.
+    """
+    gain_ref, fbw_ref, ugf_ref, pm_ref = (float(x) for x in ss_ref)
+    gain, fbw, ugf, pm = (float(x) for x in ss_batch)
+    match = np.allclose([gain, fbw, ugf], [gain_ref, fbw_ref, ugf_ref], rtol=rtol, atol=0)
+    # No unity gain crossing shows up as inf or NaN depending on the path
+    if np.isfinite(pm) or np.isfinite(pm_ref):
+        match = match and abs(pm - pm_ref) <= pm_atol
+    if not match:
+        warnings.warn(f'Small-signal mismatch: (gain, fbw, ugf, pm) {ss_batch} vs. LTICircuit {ss_ref}')
+    return match
+
+# Implemented testbenches which aren't being simulated, keyed on
+# (tb_lib, tb_cell, impl_lib, hash of the testbench topology), i.e. the
+# schematic parameters other than device sizes (see tb_sizing_keys).
+# Entries are {tb_obj, tb_gen_name, sizing hash}. Candidates with the same
+# topology reuse a testbench's cell and ADE state and only regenerate the
+# schematic if their sizes differ.
+_tb_pool = dict()
+_tb_pool_leased = dict() # {id(tb_obj) : (key, entry)}
+_tb_pool_stats = dict(hits=0, misses=0, resized=0)
+
+# Schematic parameters (at any depth) which only size devices
+tb_sizing_keys = ('seg_dict', 'seg_list', 'nf', 'nf_dict', 'device_mult',
+                  'w', 'w_dict', 'w_list', 'l', 'lch_dict', 'lch_list')
+
+def clear_tb_pool() -> None:
+    _tb_pool.clear()
+    _tb_pool_leased.clear()
+    _tb_pool_stats.update(hits=0, misses=0, resized=0)
+
+def get_tb_pool_stats() -> Mapping[str,int]:
+    """hits counts reused testbenches, of which resized had their schematic
+    regenerated with new device sizes. misses counts new testbenches.
+    """
+    return dict(_tb_pool_stats)
+
+def _split_tb_params(val) -> Tuple[Any,Any]:
+    """Splits schematic parameters into (topology, sizing), both in the form
+    of _normalize_params.
+    """
+    if isinstance(val, Mapping):
+        topo, sizing = [], []
+        for k in sorted(val.keys(), key=str):
+            if k in tb_sizing_keys:
+                sizing.append([str(k), _normalize_params(val[k])])
+            else:
+                topo_k, sizing_k = _split_tb_params(val[k])
+                topo.append([str(k), topo_k])
+                if sizing_k:
+                    sizing.append([str(k), sizing_k])
+        return topo, sizing
+    if isinstance(val, (list, tuple)):
+        topo_sizing = [_split_tb_params(v) for v in val]
+        sizing = [v[1] for v in topo_sizing]
+        return [v[0] for v in topo_sizing], (sizing if any(sizing) else [])
+    return _normalize_params(val), []
+
+def _hash_params(val) -> str:
+    return hashlib.sha256(json.dumps(val).encode()).hexdigest()
+
+def prepare_testbench(prj, tb_lib:str, tb_cell:str, impl_lib:str, tb_gen_name:str,
+        params:Mapping[str,Any], tb_vars:Mapping[str,Any], reuse:bool=True):
+    """Gets a testbench with its variables set, ready to simulate. Unless
+    reuse is False, an already-implemented testbench with the same topology
+    is used if one isn't in use (see release_testbench). If its device sizes
+    differ, its schematic is regenerated in place, but the cell and its ADE
+    state are kept.
+    Inputs:
+        prj: BagProject
+        tb_lib: The template testbench library.
+        tb_cell: The template testbench cell.
+        impl_lib: The implemented testbench library.
+        tb_gen_name: The generated testbench name, if a new one is needed.
+        params: Schematic parameters of the testbench.
+        tb_vars: Testbench variables to set in ADE testbench
+        reuse: False to always generate a new testbench.
+    Outputs:
+        tb_obj: The configured testbench. Give it to release_testbench
+            once it's done simulating.
+    """
+    topo, sizing = _split_tb_params(params)
+    key = (tb_lib, tb_cell, impl_lib, _hash_params(topo))
+    sizing_hash = _hash_params(sizing)
+
+    idle_list = _tb_pool.get(key, [])
+    if reuse and len(idle_list) > 0:
+        _tb_pool_stats['hits'] += 1
+        # Prefer one which doesn't need resizing
+        idx = next((i for i, e in enumerate(idle_list) if e['sizing_hash'] == sizing_hash), -1)
+        entry = idle_list.pop(idx)
+        tb_obj = entry['tb_obj']
+        if entry['sizing_hash'] != sizing_hash:
+            _tb_pool_stats['resized'] += 1
+            # Regenerate testbench schematic over the existing cell
+            tb_dsn = prj.create_design_module(tb_lib, tb_cell)
+            tb_dsn.design(**params)
+            tb_dsn.implement_design(impl_lib, top_cell_name=entry['tb_gen_name'])
+            entry['sizing_hash'] = sizing_hash
+    else:
+        _tb_pool_stats['misses'] += 1
+        # Generate testbench schematic
+        tb_dsn = prj.create_design_module(tb_lib, tb_cell)
+        tb_dsn.design(**params)
+        tb_dsn.implement_design(impl_lib, top_cell_name=tb_gen_name)
+
+        # Copy and load ADEXL state of generated testbench
+        tb_obj = prj.configure_testbench(impl_lib, tb_gen_name)
+        entry = dict(tb_obj=tb_obj, tb_gen_name=tb_gen_name, sizing_hash=sizing_hash)
+    _tb_pool_leased[id(tb_obj)] = (key, entry)
+
+    # Assign testbench design variables (the ones that show in ADE)
+    for param_name, param_val in tb_vars.items():
+        tb_obj.set_parameter(param_name, param_val)
+
+    # Update testbench changes
+    tb_obj.update_testbench()
+    return tb_obj
+
+def release_testbench(tb_obj) -> None:
+    """Makes a testbench from prepare_testbench available for reuse.
+    """
+    key_entry = _tb_pool_leased.pop(id(tb_obj), None)
+    if key_entry != None:
+        key, entry = key_entry
+        _tb_pool.setdefault(key, []).append(entry)
+
+# One lock per BagProject, held around blocking run_simulation calls
+_prj_sim_locks = dict() # {id(prj) : threading.Lock}
+
+class BagSimBackend(object):
+    """Runs testbenches for VerificationQueue through BAG.
+    Inputs:
+        prj: BagProject, created on first use if None.
+        thread_safe: True if the project's blocking run_simulation can be
+            called from several threads at once. Otherwise (the default),
+            versions of BAG without async_run_simulation only run one
+            simulation at a time per project, whatever max_concurrent is.
+    """
+
+    def __init__(self, prj=None, thread_safe:bool=False):
+        self._prj = prj
+        self.thread_safe = thread_safe
+
+    def get_prj(self):
+        if self._prj == None:
+            from bag.core import BagProject
+            self._prj = BagProject()
+        return self._prj
+
+    def prepare(self, tb_spec:Mapping[str,Any]):
+        """tb_spec has the inputs of prepare_testbench other than prj.
+        """
+        return prepare_testbench(self.get_prj(), **tb_spec)
+
+    async def simulate(self, tb_obj, **sim_kwargs) -> str:
+        # Not every version of BAG has asynchronous simulation
+        if hasattr(tb_obj, 'async_run_simulation'):
+            return await tb_obj.async_run_simulation(**sim_kwargs)
+        run_fn = functools.partial(tb_obj.run_simulation, **sim_kwargs)
+        if not self.thread_safe:
+            run_fn = functools.partial(self._run_locked, _prj_sim_locks.setdefault(id(self.get_prj()), threading.Lock()), run_fn)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, run_fn)
+
+    @staticmethod
+    def _run_locked(lock, run_fn):
+        with lock:
+            return run_fn()
+
+    def release(self, tb_obj) -> None:
+        release_testbench(tb_obj)
+
+    def load_results(self, save_dir:str) -> Mapping[str,Any]:
+        return load_sim_results(save_dir)
+
+class FakeSimBackend(object):
+    """Stands in for BagSimBackend to run VerificationQueue without a
+    simulator, e.g. for testing offline.
+    Inputs:
+        result_fn: Function of the tb_spec (plus any simulation arguments, e.g.
+            sim_info) returning simulation results, i.e. what
+            load_sim_results would give.
+        delay: Seconds each simulation takes.
+    """
+
+    def __init__(self, result_fn, delay:float=0):
+        self.result_fn = result_fn
+        self.delay = delay
+        self.num_sims = 0
+        self.num_running = 0
+        self.max_running = 0 # Most simulations that ran at once
+        self.num_leased = 0 # Prepared testbenches not released yet
+
+    def prepare(self, tb_spec:Mapping[str,Any]):
+        self.num_leased += 1
+        return tb_spec
+
+    async def simulate(self, tb_obj, **sim_kwargs):
+        self.num_sims += 1
+        self.num_running += 1
+        self.max_running = max(self.max_running, self.num_running)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.num_running -= 1
+        # result_fn sees e.g. the Monte Carlo run as well
+        return dict(tb_obj, **sim_kwargs) if len(sim_kwargs) > 0 else tb_obj
+
+    def release(self, tb_obj) -> None:
+        self.num_leased -= 1
+
+    def load_results(self, save_dir) -> Mapping[str,Any]:
+        return self.result_fn(save_dir)
+
+class VerificationQueue(object):
+    """Runs testbench simulations concurrently. Testbenches are generated one
+    at a time (schematic generation isn't safe to run in parallel), but up to
+    max_concurrent simulations run at once. Results come back as simulations
+    finish, and more jobs can be submitted while iterating over them.
+    Inputs:
+        backend: BagSimBackend (default) or FakeSimBackend.
+        max_concurrent: Maximum number of simulations running at once.
+    """
+
+    def __init__(self, backend=None, max_concurrent:int=1):
+        self.backend = BagSimBackend() if backend == None else backend
+        self.max_concurrent = max_concurrent
+        self._jobs = []
+        self._cancel_list = [] # Functions of the tag, True to skip the job
+
+    def __len__(self) -> int:
+        return len(self._jobs)
+
+    def submit(self, tag, tb_spec:Mapping[str,Any], measure,
+            sim_kwargs:Mapping[str,Any]=None) -> None:
+        """
+        Inputs:
+            tag: Returned with the result to identify the job.
+            tb_spec: Inputs of prepare_testbench other than prj.
+            measure: Function of the loaded simulation results giving the
+                result, e.g. the simulated figures of merit.
+            sim_kwargs: Arguments for run_simulation, e.g. for Monte Carlo.
+        """
+        self._jobs.append((tag, tb_spec, measure, dict() if sim_kwargs == None else sim_kwargs))
+
+    def cancel(self, match) -> None:
+        """Skips jobs whose tag match(tag) is True, unless they've already
+        started simulating.
+        """
+        self._cancel_list.append(match)
+        self._jobs = [job for job in self._jobs if not match(job[0])]
+
+    async def _run_job(self, sim_sem, tag, tb_spec:Mapping[str,Any], measure,
+            sim_kwargs:Mapping[str,Any]):
+        tb_obj = None
+        try:
+            async with sim_sem:
+                if any(match(tag) for match in self._cancel_list):
+                    return None
+                # Synchronous, so only one testbench is generated at a time
+                with profile_timer('sim.prepare'):
+                    tb_obj = self.backend.prepare(tb_spec)
+                logger.info('Simulating testbench %s', tb_spec.get('tb_gen_name', tag))
+                # Wall time of each simulation, so overlapping ones add up
+                with profile_timer('sim.simulate'):
+                    save_dir = await self.backend.simulate(tb_obj, **sim_kwargs)
+            with profile_timer('sim.load_results'):
+                results = self.backend.load_results(save_dir)
+        finally:
+            # Also on errors and cancellation, so pooled testbenches aren't
+            # leaked. Reused testbenches may write to the same results
+            # directory, so not before the results are loaded.
+            if tb_obj != None:
+                self.backend.release(tb_obj)
+        return tag, measure(results)
+
+    async def iter_results(self):
+        """Asynchronous generator of (tag, result) as simulations finish.
+        """
+        sim_sem = asyncio.Semaphore(self.max_concurrent)
+        pending = set()
+        try:
+            while len(self._jobs) > 0 or len(pending) > 0:
+                while len(self._jobs) > 0:
+                    pending.add(asyncio.ensure_future(self._run_job(sim_sem, *self._jobs.pop(0))))
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    result = task.result()
+                    if result != None:
+                        yield result
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    def run(self) -> Iterator[Tuple[Any,Any]]:
+        """Synchronous version of iter_results, for use outside of asyncio.
+        """
+        loop = asyncio.new_event_loop()
+        result_iter = self.iter_results()
+        try:
+            while True:
+                try:
+                    yield loop.run_until_complete(result_iter.__anext__())
+                except StopAsyncIteration:
+                    break
+        finally:
+            loop.run_until_complete(result_iter.aclose())
+            loop.close()
+
+def _meet_spec_chunk(dsn_cls, chunk:Tuple[int,int], params:Mapping[str,Any],
+                     sweep_windows:Mapping[str,Tuple[np.ndarray,float]]=None,
+                     profile:bool=False):
+    """Runs meet_spec for one chunk of the outermost sweep. Lives at the module
+    level so it can be sent to worker processes.
+    """
+    dsn_mod = dsn_cls()
+    dsn_mod.sweep_chunk = chunk
+    dsn_mod.sweep_windows = dict() if sweep_windows == None else sweep_windows
+    # Workers may be reused across chunks, so only this chunk is returned
+    set_profile_enabled(profile)
+    clear_profile()
+    viable_op_list = dsn_mod.meet_spec(**params)
+    return viable_op_list, dsn_mod.other_params, dsn_mod.prune_stats, get_profile(), dsn_mod.reject_stats
+
+class CandidateTable(object):
+    """Columnar storage for viable operating points. Numeric fields are stored
+    in typed NumPy arrays and anything else (e.g. operating point dicts) in
+    object arrays, so each field costs one array rather than one dict entry
+    per candidate. Rows read back as dicts, so a table can be used anywhere a
+    list of viable operating points is expected.
+    """
+
+    def __init__(self, rows:Iterable[Mapping[str,Any]]=None):
+        self._cols = dict() # Column name -> array (with spare capacity)
+        self._len = 0
+        if rows != None:
+            self.extend(rows)
+
+    @staticmethod
+    def _get_dtype(val):
+        if isinstance(val, (bool, np.bool_)):
+            return np.bool_
+        if isinstance(val, (int, np.integer)):
+            return np.int64
+        if isinstance(val, (float, np.floating)):
+            return np.float64
+        return object
+
+    @staticmethod
+    def _get_gap_dtype(dtype):
+        """Promotes a column dtype so it can hold missing values: NaN for
+        numeric columns and None for everything else.
+        """
+        if dtype == np.bool_ or dtype == object:
+            return np.dtype(object)
+        return np.result_type(dtype, np.float64)
+
+    @classmethod
+    def _gap_col(cls, num:int, dtype) -> np.ndarray:
+        dtype = cls._get_gap_dtype(dtype)
+        return np.full(num, np.nan if dtype != object else None, dtype=dtype)
+
+    def _capacity(self) -> int:
+        return len(next(iter(self._cols.values()))) if self._cols else 0
+
+    def _fill_gap(self, name:str, idx:int) -> None:
+        col = self._cols[name]
+        gap_dtype = self._get_gap_dtype(col.dtype)
+        if col.dtype != gap_dtype:
+            # e.g. an integer column which doesn't have a value for every row
+            col = col.astype(gap_dtype)
+            self._cols[name] = col
+        col[idx] = np.nan if gap_dtype != object else None
+
+    def _set(self, name:str, idx:int, val) -> None:
+        col = self._cols.get(name, None)
+        if col is None:
+            dtype = self._get_dtype(val)
+            if idx == 0:
+                col = np.empty(max(self._capacity(), 1), dtype=dtype)
+            else:
+                # Earlier rows don't have this field
+                col = self._gap_col(max(self._capacity(), idx+1), dtype)
+            self._cols[name] = col
+        elif col.dtype != object and np.result_type(col.dtype, self._get_dtype(val)) != col.dtype:
+            # e.g. an integer column receiving a float
+            col = col.astype(np.result_type(col.dtype, self._get_dtype(val)))
+            self._cols[name] = col
+        col[idx] = val
+
+    def append(self, row:Mapping[str,Any]) -> None:
+        capacity = self._capacity()
+        if self._len >= capacity:
+            new_capacity = max(64, 2*capacity)
+            for name, col in self._cols.items():
+                new_col = np.empty(new_capacity, dtype=col.dtype)
+                new_col[:self._len] = col[:self._len]
+                self._cols[name] = new_col
+        for name, val in row.items():
+            self._set(name, self._len, val)
+        for name in self._cols.keys():
+            if name not in row:
+                self._fill_gap(name, self._len)
+        self._len += 1
+
+    def extend(self, rows:Iterable[Mapping[str,Any]]) -> None:
+        if isinstance(rows, CandidateTable):
+            if self._len == 0 and not self._cols:
+                self._cols = {k:v.copy() for k, v in rows._cols.items()}
+                self._len = rows._len
+                return
+            if len(rows) > 0:
+                # Fields missing from either table are filled as gaps
+                names = self.columns + [k for k in rows.columns if k not in self._cols]
+                cols = dict()
+                for k in names:
+                    col_a = self.column(k) if k in self._cols else None
+                    col_b = rows.column(k) if k in rows._cols else None
+                    if col_a is None:
+                        col_a = self._gap_col(self._len, col_b.dtype)
+                    elif col_b is None:
+                        col_b = self._gap_col(len(rows), col_a.dtype)
+                    if (col_a.dtype == object) != (col_b.dtype == object):
+                        col_a, col_b = col_a.astype(object), col_b.astype(object)
+                    cols[k] = np.concatenate((col_a, col_b))
+                self._cols = cols
+                self._len += len(rows)
+            return
+        for row in rows:
+            self.append(row)
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __iter__(self) -> Iterator[Mapping[str,Any]]:
+        for idx in range(self._len):
+            yield self[idx]
+
+    def __getitem__(self, key):
+        """Integer keys return the row as a dict, string keys the column array.
+        """
+        if isinstance(key, str):
+            return self.column(key)
+        if key < 0:
+            key += self._len
+        if key < 0 or key >= self._len:
+            raise IndexError(f'Row {key} out of range for {self._len} candidates')
+        return {k:(v[key] if v.dtype == object else v[key].item()) for k, v in self._cols.items()}
+
+    @property
+    def columns(self) -> List[str]:
+        return list(self._cols.keys())
+
+    def column(self, name:str) -> np.ndarray:
+        return self._cols[name][:self._len]
+
+    def take(self, indices) -> 'CandidateTable':
+        """Returns a new table with only the rows at indices, in that order.
+        """
+        indices = np.asarray(indices, dtype=int)
+        ans = CandidateTable()
+        ans._cols = {k:self.column(k)[indices] for k in self._cols.keys()}
+        ans._len = len(indices)
+        return ans
+
+    def filter(self, mask) -> 'CandidateTable':
+        return self.take(np.flatnonzero(mask))
+
+    def sort_by(self, name:str, reverse:bool=False) -> 'CandidateTable':
+        order = np.argsort(self.column(name), kind='stable')
+        return self.take(order[::-1] if reverse else order)
+
+def pareto_front(costs) -> np.ndarray:
+    """Finds the points which no other point dominates, i.e. no other point
+    is at least as good in every metric and better in one. Identical points
+    are all kept. NaN counts as the worst possible cost.
+    Inputs:
+        costs: (number of points) x (number of metrics) array, lower is better.
+    Outputs:
+        front_idx: Sorted indices of the non-dominated points.
+    """
+    costs = np.asarray(costs, dtype=float)
+    if costs.ndim == 1:
+        costs = costs[:,None]
+    costs = np.where(np.isnan(costs), np.inf, costs)
+    num_pts, num_metrics = costs.shape
+    if num_pts < 1:
+        return np.zeros(0, dtype=int)
+
+    # In lexicographic order, anything that dominates a point comes before it
+    order = np.lexsort(costs.T[::-1])
+    costs_sorted = costs[order]
+
+    if num_metrics == 1:
+        return np.sort(order[costs_sorted[:,0] == costs_sorted[0,0]])
+
+    if num_metrics == 2:
+        # Dominated if any earlier (non-identical) point has a cost1 that's
+        # no worse, O(n log n) for the sort
+        is_new = np.ones(num_pts, dtype=bool)
+        is_new[1:] = np.any(costs_sorted[1:] != costs_sorted[:-1], axis=1)
+        group_start = np.maximum.accumulate(np.where(is_new, np.arange(num_pts), 0))
+        cost1 = costs_sorted[:,1]
+        cost1_before = np.full(num_pts, np.inf)
+        cost1_before[1:] = np.minimum.accumulate(cost1)[:-1]
+        is_front = cost1_before[group_start] > cost1
+        return np.sort(order[is_front])
+
+    # Block-nested loop against the front so far
+    front_costs = np.empty((0, num_metrics))
+    front_idx = []
+    for idx, pt in zip(order, costs_sorted):
+        no_worse = np.all(front_costs <= pt, axis=1)
+        if np.any(no_worse & np.any(front_costs < pt, axis=1)):
+            continue
+        front_costs = np.vstack((front_costs, pt))
+        front_idx.append(idx)
+    return np.sort(np.array(front_idx, dtype=int))
+
+class _RankedOp(object):
+    """Orders operating points for heapq using a design module's op_compare.
+    An operating point is "less than" another if op_compare strictly prefers
+    the other one regardless of argument order.
+    """
+    __slots__ = ('op', 'dsn_mod')
+
+    def __init__(self, op:Mapping[str,Any], dsn_mod):
+        self.op = op
+        self.dsn_mod = dsn_mod
+
+    def __lt__(self, other):
+        op_compare = self.dsn_mod.op_compare
+        return op_compare(self.op, other.op) is other.op and op_compare(other.op, self.op) is other.op
+
 class DesignModule(object):
     """The base class of all design toward a spec.
     """
 
+    # True if meet_spec passes its outermost sweep vector through
+    # partition_sweep, i.e. design(..., workers=N) can split it up
+    parallel_sweep = False
+
+    # Parameters which are only performance limits, i.e. only used to accept or
+    # reject candidates. Required for incremental re-design, see meet_spec_incremental
+    spec_limit_keys = ()
+
+    # Relative tolerance for matching parameters of child designs, see design_child
+    child_rtol = 1e-6
+
+    # Keys of viable operating points whose sweep vectors go through
+    # sweep_range, i.e. which can be refined by a coarse-to-fine sweep
+    adaptive_sweep_keys = ()
+
+    # Direction of each selection metric, +1 if larger is better and -1 if
+    # smaller is. nf_total is the sum of the nf_* fields, a proxy for area.
+    metric_senses = dict(ibias=-1, fbw=1, ugf=1, gain=1, pm=1, nf_total=-1)
+
+    # Backend for VerificationQueue when verifying with simulation, None for
+    # BagSimBackend. Set to a FakeSimBackend to run without a simulator.
+    sim_backend = None
+
+    # Methods of subclasses which are timed when profiling, see design
+    profile_methods = ('_get_ss_lti', '_get_ss_batch', '_run_tb_sim')
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        for name in cls.profile_methods:
+            if name in cls.__dict__:
+                setattr(cls, name, profiled(f'{cls.__name__}.{name}')(cls.__dict__[name]))
+
     def __init__(self):
         self.viable_ops = []
         self.other_params = dict() # Information necessary for schematic parameters
+        self.sweep_chunk = None # (chunk index, number of chunks) when run as a worker
+        self.prune_stats = dict() # {sweep level : [number pruned, number checked]}
+        self.reject_stats = dict() # {reason : number of rejected candidates}, see reject
+        self.sweep_windows = dict() # {sweep name : (coarse viable values, window half-width)}
+        self.child_cache = dict() # Results of design_child, see there
+        self.child_cache_stats = dict(hits=0, misses=0)
+        self.profile = dict() # get_profile result of the last design(profile=True)
 
     @classmethod
     def get_params_info(cls):
@@ -168,6 +1910,13 @@ class DesignModule(object):
         """
         return []
 
+    def iter_spec(self, **kwargs) -> Iterator[Mapping[str,Any]]:
+        """Generator version of meet_spec which yields viable operating points
+        as they're found instead of collecting them. Subclasses which override
+        this should implement meet_spec as list(self.iter_spec(**kwargs)).
+        """
+        yield from self.meet_spec(**kwargs)
+
     def choose_op(self, viable_op_list:List[Mapping[str,Any]]):
         if len(viable_op_list) == 0:
             raise ValueError("No solution")
@@ -178,27 +1927,510 @@ class DesignModule(object):
                 best_op = self.op_compare(best_op, op)
         
         return best_op
+
+    def get_metric(self, op_list, name:str) -> np.ndarray:
+        """Returns the metric for every operating point in op_list (a
+        CandidateTable or list of operating points), see metric_senses.
+        """
+        if not isinstance(op_list, CandidateTable):
+            op_list = CandidateTable(op_list)
+        if name == 'nf_total':
+            nf_keys = [k for k in op_list.columns if k.startswith('nf_')]
+            return sum((op_list.column(k).astype(float) for k in nf_keys), np.zeros(len(op_list)))
+        return op_list.column(name).astype(float)
+
+    def get_metric_names(self, op_list) -> List[str]:
+        """Returns the metrics in metric_senses which op_list has.
+        """
+        if not isinstance(op_list, CandidateTable):
+            op_list = CandidateTable(op_list)
+        columns = op_list.columns
+        has_nf = any(k.startswith('nf_') for k in columns)
+        return [k for k in self.metric_senses.keys() if k in columns or (k == 'nf_total' and has_nf)]
+
+    def choose_pareto(self, op_list, metrics:Iterable[str]=None) -> CandidateTable:
+        """Returns the operating points in op_list on the Pareto front of
+        the metrics, i.e. those not beaten by another in every metric.
+        Inputs:
+            op_list: CandidateTable or list of operating points.
+            metrics: Metric names, see metric_senses. None for every metric
+                op_list has.
+        """
+        if not isinstance(op_list, CandidateTable):
+            op_list = CandidateTable(op_list)
+        if len(op_list) < 1:
+            return op_list
+        if metrics == None:
+            metrics = self.get_metric_names(op_list)
+        costs = np.column_stack([-self.metric_senses[k]*self.get_metric(op_list, k) for k in metrics])
+        return op_list.take(pareto_front(costs))
+
+    def choose_top_k(self, op_list, objective:Mapping[str,float], top_k:int=1) -> CandidateTable:
+        """Ranks op_list by a weighted sum of metrics, each scaled to 0 (worst)
+        through 1 (best) over op_list.
+        Inputs:
+            op_list: CandidateTable or list of operating points.
+            objective: {metric name : weight}. Directions come from metric_senses.
+            top_k: Number of operating points to return.
+        Outputs:
+            top_op_list: The top_k best operating points, best first.
+        """
+        if not isinstance(op_list, CandidateTable):
+            op_list = CandidateTable(op_list)
+        if len(op_list) < 1:
+            return op_list
+        score = np.zeros(len(op_list))
+        for k, weight in objective.items():
+            val = self.metric_senses[k]*self.get_metric(op_list, k)
+            # Scale over the finite values, e.g. pm is inf without a unity gain crossing
+            val_finite = val[np.isfinite(val)]
+            val_min = np.min(val_finite) if len(val_finite) > 0 else 0
+            val_span = np.ptp(val_finite) if len(val_finite) > 0 else 0
+            val_span = 1 if val_span == 0 else val_span
+            with np.errstate(invalid='ignore'):
+                val_norm = np.clip((val - val_min) / val_span, 0, 1)
+            score += weight * np.nan_to_num(val_norm, nan=0)
+        order = np.argsort(-score, kind='stable')
+        return op_list.take(order[:top_k])
+
+    def choose_op_stream(self, op_iter:Iterable[Mapping[str,Any]],
+            top_k:int=None) -> Tuple[Mapping[str,Any], List[Mapping[str,Any]]]:
+        """Online version of choose_op. Only the best operating point so far
+        (and optionally the top_k best) are held in memory.
+        Inputs:
+            op_iter: Iterable of viable operating points, e.g. from iter_spec.
+            top_k: Number of best operating points to keep. None to only keep
+                the best.
+        Outputs:
+            best_op: Same as choose_op.
+            top_op_list: The top_k best operating points, best first, or
+                [best_op] if top_k is None.
+        """
+        best_op = None
+        top_heap = []
+        num_ops = 0
+        for op in op_iter:
+            num_ops += 1
+            best_op = op if best_op == None else self.op_compare(best_op, op)
+
+            if top_k == None:
+                continue
+            ranked_op = _RankedOp(op, self)
+            if len(top_heap) < top_k:
+                heapq.heappush(top_heap, ranked_op)
+            elif top_heap[0] < ranked_op:
+                heapq.heapreplace(top_heap, ranked_op)
+
+        if num_ops == 0:
+            raise ValueError("No solution")
+        logger.info('%d viable operating points', num_ops)
+
+        if top_k == None:
+            return best_op, [best_op]
+        return best_op, [r.op for r in sorted(top_heap, reverse=True)]
     
+    def design_child(self, dsn_mod:'DesignModule', method:str='design', quiet:bool=True, **params):
+        """For hierarchical designs. Runs dsn_mod.design (or meet_spec) with
+        params, but reuses the result of an earlier call with the same child
+        class and parameters (floats matched to child_rtol) in this run. A
+        ValueError (i.e. no solution) is remembered and raised again, and the
+        child's other_params are restored so get_sch_params works as usual.
+        Inputs:
+            dsn_mod: Child design module.
+            method: 'design' or 'meet_spec'.
+            quiet: True to silence the child's printing.
+            params: Child spec parameters.
+        Outputs:
+            Returns whatever dsn_mod.<method> returns.
+        """
+        key = (type(dsn_mod).__qualname__, method,
+               json.dumps(_normalize_params(round_params(params, self.child_rtol))))
+
+        if key in self.child_cache:
+            self.child_cache_stats['hits'] += 1
+            result, err, other_params = self.child_cache[key]
+        else:
+            self.child_cache_stats['misses'] += 1
+            result, err = None, None
+            try:
+                with (quiet_output() if quiet else contextlib.nullcontext()):
+                    result = getattr(dsn_mod, method)(**params)
+            except ValueError as e:
+                err = e
+            other_params = dsn_mod.other_params
+            self.child_cache[key] = (result, err, other_params)
+
+        dsn_mod.other_params = other_params
+        if err != None:
+            raise err
+        return result
+
+    def filter_candidates(self, op_list, **kwargs):
+        """To be overridden by subclasses which support incremental
+        re-design. Returns the candidates in op_list (a meet_spec result with
+        every performance limit disabled) which meet the limits in kwargs.
+        """
+        raise NotImplementedError()
+
+    def meet_spec_incremental(self, workers:int=1, cache_dir:str=None, **kwargs):
+        """Same result as meet_spec, but the sweep is run without performance
+        limits and its candidates are kept, keyed on every parameter except
+        spec_limit_keys (and on the spec files, see get_design_key). A later
+        run where only limits changed re-filters the kept candidates instead
+        of sweeping again. Subclasses must ignore spec_limit_keys in meet_spec
+        when optional_params['incremental'] is set, including in pruning and
+        early loop exits.
+        Inputs:
+            workers: Same as design.
+            cache_dir: Directory to also keep candidates in across processes.
+            kwargs: Same as meet_spec.
+        """
+        sweep_kwargs = {k:v for k,v in kwargs.items() if k not in self.spec_limit_keys}
+        key = get_design_key(type(self), sweep_kwargs)
+        file_list = _get_param_files(sweep_kwargs)
+        cache_file = None if cache_dir == None else os.path.join(cache_dir, f'{type(self).__name__}_prefilter_{key}.pkl')
+
+        if key in _prefilter_cache:
+            _prefilter_cache.move_to_end(key)
+            op_list, self.other_params, _ = _prefilter_cache[key]
+            logger.info('Re-filtering %d stored candidates', len(op_list))
+        elif cache_file != None and os.path.isfile(cache_file):
+            with open(cache_file, 'rb') as f:
+                op_list, self.other_params = pickle.load(f)
+            _put_prefilter_cache(key, op_list, self.other_params, file_list)
+            logger.info('Re-filtering %d stored candidates', len(op_list))
+        else:
+            logger.info('Sweeping without performance limits')
+            self.set_sweep_windows(workers, **kwargs)
+            if workers > 1:
+                op_list = self.meet_spec_parallel(workers, **kwargs)
+            else:
+                op_list = self.meet_spec(**kwargs)
+            _put_prefilter_cache(key, op_list, self.other_params, file_list)
+            if cache_file != None:
+                os.makedirs(cache_dir, exist_ok=True)
+                with open(f'{cache_file}.tmp', 'wb') as f:
+                    pickle.dump((op_list, self.other_params), f)
+                os.replace(f'{cache_file}.tmp', cache_file)
+
+        return self.filter_candidates(op_list, **kwargs)
+
+    def prune(self, level:str, cond):
+        """For skipping a whole sub-tree of a sweep when a cheap bound shows
+        nothing in it can meet spec, e.g.
+            if self.prune('vout1', ugf_bound < ugf_min):
+                continue
+        or for a whole sweep vector at once,
+            vgtail_vec = vgtail_vec[~self.prune('vgtail', vgtail_bound_vec < gain_min)]
+        Bounds should be optimistic so nothing viable gets pruned.
+        Inputs:
+            level: Name of the sweep level, for reporting.
+            cond: True if the sub-tree can't meet spec. Boolean or boolean
+                array with one entry per sweep point.
+        Outputs:
+            Returns cond. Counts are kept in prune_stats.
+        """
+        num_pruned = int(np.count_nonzero(cond))
+        stats = self.prune_stats.setdefault(level, [0, 0])
+        stats[0] += num_pruned
+        stats[1] += int(np.size(cond))
+        profile_count(f'prune.{level}', num_pruned)
+        return cond
+
+    def print_prune_stats(self) -> None:
+        for level, (num_pruned, num_checked) in self.prune_stats.items():
+            logger.info('Pruned %d/%d at %s', num_pruned, num_checked, level)
+
+    def reject(self, reason:str, value=None) -> None:
+        """Counts a rejected candidate in reject_stats, e.g.
+            if fbw < fbw_min:
+                self.reject('fbw', fbw)
+                continue
+        The value is only formatted if logging at DEBUG.
+        """
+        self.reject_stats[reason] = self.reject_stats.get(reason, 0) + 1
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('Rejected on %s: %s', reason, value)
+
+    def print_reject_stats(self) -> None:
+        for reason, num_rejected in self.reject_stats.items():
+            logger.info('Rejected %d on %s', num_rejected, reason)
+
+    def partition_sweep(self, sweep_vec):
+        """Returns the contiguous part of the outermost sweep vector that this
+        instance is responsible for. Returns sweep_vec unchanged unless running
+        as a worker of meet_spec_parallel.
+        """
+        if self.sweep_chunk == None:
+            return sweep_vec
+        idx, num_chunks = self.sweep_chunk
+        return np.array_split(np.asarray(sweep_vec), num_chunks)[idx]
+
+    def sweep_range(self, name:str, sweep_vec):
+        """Returns the part of a sweep vector within the windows found by a
+        coarse sweep (see find_sweep_windows). Returns sweep_vec unchanged
+        outside of the fine pass of an adaptive sweep.
+        """
+        if name not in self.sweep_windows:
+            profile_count(f'sweep.{name}', len(sweep_vec))
+            return sweep_vec
+        centers, half_width = self.sweep_windows[name]
+        sweep_vec = np.asarray(sweep_vec, dtype=float)
+
+        # Distance to the nearest coarse viable value
+        idx = np.searchsorted(centers, sweep_vec)
+        dist_hi = np.abs(centers[np.minimum(idx, len(centers)-1)] - sweep_vec)
+        dist_lo = np.abs(centers[np.maximum(idx-1, 0)] - sweep_vec)
+        sweep_vec = sweep_vec[np.minimum(dist_lo, dist_hi) <= half_width*(1+1e-6)]
+        profile_count(f'sweep.{name}', len(sweep_vec))
+        return sweep_vec
+
+    def set_sweep_windows(self, workers:int=1, **kwargs) -> None:
+        """Runs the coarse pass of an adaptive sweep if optional_params has
+        res_vstep_coarse. See find_sweep_windows.
+        """
+        self.sweep_windows = dict()
+        if kwargs.get('optional_params', dict()).get('res_vstep_coarse', None) == None:
+            return
+        if len(self.adaptive_sweep_keys) < 1:
+            warnings.warn(f'{type(self).__name__} does not support adaptive sweeps, running full sweep')
+            return
+        self.sweep_windows = self.find_sweep_windows(workers, **kwargs)
+
+    def find_sweep_windows(self, workers:int=1, **kwargs) -> Mapping[str,Tuple[np.ndarray,float]]:
+        """Coarse pass of an adaptive sweep. Runs meet_spec with
+        optional_params res_vstep_coarse in place of res_vstep and returns
+        windows of +/- res_vwindow (default one coarse step) around every
+        viable value of each of adaptive_sweep_keys, so the fine pass only
+        refines near viable points.
+        Inputs:
+            workers: Same as design.
+            kwargs: Same as meet_spec.
+        Outputs:
+            {Key : (sorted viable coarse values, window half-width)}, or an
+            empty dictionary (i.e. a full fine sweep) if nothing was viable.
+        """
+        optional_params = kwargs['optional_params']
+        res_vstep_coarse = optional_params['res_vstep_coarse']
+        res_vwindow = optional_params.get('res_vwindow', res_vstep_coarse)
+        coarse_kwargs = dict(kwargs)
+        coarse_kwargs['optional_params'] = dict(optional_params, res_vstep=res_vstep_coarse)
+
+        logger.info('Coarse sweep with %s V steps', res_vstep_coarse)
+        self.sweep_windows = dict()
+        if workers > 1:
+            coarse_op_list = self.meet_spec_parallel(workers, **coarse_kwargs)
+        else:
+            coarse_op_list = self.meet_spec(**coarse_kwargs)
+
+        if len(coarse_op_list) < 1:
+            warnings.warn('No viable points in coarse sweep, running full fine sweep')
+            return dict()
+
+        sweep_windows = dict()
+        for key in self.adaptive_sweep_keys:
+            if isinstance(coarse_op_list, CandidateTable):
+                val_vec = coarse_op_list.column(key)
+            else:
+                val_vec = [op[key] for op in coarse_op_list]
+            sweep_windows[key] = (np.unique(np.asarray(val_vec, dtype=float)), res_vwindow)
+        logger.info('%d viable coarse operating points, refining', len(coarse_op_list))
+        return sweep_windows
+
+    def meet_spec_parallel(self, workers:int, **kwargs) -> List[Mapping[str,Any]]:
+        """Runs meet_spec with the outermost sweep split across a pool of
+        worker processes. Each worker loads its own databases once. Results
+        are merged in sweep order, so they match a serial meet_spec.
+        Inputs:
+            workers: Number of worker processes.
+            kwargs: Same as meet_spec.
+        """
+        # More chunks than workers to even out load when the cost per point
+        # varies along the sweep
+        num_chunks = 4*workers
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_meet_spec_chunk, type(self), (i, num_chunks), kwargs,
+                                       self.sweep_windows, profile_params['enabled'])
+                       for i in range(num_chunks)]
+            results = [f.result() for f in futures]
+
+        viable_op_list = type(results[0][0])()
+        for chunk_op_list, _, chunk_prune_stats, chunk_profile, chunk_reject_stats in results:
+            viable_op_list.extend(chunk_op_list)
+            merge_profile(chunk_profile)
+            for reason, num_rejected in chunk_reject_stats.items():
+                self.reject_stats[reason] = self.reject_stats.get(reason, 0) + num_rejected
+            for level, (num_pruned, num_checked) in chunk_prune_stats.items():
+                stats = self.prune_stats.setdefault(level, [0, 0])
+                stats[0] += num_pruned
+                stats[1] += num_checked
+
+        # Every chunk computes the same schematic-level information
+        self.other_params = next((p for _, p, _, _, _ in results if p), dict())
+
+        return viable_op_list
+
     def op_compare(self, op1:Mapping[str,Any], op2:Mapping[str,Any]):
         raise NotImplementedError()
 
     def get_sch_params(self, op):
         raise NotImplementedError()
 
-    def design(self, **kwargs) -> Tuple[Mapping[str,Any], Mapping[str,Any]]:
+    def design(self, workers:int=1, stream:bool=False, top_k:int=None,
+            cache_dir:str=None, cache_table:bool=False,
+            pareto:bool=False, objective:Mapping[str,float]=None,
+            profile:bool=False, profile_file:str=None,
+            **kwargs) -> Tuple[Mapping[str,Any], Mapping[str,Any]]:
         """Takes the spec parameters and designs for the spec.
+        Inputs:
+            workers: Number of processes to split the outermost sweep across.
+                Only used if the subclass supports it (parallel_sweep).
+            stream: True to select the best operating point as they're found
+                rather than collecting every viable one first. viable_op_list
+                then only holds the top_k best.
+            top_k: With stream or objective, the number of best operating
+                points to keep.
+            cache_dir: Directory to cache results in, keyed on the spec (see
+                get_design_key). Defaults to set_design_cache_dir.
+            cache_table: True to also cache viable_op_list.
+            pareto: True to only keep operating points on the Pareto front of
+                every metric they have, see choose_pareto.
+            objective: {metric name : weight} to choose the best operating
+                point by a weighted sum of metrics rather than op_compare,
+                see choose_top_k. viable_op_list is then ranked best first.
+            profile: True to time database queries, current matching,
+                small-signal evaluation, simulations, logging, and each
+                sweep level (see profile_timer), log a summary at the end,
+                and keep it in self.profile. Child designs are included.
+            profile_file: File to also write the profile to as JSON.
+            kwargs: Spec parameters, see get_params_info. If optional_params
+                has res_vstep_coarse, voltage sweeps are first run at that step
+                and then only refined to res_vstep near viable points. If
+                optional_params has incremental=True, see meet_spec_incremental.
         """
-        print('Searching for viable operating points')
-        self.viable_op_list = self.meet_spec(**kwargs)
-        print(f'{len(self.viable_op_list)} viable operating points.\nChoosing best operating point')
-        best_op = self.choose_op(self.viable_op_list)
+        if not profile:
+            # Still timed if this is a child of a profiled design
+            with profile_timer(f'{type(self).__name__}.design'):
+                return self._design(workers=workers, stream=stream, top_k=top_k, cache_dir=cache_dir,
+                                    cache_table=cache_table, pareto=pareto, objective=objective, **kwargs)
+
+        total_name = f'{type(self).__name__}.design'
+        enabled = profile_params['enabled']
+        set_profile_enabled(True)
+        clear_profile()
+        try:
+            with profile_timer(total_name):
+                result = self._design(workers=workers, stream=stream, top_k=top_k, cache_dir=cache_dir,
+                                      cache_table=cache_table, pareto=pareto, objective=objective, **kwargs)
+        finally:
+            set_profile_enabled(enabled)
+        self.profile = get_profile()
+
+        logger.info('Profile')
+        print_profile(self.profile, total_name)
+        if profile_file != None:
+            with open(profile_file, 'w') as f:
+                json.dump(dict(total=total_name, entries=self.profile), f, indent=2)
+        return result
+
+    def _design(self, workers:int=1, stream:bool=False, top_k:int=None,
+            cache_dir:str=None, cache_table:bool=False,
+            pareto:bool=False, objective:Mapping[str,float]=None,
+            **kwargs) -> Tuple[Mapping[str,Any], Mapping[str,Any]]:
+        """design without profiling, see there.
+        """
+        if cache_dir == None:
+            cache_dir = design_cache_params['cache_dir']
+        cache_file = None
+        if cache_dir != None:
+            key_params = kwargs
+            if pareto or objective != None:
+                # Selection changes the result
+                key_params = dict(kwargs, _selection=dict(pareto=pareto, objective=objective, top_k=top_k))
+            cache_file = os.path.join(cache_dir, f'{type(self).__name__}_{get_design_key(type(self), key_params)}.pkl')
+            if os.path.isfile(cache_file):
+                with open(cache_file, 'rb') as f:
+                    cache_info = pickle.load(f)
+                logger.info('Loaded cached design from %s', cache_file)
+                self.other_params = cache_info['other_params']
+                self.viable_op_list = cache_info.get('viable_op_list', [cache_info['best_op']])
+                return cache_info['sch_params'], cache_info['best_op']
+
+        logger.info('Searching for viable operating points')
+        self.prune_stats = dict()
+        self.reject_stats = dict()
+        self.child_cache = dict()
+        self.child_cache_stats = dict(hits=0, misses=0)
+        if stream and (pareto or objective != None):
+            warnings.warn('Pareto and objective selection need every viable operating point, running without stream')
+            stream = False
+        if workers > 1 and not self.parallel_sweep:
+            warnings.warn(f'{type(self).__name__} does not support parallel sweeps, running serially')
+            workers = 1
+
+        optional_params = kwargs.get('optional_params', dict())
+        incremental = optional_params.get('incremental', False)
+        if incremental and len(self.spec_limit_keys) < 1:
+            warnings.warn(f'{type(self).__name__} does not support incremental re-design, running full sweep')
+            incremental = False
+
+        # Incremental re-design only sweeps (coarse or not) when needed
+        cls_name = type(self).__name__
+        self.sweep_windows = dict()
+        if not incremental:
+            with profile_timer(f'{cls_name}.coarse_sweep'):
+                self.set_sweep_windows(workers, **kwargs)
+
+        # With stream, the sweep runs as choose_op_stream consumes it
+        with profile_timer(f'{cls_name}.sweep'):
+            if incremental:
+                op_iter = self.meet_spec_incremental(workers, cache_dir, **kwargs)
+            elif workers > 1:
+                op_iter = self.meet_spec_parallel(workers, **kwargs)
+            elif stream:
+                op_iter = self.iter_spec(**kwargs)
+            else:
+                op_iter = self.meet_spec(**kwargs)
+
+        if stream:
+            with profile_timer(f'{cls_name}.sweep_stream'):
+                best_op, self.viable_op_list = self.choose_op_stream(op_iter, top_k=top_k)
+        else:
+            with profile_timer(f'{cls_name}.select'):
+                self.viable_op_list = op_iter
+                logger.info('%d viable operating points.\nChoosing best operating point', len(self.viable_op_list))
+                if pareto:
+                    self.viable_op_list = self.choose_pareto(self.viable_op_list)
+                    logger.info('%d on the Pareto front', len(self.viable_op_list))
+                if objective == None:
+                    best_op = self.choose_op(self.viable_op_list)
+                else:
+                    num_top = len(self.viable_op_list) if top_k == None else top_k
+                    self.viable_op_list = self.choose_top_k(self.viable_op_list, objective, num_top)
+                    if len(self.viable_op_list) == 0:
+                        raise ValueError("No solution")
+                    best_op = self.viable_op_list[0]
+        self.print_prune_stats()
+        self.print_reject_stats()
+        if self.child_cache_stats['misses'] > 0:
+            logger.info('Child designs: %d run, %d reused', self.child_cache_stats['misses'], self.child_cache_stats['hits'])
         sch_params = self.get_sch_params(best_op)
 
         # print(f"OP: \n{best_op}\n\nSCH:\n{sch_params}")
-        print('OP\n')
-        pprint(best_op)
-        print('\n\nSCH\n')
-        pprint(sch_params)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info('OP\n\n%s\n\n\nSCH\n\n%s', pformat(best_op), pformat(sch_params))
+
+        if cache_file != None:
+            cache_info = dict(sch_params=sch_params,
+                              best_op=best_op,
+                              other_params=self.other_params)
+            if cache_table:
+                cache_info['viable_op_list'] = self.viable_op_list
+            os.makedirs(cache_dir, exist_ok=True)
+            # Write then rename so an interrupted run never leaves a partial file
+            with open(f'{cache_file}.tmp', 'wb') as f:
+                pickle.dump(cache_info, f)
+            os.replace(f'{cache_file}.tmp', cache_file)
 
         return sch_params, best_op
 
@@ -1,16 +1,19 @@
 # -*- coding: utf-8 -*-
 
-from typing import Mapping, Tuple, Any, List
+from typing import Mapping, Tuple, Any, List, Iterator
 
 import os
 import pkg_resources
 import numpy as np
 import warnings
+import logging
 
 from bag.design.module import Module
-from . import DesignModule, get_mos_db, estimate_vth, parallel, verify_ratio, num_den_add
+from . import DesignModule, get_mos_db, estimate_vth, parallel, verify_ratio_vec, find_ratio_match, num_den_add, SmallSignalBatch, verify_ss, query_batch, op_from_batch, CandidateTable, get_sim_env_list, query_batch_corners, get_vgs_lut
 from bag.data.lti import LTICircuit, get_w_3db, get_stability_margins, get_w_crossings
 
+logger = logging.getLogger(__name__)
+
 # noinspection PyPep8Naming
 class bag2_analog__amp_diff_mirr_dsn(DesignModule):
     """Module for library bag2_analog cell amp_diff_mirr.
@@ -18,6 +21,10 @@ class bag2_analog__amp_diff_mirr_dsn(DesignModule):
     Fill in high level description here.
     """
 
+    parallel_sweep = True
+    adaptive_sweep_keys = ('vtail', 'voutcm', 'vgtail')
+    spec_limit_keys = ('gain', 'fbw', 'ugf', 'pm')
+
     @classmethod
     def get_params_info(cls) -> Mapping[str,str]:
         # type: () -> Dict[str, str]
@@ -35,7 +42,7 @@ class bag2_analog__amp_diff_mirr_dsn(DesignModule):
             specfile_dict = 'Transistor database spec file names for each device',
             th_dict = 'Transistor flavor dictionary.',
             l_dict = 'Transistor channel length dictionary',
-            sim_env = 'Simulation environment',
+            sim_env = 'Simulation environment, or a list of them to design for the worst case across corners. The first is the nominal corner used for sizing',
             vswing_lim = 'Tuple of lower and upper swing from the bias',
             gain = '(Min, max) small signal gain target in V/V',
             fbw = 'Minimum bandwidth in Hz',
@@ -46,28 +53,35 @@ class bag2_analog__amp_diff_mirr_dsn(DesignModule):
             ibias = 'Maximum bias current, in amperes.',
             cload = 'Output load capacitance in farads.',
             iref = 'Minimum quantization of the tail current',
-            optional_params = 'Optional parameters. voutcm=output bias voltage. res_vstep, vstar_min, error_tol, vstar_in_min'
+            optional_params = 'Optional parameters. voutcm=output bias voltage. res_vstep, vstar_min, error_tol, vstar_in_min, ss_verify=check batched small-signal results against LTICircuit, ss_rtol, prune_slack=relative margin on bounds used to skip sweep points, res_vstep_coarse=coarse step for an adaptive sweep, res_vwindow, incremental=keep unfiltered candidates to re-filter when only gain/fbw/ugf/pm change'
         ))
         return ans
 
-    def meet_spec(self, **params) -> List[Mapping[str,Any]]:
+    def meet_spec(self, **params) -> CandidateTable:
         """To be overridden by subclasses to design this module.
         Returns collection of all possible solutions.
         Raises a ValueError if there is no solution.
         """
+        return CandidateTable(self.iter_spec(**params))
+
+    def iter_spec(self, **params) -> Iterator[Mapping[str,Any]]:
+        """Yields viable operating points as they're found. See meet_spec.
+        """
         optional_params = params['optional_params']
 
         ### Get DBs for each device
         specfile_dict = params['specfile_dict']
         l_dict = params['l_dict']
         th_dict = params['th_dict']
-        sim_env = params['sim_env']
+        sim_env_list = get_sim_env_list(params['sim_env'])
         
-        # Databases
-        db_dict = {k:get_mos_db(spec_file=specfile_dict[k],
-                                intent=th_dict[k],
-                                sim_env=sim_env,
-                                lch=l_dict[k]) for k in specfile_dict.keys()}
+        # Databases for each corner, the nominal corner goes first
+        db_corner_dict = {k:[get_mos_db(spec_file=specfile_dict[k],
+                                        intent=th_dict[k],
+                                        sim_env=sim_env,
+                                        lch=l_dict[k]) for sim_env in sim_env_list] for k in specfile_dict.keys()}
+        db_dict = {k:db_list[0] for k,db_list in db_corner_dict.items()}
+        multi_corner = len(sim_env_list) > 1
 
         ### Design devices
         in_type = params['in_type']
@@ -86,6 +100,14 @@ class bag2_analog__amp_diff_mirr_dsn(DesignModule):
         res_vstep = optional_params.get('res_vstep', 10e-3)
         error_tol = optional_params.get('error_tol', 0.01)
         vstar_in_min = optional_params.get('vstar_in_min', 0.1)
+        ss_verify = optional_params.get('ss_verify', False)
+        ss_rtol = optional_params.get('ss_rtol', 1e-3)
+        prune_slack = optional_params.get('prune_slack', 0.1)
+
+        # Keep everything, filter_candidates applies the limits afterwards
+        if optional_params.get('incremental', False):
+            gain_min, gain_max = -np.inf, np.inf
+            fbw_min = ugf_min = pm_min = -np.inf
 
         # Estimate threshold of each device TODO can this be more generalized?
         n_in = in_type=='n'
@@ -102,15 +124,24 @@ class bag2_analog__amp_diff_mirr_dsn(DesignModule):
         vth_load = estimate_vth(is_nch=(not n_in), vgs=vtest_load, vbs=0, db=db_dict['load'], lch=l_dict['load'])
         vth_tail = estimate_vth(is_nch=n_in, vgs=vtest_tail, vbs=0, db=db_dict['tail'], lch=l_dict['tail'])
 
+        self.other_params = dict(in_type=in_type,
+                                 w_dict={k:db.width_list[0] for k,db in db_dict.items()},
+                                 l_dict=l_dict,
+                                 th_dict=th_dict)
+
         ibias_min = np.inf
-        # Keeping track of operating points which work for future comparison
-        viable_op_list = []
 
         # Sweep tail voltage
         vtail_min = vstar_min if n_in else vincm-vth_in+vstar_in_min
         vtail_max = vincm-vth_in-vstar_in_min if n_in else vdd-vstar_min
-        vtail_vec = np.arange(vtail_min, vtail_max, res_vstep)
-        print(f'Sweeping tail from {vtail_min} to {vtail_max}')
+        vtail_vec = self.partition_sweep(self.sweep_range('vtail', np.arange(vtail_min, vtail_max, res_vstep)))
+        logger.info('Sweeping tail from %s to %s', vtail_min, vtail_max)
+
+        # A tail whose single-finger current is more than twice the whole
+        # budget rounds to zero fingers for every input size, so its gate
+        # voltage is bounded by inverting that current
+        if len(vtail_vec) > 0:
+            tail_lut = get_vgs_lut(db_dict['tail'], is_nch=n_in, vdd=vdd, vds_vec=np.asarray(vtail_vec)-vb_tail)
 
         for vtail in vtail_vec:
             # Sweep output common mode or use taken-in optional parameter
@@ -119,7 +150,7 @@ class bag2_analog__amp_diff_mirr_dsn(DesignModule):
 
             voutcm_opt = optional_params.get('voutcm', None)
             if voutcm_opt == None:
-                voutcm_vec = np.arange(voutcm_min, voutcm_max, res_vstep)          
+                voutcm_vec = self.sweep_range('voutcm', np.arange(voutcm_min, voutcm_max, res_vstep))
             elif (n_in and (voutcm_opt < vtail)) or ((not n_in) and (voutcm_opt > vtail)):
                 warnings.warn(f'voutcm {voutcm_opt} vs. vtail {vtail}')
                 continue
@@ -128,93 +159,149 @@ class bag2_analog__amp_diff_mirr_dsn(DesignModule):
                 voutcm_vec = [voutcm_opt]
             else:
                 voutcm_vec = [voutcm_opt]
+            voutcm_vec = np.asarray(voutcm_vec, dtype=float)
+
+            # Tail gate voltages don't depend on the output bias or sizing
+            vgtail_min = vth_tail + vstar_min if n_in else vtail + vth_tail
+            vgtail_max = vtail + vth_tail if n_in else vdd + vth_tail - vstar_min
+            vgtail_vec = self.sweep_range('vgtail', np.arange(vgtail_min, vgtail_max, res_vstep))
+            lut_success, vgs_cap = tail_lut.get_vgs(2*ibias_max*(1+prune_slack), vds=vtail-vb_tail, vbs=0)
+            if lut_success:
+                vgtail_cap = vgs_cap + vb_tail
+                vgtail_fail = vgtail_vec > vgtail_cap if n_in else vgtail_vec < vgtail_cap
+                vgtail_vec = vgtail_vec[~self.prune('vgtail', vgtail_fail)]
+            if len(voutcm_vec) < 1 or len(vgtail_vec) < 1:
+                continue
 
-            for voutcm in voutcm_vec:
-                in_op = db_dict['in'].query(vgs=vincm-vtail,
-                                            vds=voutcm-vtail,
-                                            vbs=vb_in-vtail)
-                load_op = db_dict['load'].query(vgs=voutcm-vb_load,
-                                                vds=voutcm-vb_load,
-                                                vbs=0)
+            # Query all bias points for this tail voltage at once, in every
+            # corner. Leading axis is the corner, nominal first
+            in_op_corners = query_batch_corners(db_corner_dict['in'],
+                                                vgs=vincm-vtail,
+                                                vds=voutcm_vec-vtail,
+                                                vbs=vb_in-vtail)
+            load_op_corners = query_batch_corners(db_corner_dict['load'],
+                                                  vgs=voutcm_vec-vb_load,
+                                                  vds=voutcm_vec-vb_load,
+                                                  vbs=0)
+            tail_op_corners = query_batch_corners(db_corner_dict['tail'],
+                                                  vgs=vgtail_vec-vb_tail,
+                                                  vds=vtail-vb_tail,
+                                                  vbs=0)
+            in_op_batch = {k:v[0] for k,v in in_op_corners.items()}
+            load_op_batch = {k:v[0] for k,v in load_op_corners.items()}
+            tail_op_batch = {k:v[0] for k,v in tail_op_corners.items()}
+            bias_op_batch = query_batch(db_dict['tail'],
+                                        vgs=vgtail_vec-vb_tail,
+                                        vds=vgtail_vec-vb_tail,
+                                        vbs=0)
+            tail_op_list = [op_from_batch(tail_op_batch, i) for i in range(len(vgtail_vec))]
+            bias_op_list = [op_from_batch(bias_op_batch, i) for i in range(len(vgtail_vec))]
+
+            for i_outcm, voutcm in enumerate(voutcm_vec):
+                in_op = op_from_batch(in_op_batch, i_outcm)
+                load_op = op_from_batch(load_op_batch, i_outcm)
                 ibias_min = 2*in_op['ibias']
                 # Step input device size (integer steps)
                 nf_in_max = int(round(ibias_max/ibias_min))
+
+                # Gain doesn't depend on sizing beyond the load ratio, and
+                # bandwidth is at most what the largest input pair gives
+                # without parasitics
+                gds_out = in_op['gds'] + load_op['gds']*in_op['ibias']/load_op['ibias']
+                gain_bound = in_op['gm']/gds_out
+                fbw_bound = nf_in_max*gds_out/(2*np.pi*cload)
+                ugf_bound = nf_in_max*in_op['gm']/(2*np.pi*cload)
+                if self.prune('voutcm', gain_bound*(1+prune_slack) < gain_min
+                                        or fbw_bound*(1+prune_slack) < fbw_min
+                                        or ugf_bound*(1+prune_slack) < ugf_min):
+                    continue
                 nf_in_vec = np.arange(1, nf_in_max, 1)
+                # Match device sizing for input and load for all sizes at once
+                match_load_vec, nf_load_vec = verify_ratio_vec(in_op['ibias'],
+                                                               load_op['ibias'],
+                                                               nf_in_vec,
+                                                               error_tol)
                 # print(nf_in_max)
-                for nf_in in nf_in_vec:
-                    # Check against current
-                    ibias = ibias_min * nf_in
-
-                    # Match device sizing for input and load
-                    match_load, nf_load = verify_ratio(in_op['ibias'],
-                                                      load_op['ibias'],
-                                                      nf_in,
-                                                      error_tol)
-                    if not match_load:
-                        # print(f"Load match {nf_load}")
+                for nf_in, nf_load in zip(nf_in_vec[match_load_vec], nf_load_vec[match_load_vec]):
+                    # Design tail to current match for every tail gate voltage
+                    tail_success_vec, nf_tail_vec = verify_ratio_vec(in_op['ibias']*2,
+                                                                     tail_op_batch['ibias'],
+                                                                     nf_in,
+                                                                     error_tol)
+                    idx_tail_vec = np.flatnonzero(tail_success_vec)
+                    if len(idx_tail_vec) < 1:
                         continue
 
-                    # Design tail to current match
-                    vgtail_min = vth_tail + vstar_min if n_in else vtail + vth_tail
-                    vgtail_max = vtail + vth_tail if n_in else vdd + vth_tail - vstar_min
-                    vgtail_vec = np.arange(vgtail_min, vgtail_max, res_vstep)
-                    for vgtail in vgtail_vec:
-                        tail_op = db_dict['tail'].query(vgs=vgtail-vb_tail,
-                                                        vds=vtail-vb_tail,
-                                                        vbs=0)
-                        bias_op = db_dict['tail'].query(vgs=vgtail-vb_tail,
-                                                        vds=vgtail-vb_tail,
-                                                        vbs=0)
-                        tail_success, nf_tail = verify_ratio(in_op['ibias']*2,
-                                                             tail_op['ibias'],
-                                                             nf_in,
-                                                             error_tol)
-                        if not tail_success:
-                            # print('Tail match')
-                            continue
+                    # Small-signal figures of merit for every matched tail in
+                    # every corner at once, with the bias voltages held at
+                    # their nominal values
+                    ss_op_dict = {'in' : {k:v[:, i_outcm, None] for k,v in in_op_corners.items()},
+                                  'tail' : {k:v[:, idx_tail_vec] for k,v in tail_op_corners.items()},
+                                  'load' : {k:v[:, i_outcm, None] for k,v in load_op_corners.items()}}
+                    ss_nf_dict = {'in' : nf_in,
+                                  'tail' : nf_tail_vec[idx_tail_vec],
+                                  'load' : nf_load}
+                    gain_corners, fbw_corners, ugf_corners, pm_corners = self._get_ss_batch(op_dict=ss_op_dict,
+                                                                                            nf_dict=ss_nf_dict,
+                                                                                            cload=cload)
+                    ss_batch = (gain_corners[0], fbw_corners[0], ugf_corners[0], pm_corners[0])
+                    # Worst case across corners
+                    ss_wc_batch = (gain_corners.min(axis=0), gain_corners.max(axis=0),
+                                   fbw_corners.min(axis=0), ugf_corners.min(axis=0), pm_corners.min(axis=0))
+                    ibias_wc_vec = tail_op_corners['ibias'][:, idx_tail_vec].max(axis=0)*nf_tail_vec[idx_tail_vec]
+
+                    for i_match, i_gtail in enumerate(idx_tail_vec):
+                        vgtail = vgtail_vec[i_gtail]
+                        tail_op = tail_op_list[i_gtail]
+                        bias_op = bias_op_list[i_gtail]
+                        nf_tail = nf_tail_vec[i_gtail]
 
                         ibias = tail_op['ibias'] * nf_tail
                         iref_mult_max = (ibias_max - ibias) // params['iref']
                         iref_mult_vec = np.arange(1, iref_mult_max, 1)
-                        for iref_mult in iref_mult_vec:
-                            bias_success, nf_bias = verify_ratio(params['iref'],
-                                                                 bias_op['ibias'],
-                                                                 iref_mult,
-                                                                 error_tol)
-                            if bias_success:
-                                break
-
+                        bias_success, iref_mult, nf_bias = find_ratio_match(params['iref'],
+                                                                            bias_op['ibias'],
+                                                                            iref_mult_vec,
+                                                                            error_tol)
                         if not bias_success:
                             continue
 
-                        # Check against spec again, now with full circuit
-                        op_dict = {'in' : in_op,
-                                   'tail' : tail_op,
-                                   'load' : load_op,
-                                   'bias' : bias_op}
-                        nf_dict = {'in' : nf_in,
-                                   'tail' : nf_tail,
-                                   'load' : nf_load,
-                                   'bias' : nf_bias}
-
-                        gain_lti, fbw_lti, ugf_lti, pm_lti = self._get_ss_lti(op_dict=op_dict,
-                                                                              nf_dict=nf_dict,
-                                                                              cload=cload)
-                        
-                        if gain_lti < gain_min or gain_lti > gain_max:
-                            print(f'gain {gain_lti}')
+                        gain_lti, fbw_lti, ugf_lti, pm_lti = (x[i_match] for x in ss_batch)
+                        gain_lo_wc, gain_hi_wc, fbw_wc, ugf_wc, pm_wc = (x[i_match] for x in ss_wc_batch)
+                        ibias_wc = ibias_wc_vec[i_match]
+
+                        # Check the batched evaluator against the full circuit
+                        if ss_verify:
+                            op_dict = {'in' : in_op,
+                                       'tail' : tail_op,
+                                       'load' : load_op,
+                                       'bias' : bias_op}
+                            nf_dict = {'in' : nf_in,
+                                       'tail' : nf_tail,
+                                       'load' : nf_load,
+                                       'bias' : nf_bias}
+                            verify_ss(self._get_ss_lti(op_dict=op_dict, nf_dict=nf_dict, cload=cload),
+                                      (gain_lti, fbw_lti, ugf_lti, pm_lti),
+                                      rtol=ss_rtol)
+
+                        if gain_lo_wc < gain_min or gain_hi_wc > gain_max:
+                            self.reject('gain', (gain_lo_wc, gain_hi_wc))
                             break
 
-                        if fbw_lti < fbw_min:
-                            print(f'fbw {fbw_lti}')
+                        if fbw_wc < fbw_min:
+                            self.reject('fbw', fbw_wc)
+                            continue
+
+                        if ugf_wc < ugf_min:
+                            self.reject('ugf', ugf_wc)
                             continue
 
-                        if ugf_lti < ugf_min:
-                            print(f'ugf {ugf_lti}')
+                        if pm_wc < pm_min:
+                            self.reject('pm', pm_wc)
                             continue
 
-                        if pm_lti < pm_min:
-                            print(f'pm {pm_lti}')
+                        if ibias_wc > ibias_max:
+                            self.reject('ibias', ibias_wc)
                             continue
 
                         viable_op = dict(nf_in=int(nf_in),
@@ -233,16 +320,33 @@ class bag2_analog__amp_diff_mirr_dsn(DesignModule):
                                          op_in=in_op,
                                          op_tail=tail_op,
                                          op_load=load_op)
-                        viable_op_list.append(viable_op)
-                        print("\n(SUCCESS)")
-                        print(viable_op)
-
-        self.other_params = dict(in_type=in_type,
-                                 w_dict={k:db.width_list[0] for k,db in db_dict.items()},
-                                 l_dict=l_dict,
-                                 th_dict=th_dict)
+                        if multi_corner:
+                            viable_op.update(gain_lo_wc=float(gain_lo_wc),
+                                             gain_hi_wc=float(gain_hi_wc),
+                                             fbw_wc=float(fbw_wc),
+                                             ugf_wc=float(ugf_wc),
+                                             pm_wc=float(pm_wc),
+                                             ibias_wc=float(ibias_wc))
+                        logger.debug('(SUCCESS)\n%s', viable_op)
+                        yield viable_op
+
+    def filter_candidates(self, op_list:CandidateTable, **params) -> CandidateTable:
+        """Applies the gain, fbw, ugf, and pm limits to candidates
+        swept without them. Uses the worst case across corners when
+        there are several.
+        """
+        if len(op_list) < 1:
+            return op_list
 
-        return viable_op_list
+        # Same comparisons as iter_spec
+        wc = 'gain_lo_wc' in op_list.columns
+        gain_min, gain_max = params['gain']
+        gain_lo = op_list.column('gain_lo_wc' if wc else 'gain')
+        gain_hi = op_list.column('gain_hi_wc' if wc else 'gain')
+        mask = ~((gain_lo < gain_min) | (gain_hi > gain_max))
+        for name in ('fbw', 'ugf', 'pm'):
+            mask &= ~(op_list.column(f'{name}_wc' if wc else name) < params[name])
+        return op_list.filter(mask)
 
     def _get_ss_lti(self, op_dict:Mapping[str,Any], 
                     nf_dict:Mapping[str,int], 
@@ -273,12 +377,23 @@ class bag2_analog__amp_diff_mirr_dsn(DesignModule):
 
         return gain, fbw, ugf, pm
 
+    def _get_ss_batch(self, op_dict:Mapping[str,Any],
+                      nf_dict:Mapping[str,Any],
+                      cload:float) -> Tuple[np.ndarray,np.ndarray,np.ndarray,np.ndarray]:
+        """Same as _get_ss_lti, but for a whole batch of candidates at once.
+        Operating points and finger counts can be arrays (e.g. from query_batch).
+        """
+        ckt = self.make_ltickt(op_dict=op_dict, nf_dict=nf_dict, cload=cload,
+                               meas_side='both', ckt=SmallSignalBatch())
+        return ckt.get_specs(in_dict={'inp' : 0.5, 'inn' : -0.5}, out_name='out')
+
     def make_ltickt(self, op_dict:Mapping[str,Any], nf_dict:Mapping[str,int], 
-                    cload:float, meas_side:str) -> LTICircuit:
+                    cload:float, meas_side:str, ckt:LTICircuit=None) -> LTICircuit:
         inn_conn = 'gnd' if meas_side=='p' else 'inn'
         inp_conn = 'gnd' if meas_side=='n' else 'inp'
 
-        ckt = LTICircuit()
+        if ckt == None:
+            ckt = LTICircuit()
         ckt.add_transistor(op_dict['tail'], 'tail', 'gnd', 'gnd', fg=nf_dict['tail'])
         ckt.add_transistor(op_dict['in'], 'out', inn_conn, 'tail', fg=nf_dict['in'])
         ckt.add_transistor(op_dict['in'], 'outx', inp_conn, 'tail', fg=nf_dict['in'])
@@ -6,11 +6,13 @@ import os
 import pkg_resources
 import numpy as np
 import warnings
+import logging
 
 from bag.design.module import Module
 from . import DesignModule, get_mos_db, estimate_vth, parallel, verify_ratio, num_den_add
 from bag.data.lti import LTICircuit, get_w_3db, get_stability_margins, get_w_crossings
 
+logger = logging.getLogger(__name__)
 
 # noinspection PyPep8Naming
 class bag2_analog__amp_diff_mirr_bias_dsn(DesignModule):
@@ -110,7 +112,7 @@ class bag2_analog__amp_diff_mirr_bias_dsn(DesignModule):
         vtail_min = vstar_min if n_in else vincm - vth_in + vstar_in_min
         vtail_max = vincm - vth_in - vstar_in_min if n_in else vdd - vstar_min
         vtail_vec = np.arange(vtail_min, vtail_max, res_vstep)
-        print(f'Sweeping tail from {vtail_min} to {vtail_max}')
+        logger.info('Sweeping tail from %s to %s', vtail_min, vtail_max)
 
         for vtail in vtail_vec:
             # Sweep output common mode or use taken-in optional parameter
@@ -149,7 +151,7 @@ class bag2_analog__amp_diff_mirr_bias_dsn(DesignModule):
                                                        error_tol)
                     if not match_load:
                         # assert False, 'blep'
-                        print(f"Load match {nf_load}")
+                        self.reject('load_match', nf_load)
                         continue
 
                     # Design tail to current match
@@ -165,7 +167,7 @@ class bag2_analog__amp_diff_mirr_bias_dsn(DesignModule):
                                                              nf_in,
                                                              error_tol)
                         if not tail_success:
-                            print('Tail match')
+                            self.reject('tail_match')
                             continue
 
                         # Check against spec again, now with full circuit
@@ -181,19 +183,19 @@ class bag2_analog__amp_diff_mirr_bias_dsn(DesignModule):
                                                                               cload=cload)
 
                         if gain_lti < gain_min or gain_lti > gain_max:
-                            print(f'gain {gain_lti}')
+                            self.reject('gain', gain_lti)
                             break
 
                         if fbw_lti < fbw_min:
-                            print(f'fbw {fbw_lti}')
+                            self.reject('fbw', fbw_lti)
                             continue
 
                         if ugf_lti < ugf_min:
-                            print(f'ugf {ugf_lti}')
+                            self.reject('ugf', ugf_lti)
                             continue
 
                         if pm_lti < pm_min:
-                            print(f'pm {pm_lti}')
+                            self.reject('pm', pm_lti)
                             continue
 
                         viable_op = dict(nf_in=int(nf_in),
@@ -211,8 +213,7 @@ class bag2_analog__amp_diff_mirr_bias_dsn(DesignModule):
                                          op_tail=tail_op,
                                          op_load=load_op)
                         viable_op_list.append(viable_op)
-                        print("\n(SUCCESS)")
-                        print(viable_op)
+                        logger.debug('(SUCCESS)\n%s', viable_op)
 
         self.other_params = dict(in_type=in_type,
                                  w_dict={k: db.width_list[0] for k, db in db_dict.items()},
@@ -9,13 +9,16 @@ from math import isnan
 from pprint import pprint
 from math import floor
 import warnings
+import logging
 
 from bag.core import BagProject
 from bag.design.module import Module
-from . import DesignModule, get_mos_db, estimate_vth, parallel, verify_ratio, num_den_add
+from . import DesignModule, get_mos_db, estimate_vth, parallel, verify_ratio, verify_ratio_vec, num_den_add, query_batch, op_from_batch, SmallSignalBatch, verify_ss, VerificationQueue, prepare_testbench, release_testbench
 from bag.data.lti import LTICircuit, get_w_3db, get_stability_margins, get_w_crossings
 from bag.io import load_sim_results, save_sim_results, load_sim_file
 
+logger = logging.getLogger(__name__)
+
 # noinspection PyPep8Naming
 class bag2_analog__amp_folded_cascode_dsn(DesignModule):
     """Module for library bag2_analog cell amp_folded_cascode.
@@ -24,6 +27,9 @@ class bag2_analog__amp_folded_cascode_dsn(DesignModule):
     devices in the cascode have their drains shorted together.
     """
 
+    adaptive_sweep_keys = ('vtail', 'vout1', 'vgtail', 'vg_same_outer', 'voutcm', 'vg_same_inner',
+                           'vd_opp_outer', 'vg_opp_inner', 'vg_opp_outer')
+
     @classmethod
     def get_params_info(cls) -> Mapping[str,str]:
         # type: () -> Dict[str, str]
@@ -57,7 +63,11 @@ class bag2_analog__amp_folded_cascode_dsn(DesignModule):
             tb_params = 'Parameters applicable to the testbench, e.g. tb_lib, tb_cell, impl_lib, etc.',
             optional_params = 'Optional parameters. voutcm=output bias voltage, \
                                 run_sim=True to verify with simulation, False for only LTICircuit. \
-                                vstar_min, error_tol, res_vstep',
+                                sim_workers=number of simulations to run at once with run_sim (default 1), \
+                                vstar_min, error_tol, res_vstep, \
+                                ss_verify=check batched small-signal results against LTICircuit, ss_rtol, \
+                                prune_slack=relative margin on bounds used to skip sweep points, \
+                                res_vstep_coarse=coarse step for an adaptive sweep, res_vwindow',
         ))
         return ans
 
@@ -99,8 +109,12 @@ class bag2_analog__amp_folded_cascode_dsn(DesignModule):
         cload = params['cload']
         tb_params = params['tb_params']
 
-        # To be used when instantiating testbenches further down
-        prj = BagProject()
+        # Candidates which pass LTI checks are simulated after the sweep.
+        # Jobs are tagged (sweep group, tb_num): a failed simulated gain skips
+        # the rest of its group, as a failed LTI gain does in the sweep.
+        sim_queue = VerificationQueue(self.sim_backend, optional_params.get('sim_workers', 1))
+        sim_op_dict = dict()
+        sim_group = 0
         tb_num = 0
 
         assert not diff_out, f'Currently only supports single-ended output with self-biasing'
@@ -115,6 +129,9 @@ class bag2_analog__amp_folded_cascode_dsn(DesignModule):
         vstar_min = optional_params.get('vstar_min', 0.2)
         error_tol = optional_params.get('error_tol', 0.05)
         res_vstep = optional_params.get('res_vstep', 10e-3)
+        ss_verify = optional_params.get('ss_verify', False)
+        ss_rtol = optional_params.get('ss_rtol', 1e-3)
+        prune_slack = optional_params.get('prune_slack', 0.1)
 
         # Estimate threshold of each device TODO can this be more generalized?
         n_in = in_type=='n'
@@ -153,12 +170,12 @@ class bag2_analog__amp_folded_cascode_dsn(DesignModule):
         ### 1. Tail voltage
         vtail_min = vstar_min if n_in else vincm-vth_in
         vtail_max = vincm-vth_in if n_in else vdd-vstar_min
-        vtail_vec = np.arange(vtail_min, vtail_max, res_vstep)
+        vtail_vec = self.sweep_range('vtail', np.arange(vtail_min, vtail_max, res_vstep))
 
         ### 2. Vout1
         vout1_min = vincm-vth_in if n_in else vstar_min
         vout1_max = vdd-vstar_min if n_in else vincm-vth_in
-        vout1_vec = np.arange(max(0, vout1_min), min(vdd, vout1_max), res_vstep)
+        vout1_vec = self.sweep_range('vout1', np.arange(max(0, vout1_min), min(vdd, vout1_max), res_vstep))
         if len(vout1_vec) < 1:
             return []
 
@@ -166,18 +183,29 @@ class bag2_analog__amp_folded_cascode_dsn(DesignModule):
             # check: viable vgtail values
             vgtail_min = vth_tail+vstar_min if n_in else vtail+vth_tail
             vgtail_max = vtail+vth_tail if n_in else vdd+vth_tail-vstar_min
-            vgtail_vec = np.arange(vgtail_min, vgtail_max, res_vstep)
+            vgtail_vec = self.sweep_range('vgtail', np.arange(vgtail_min, vgtail_max, res_vstep))
             if len(vgtail_vec) < 1:
                 continue
+
+            # op: tail, for every tail gate voltage at once
+            op_tail_batch = query_batch(db_dict['tail'], vgs=vgtail_vec-vb_tail, vds=vtail-vb_tail, vbs=0)
             
             for vout1 in vout1_vec:
                 # op: input pair
                 op_in = db_dict['in'].query(vgs=vincm-vtail, vds=vout1-vtail, vbs=vb_in-vtail)
 
+                # The output pole is at most gout/cload and gain at most gm_in/gout, so
+                # gain-bandwidth and UGF are at most gm_in/cload with the largest input
+                # pair that fits in the current budget
+                nf_in_bound = ibias_max/(2*op_in['ibias'])
+                gbw_bound = nf_in_bound*op_in['gm']/(2*np.pi*cload)
+                if self.prune('vout1', gbw_bound*(1+prune_slack) < max(ugf_min, gain_min*fbw_min)):
+                    continue
+
                 ### 3. Outer same gate
                 vg_same_outer_min = vout1+vth_p if n_in else vth_n+vstar_min
                 vg_same_outer_max = vdd+vth_p-vstar_min if n_in else vout1+vth_n
-                vg_same_outer_vec = np.arange(max(0, vg_same_outer_min), min(vdd, vg_same_outer_max), res_vstep)
+                vg_same_outer_vec = self.sweep_range('vg_same_outer', np.arange(max(0, vg_same_outer_min), min(vdd, vg_same_outer_max), res_vstep))
 
                 ### 4. Output bias point
                 if diode_inner and diode_outer:
@@ -192,7 +220,7 @@ class bag2_analog__amp_folded_cascode_dsn(DesignModule):
                 
                 voutcm_opt = optional_params.get('voutcm', None)
                 if voutcm_opt == None:
-                    voutcm_vec = np.arange(max(0, voutcm_min), min(vdd, voutcm_max), res_vstep)
+                    voutcm_vec = self.sweep_range('voutcm', np.arange(max(0, voutcm_min), min(vdd, voutcm_max), res_vstep))
                 else:
                     if voutcm_opt < voutcm_min or voutcm_opt > voutcm_max:
                         continue
@@ -208,7 +236,7 @@ class bag2_analog__amp_folded_cascode_dsn(DesignModule):
                         ### 5. Inner same gate
                         vg_same_inner_min = voutcm+vth_p if n_in else vout1+vth_n+vstar_min
                         vg_same_inner_max = vout1+vth_p-vstar_min if n_in else voutcm+vth_n
-                        vg_same_inner_vec = np.arange(max(0, vg_same_inner_min), min(vdd, vg_same_inner_max), res_vstep)
+                        vg_same_inner_vec = self.sweep_range('vg_same_inner', np.arange(max(0, vg_same_inner_min), min(vdd, vg_same_inner_max), res_vstep))
 
                         ### 6. Opposite outer drain
                         if opp_drain_conn[0] == '':
@@ -218,7 +246,7 @@ class bag2_analog__amp_folded_cascode_dsn(DesignModule):
                             assert (n_in and opp_drain_conn[0] == 'GN<0>') or ((not n_in) and (opp_drain_conn[0] == 'GP<0>')), f'Drain of outer opposite device should either be left free or tied to its gate ({op_drain_conn[0]})'
                             vd_opp_outer_min = vth_n+vstar_min if n_in else voutcm-vth_p+vstar_min
                             vd_opp_outer_max = voutcm-vth_n-vstar_min if n_in else vdd+vth_p-vstar_min
-                        vd_opp_outer_vec = np.arange(max(0, vd_opp_outer_min), min(vdd, vd_opp_outer_max), res_vstep)
+                        vd_opp_outer_vec = self.sweep_range('vd_opp_outer', np.arange(max(0, vd_opp_outer_min), min(vdd, vd_opp_outer_max), res_vstep))
                         if len(vd_opp_outer_vec) < 1: 
                             continue
 
@@ -233,7 +261,7 @@ class bag2_analog__amp_folded_cascode_dsn(DesignModule):
                                 else:
                                     vg_opp_inner_min = vd_opp_outer+vth_n+vstar_min if n_in else voutcm+vth_p
                                     vg_opp_inner_max = voutcm+vth_n if n_in else vd_opp_outer+vth_p-vstar_min
-                                    vg_opp_inner_vec = np.arange(max(0, vg_opp_inner_min), min(vdd, vg_opp_inner_max), res_vstep)
+                                    vg_opp_inner_vec = self.sweep_range('vg_opp_inner', np.arange(max(0, vg_opp_inner_min), min(vdd, vg_opp_inner_max), res_vstep))
 
                                 for vg_opp_inner in vg_opp_inner_vec:
                                     # op: opposite inner
@@ -247,7 +275,7 @@ class bag2_analog__amp_folded_cascode_dsn(DesignModule):
                                     else:
                                         vg_opp_outer_min = vth_n+vstar_min if n_in else vd_opp_outer+vth_p
                                         vg_opp_outer_max = vd_opp_outer+vth_n if n_in else vdd+vth_p-vstar_min
-                                        vg_opp_outer_vec = np.arange(max(0, vg_opp_outer_min), min(vdd, vg_opp_outer_max), res_vstep)
+                                        vg_opp_outer_vec = self.sweep_range('vg_opp_outer', np.arange(max(0, vg_opp_outer_min), min(vdd, vg_opp_outer_max), res_vstep))
                                     
                                     for vg_opp_outer in vg_opp_outer_vec:
                                         # op: opposite outer
@@ -256,11 +284,17 @@ class bag2_analog__amp_folded_cascode_dsn(DesignModule):
                                         ### 9. Opposite outer size
                                         nf_same_outer_max = int(floor(ibias_max/op_same_outer['ibias'] * 0.5))
                                         nf_same_outer_vec = np.arange(1, nf_same_outer_max, 1)
+                                        sim_group = sim_group + 1
                                         for nf_same_outer in nf_same_outer_vec:
                                             ### 10. Partition current between branches
                                             ibranch_big = op_same_outer['ibias']*nf_same_outer
                                             nf_in_max = int(floor(ibranch_big/op_in['ibias']))
                                             nf_in_vec = np.arange(1, nf_in_max, 1)
+
+                                            # Same bound as for vout1, now with this branch current
+                                            gbw_bound = nf_in_max*op_in['gm']/(2*np.pi*cload)
+                                            if self.prune('nf_same_outer', gbw_bound*(1+prune_slack) < max(ugf_min, gain_min*fbw_min)):
+                                                continue
                                             for nf_in in nf_in_vec:
                                                 ibranch_in = op_in['ibias']*nf_in
                                                 ibranch_small = ibranch_big - ibranch_in
@@ -285,52 +319,79 @@ class bag2_analog__amp_folded_cascode_dsn(DesignModule):
                                                     continue
 
                                                 ### 11. Size tail
-                                                for vgtail in vgtail_vec:
-                                                    # op: tail
-                                                    op_tail = db_dict['tail'].query(vgs=vgtail-vb_tail, vds=vtail-vb_tail, vbs=0)
-
-                                                    match_tail, nf_tail = verify_ratio(ibranch_in*2,
-                                                                                       op_tail['ibias'],
-                                                                                       1, error_tol)
-
-                                                    if not match_tail:
-                                                        continue
-
-                                                    ### Checking against spec
-                                                    # Preliminary checks of gain, bandwidth (to avoid too many sims)
-                                                    op_dict = {'in' : op_in,
-                                                               'tail' : op_tail,
-                                                               'same_outer' : op_same_outer,
-                                                               'same_inner' : op_same_inner,
-                                                               'opp_inner' : op_opp_inner,
-                                                               'opp_outer' : op_opp_outer}
-
-                                                    nf_dict = {'in' : nf_in,
-                                                               'tail' : nf_tail,
-                                                               'same_outer' : nf_same_outer,
-                                                               'same_inner' : nf_same_inner,
-                                                               'opp_inner' : nf_opp_inner,
-                                                               'opp_outer' : nf_opp_outer}
+                                                match_tail_vec, nf_tail_vec = verify_ratio_vec(ibranch_in*2,
+                                                                                               op_tail_batch['ibias'],
+                                                                                               1, error_tol)
+                                                idx_tail_vec = np.flatnonzero(match_tail_vec)
+                                                if len(idx_tail_vec) < 1:
+                                                    continue
 
-                                                    gain_lti, fbw_lti, ugf_lti, pm_lti = self._get_ss_lti(op_dict=op_dict,
-                                                                                                 nf_dict=nf_dict,
-                                                                                                 opp_drain_conn=opp_drain_conn,
-                                                                                                 cload=cload)
+                                                ### Checking against spec
+                                                # Preliminary checks of gain, bandwidth (to avoid too many sims),
+                                                # for every matched tail at once
+                                                ss_op_dict = {'in' : op_in,
+                                                              'tail' : {k:v[idx_tail_vec] for k,v in op_tail_batch.items()},
+                                                              'same_outer' : op_same_outer,
+                                                              'same_inner' : op_same_inner,
+                                                              'opp_inner' : op_opp_inner,
+                                                              'opp_outer' : op_opp_outer}
+
+                                                ss_nf_dict = {'in' : nf_in,
+                                                              'tail' : nf_tail_vec[idx_tail_vec],
+                                                              'same_outer' : nf_same_outer,
+                                                              'same_inner' : nf_same_inner,
+                                                              'opp_inner' : nf_opp_inner,
+                                                              'opp_outer' : nf_opp_outer}
+
+                                                ss_batch = self._get_ss_batch(op_dict=ss_op_dict,
+                                                                              nf_dict=ss_nf_dict,
+                                                                              opp_drain_conn=opp_drain_conn,
+                                                                              cload=cload)
+
+                                                for i_match, i_gtail in enumerate(idx_tail_vec):
+                                                    vgtail = vgtail_vec[i_gtail]
+                                                    op_tail = op_from_batch(op_tail_batch, i_gtail)
+                                                    nf_tail = nf_tail_vec[i_gtail]
+
+                                                    gain_lti, fbw_lti, ugf_lti, pm_lti = (x[i_match] for x in ss_batch)
+
+                                                    # Check the batched evaluator against the full circuit
+                                                    if ss_verify:
+                                                        op_dict = {'in' : op_in,
+                                                                   'tail' : op_tail,
+                                                                   'same_outer' : op_same_outer,
+                                                                   'same_inner' : op_same_inner,
+                                                                   'opp_inner' : op_opp_inner,
+                                                                   'opp_outer' : op_opp_outer}
+
+                                                        nf_dict = {'in' : nf_in,
+                                                                   'tail' : nf_tail,
+                                                                   'same_outer' : nf_same_outer,
+                                                                   'same_inner' : nf_same_inner,
+                                                                   'opp_inner' : nf_opp_inner,
+                                                                   'opp_outer' : nf_opp_outer}
+
+                                                        verify_ss(self._get_ss_lti(op_dict=op_dict,
+                                                                                   nf_dict=nf_dict,
+                                                                                   opp_drain_conn=opp_drain_conn,
+                                                                                   cload=cload),
+                                                                  (gain_lti, fbw_lti, ugf_lti, pm_lti),
+                                                                  rtol=ss_rtol)
 
                                                     if gain_lti < gain_min:
-                                                        print(f'gain {gain_lti}')
+                                                        self.reject('gain', gain_lti)
                                                         break
 
                                                     if fbw_lti < fbw_min:
-                                                        print(f'fbw {fbw_lti}')
+                                                        self.reject('fbw', fbw_lti)
                                                         continue
 
                                                     if ugf_lti < ugf_min:
-                                                        print(f'ugf {ugf_lti}')
+                                                        self.reject('ugf', ugf_lti)
                                                         continue
 
                                                     if pm_lti < pm_min:
-                                                        print(f'pm {pm_lti}')
+                                                        self.reject('pm', pm_lti)
                                                         continue
 
                                                     # Simulate checks for gain, bandwidth, and unity gain PM
@@ -371,38 +432,19 @@ class bag2_analog__amp_folded_cascode_dsn(DesignModule):
                                                                        VGTAIL=vgtail,
                                                                        VIN_AC=1,
                                                                        VIN_DC=vincm)
-                                                        tb_params = dict(tb_params)
-                                                        tb_params.update(dict(prj=prj,
-                                                                              params=tb_sch_params,
-                                                                              tb_vars=tb_vars,
-                                                                              num=tb_num))
+                                                        tb_spec = dict(tb_lib=tb_params['tb_lib'],
+                                                                       tb_cell=tb_params['tb_cell'],
+                                                                       impl_lib=tb_params['impl_lib'],
+                                                                       tb_gen_name=self._get_tb_gen_name(tb_params['tb_gen_name'], tb_num),
+                                                                       params=tb_sch_params,
+                                                                       tb_vars=tb_vars)
+                                                        sim_queue.submit((sim_group, tb_num), tb_spec, self._get_ss_results)
+                                                        sim_op_dict[tb_num] = op
                                                         tb_num = tb_num + 1
-
-                                                        print('Simulating...')
-                                                        gain_sim, fbw_sim, ugf_sim, pm_sim = self._get_ss_sim(**tb_params)
-                                                        print('...done')
-
-                                                        # Check small signal FoM against spec
-                                                        if gain_sim < gain_min:
-                                                            print(f'\tgain sim/lti: {gain_sim}/{gain_lti}')
-                                                            break
-                                                        if fbw_sim < fbw_min:
-                                                            print(f'\tfbw sim/lti {fbw_sim}/{fbw_lti}')
-                                                            # raise ValueError("Pauses")
-                                                            continue
-                                                        if ugf_sim < ugf_min:
-                                                            print(f'\tugf sim/lti: {ugf_sim}/{ugf_lti}')
-                                                            continue
-                                                        if pm_sim < pm_min:
-                                                            print(f'\tpm {pm_sim}')
-                                                            continue
-                                                        
-                                                        # Swap out LTICircuit values for simultaed values
-                                                        op.update(gain=gain_sim, fbw=fbw_sim, pm=pm_sim, ugf=ugf_sim)
+                                                        continue
                                                     
                                                     viable_op_list.append(op)
-                                                    print("(SUCCESS)")
-                                                    pprint(op)
+                                                    logger.debug('(SUCCESS)\n%s', op)
                                                 else:
                                                     continue
                                                 break
@@ -410,6 +452,42 @@ class bag2_analog__amp_folded_cascode_dsn(DesignModule):
                                                 continue
                                             break
 
+        if len(sim_queue) > 0:
+            logger.info('Simulating %d candidates...', len(sim_queue))
+        sim_result_dict = dict()
+        gain_fail_dict = dict() # {sim_group : first tb_num failing gain}
+        for (sim_group, tb_num), (gain_sim, fbw_sim, ugf_sim, pm_sim) in sim_queue.run():
+            op = sim_op_dict[tb_num]
+            # Check small signal FoM against spec
+            if gain_sim < gain_min:
+                self.reject('gain_sim', (gain_sim, op['gain']))
+                # Later candidates in the group would not have been reached
+                gain_fail_dict[sim_group] = min(tb_num, gain_fail_dict.get(sim_group, tb_num))
+                sim_queue.cancel(lambda tag, g=sim_group, n=tb_num: tag[0] == g and tag[1] > n)
+                continue
+            if fbw_sim < fbw_min:
+                self.reject('fbw_sim', (fbw_sim, op['fbw']))
+                continue
+            if ugf_sim < ugf_min:
+                self.reject('ugf_sim', (ugf_sim, op['ugf']))
+                continue
+            if pm_sim < pm_min:
+                self.reject('pm_sim', pm_sim)
+                continue
+
+            # Swap out LTICircuit values for simultaed values
+            op.update(gain=gain_sim, fbw=fbw_sim, pm=pm_sim, ugf=ugf_sim)
+            sim_result_dict[tb_num] = (sim_group, op)
+            logger.debug('(SUCCESS)\n%s', op)
+
+        # In submission order so the result doesn't depend on simulation
+        # times. Candidates after a failed gain in their group are dropped
+        # even if they were already simulated, as they'd be skipped serially
+        for tb_num in sorted(sim_result_dict.keys()):
+            sim_group, op = sim_result_dict[tb_num]
+            if tb_num < gain_fail_dict.get(sim_group, np.inf):
+                viable_op_list.append(op)
+
         return viable_op_list
 
     def _get_tb_gen_name(self, base, num):
@@ -432,35 +510,32 @@ class bag2_analog__amp_folded_cascode_dsn(DesignModule):
             pm: Unity gain phase margin in degrees (not calculated in feedback,
                 calculated using the simulated open loop gain and phase)
         '''
-        prj = spec['prj']
-        tb_vars = spec['tb_vars']
-        tb_lib = spec['tb_lib']
-        tb_cell = spec['tb_cell']
-        impl_lib = spec['impl_lib']
-        impl_cell = spec['impl_cell']
         tb_gen_name = self._get_tb_gen_name(spec['tb_gen_name'], spec['num'])
-
-        # Generate testbench schematic
-        tb_dsn = prj.create_design_module(tb_lib, tb_cell)
-        tb_dsn.design(**(spec['params']))
-        tb_dsn.implement_design(impl_lib, top_cell_name=tb_gen_name)
-
-        # Copy and load ADEXL state of generated testbench
-        tb_obj = prj.configure_testbench(impl_lib, tb_gen_name)
-
-        # Assign testbench design variables (the ones that show in ADE)
-        for param_name, param_val in tb_vars.items():
-            tb_obj.set_parameter(param_name, param_val)
-
-        # Update testbench changes and run simulation
-        tb_obj.update_testbench()
-        print(f'Simulating testbench {tb_gen_name}')
+        tb_obj = prepare_testbench(prj=spec['prj'],
+                                   tb_lib=spec['tb_lib'],
+                                   tb_cell=spec['tb_cell'],
+                                   impl_lib=spec['impl_lib'],
+                                   tb_gen_name=tb_gen_name,
+                                   params=spec['params'],
+                                   tb_vars=spec['tb_vars'])
+
+        # Run simulation
+        logger.info('Simulating testbench %s', tb_gen_name)
         save_dir = tb_obj.run_simulation()
 
         # Load simulation results into Python
-        print("Simulation done, loading results")
+        logger.info('Simulation done, loading results')
         results = load_sim_results(save_dir)
+        release_testbench(tb_obj)
+        return self._get_ss_results(results)
 
+    def _get_ss_results(self, results:Mapping[str,Any]) -> Tuple[float,float,float,float]:
+        '''
+        Inputs:
+            results: Loaded results of the small-signal testbench.
+        Outputs:
+            Same as _get_ss_sim.
+        '''
         gain = results['acVal_gain']
         fbw = results['acVal_f3dB']
         ugf = results.get('acVal_ugf', -1)
@@ -471,7 +546,7 @@ class bag2_analog__amp_folded_cascode_dsn(DesignModule):
 
     def make_ltickt(self, op_dict:Mapping[str,Any], nf_dict:Mapping[str,int], 
                     cload:float, opp_drain_conn:Mapping[str,str],
-                    meas_side:str) -> LTICircuit:
+                    meas_side:str, ckt:LTICircuit=None) -> LTICircuit:
         '''
         Constructs and LTICircuit for the amplifier.
         Input dictionary keys must include:
@@ -488,6 +563,8 @@ class bag2_analog__amp_folded_cascode_dsn(DesignModule):
             meas_side: p = only p-input connected (n-input is held at AC ground); n = only n-input
                 connected (p-input is held at AC ground); anything else = both inputs are
                 connected to AC inputs
+            ckt: Circuit to add the devices to, e.g. a SmallSignalBatch. A new LTICircuit
+                if None.
         Output:
             LTICircuit object of this amplifier with inputs as inp and/or inn, output as out.
         '''
@@ -499,7 +576,8 @@ class bag2_analog__amp_folded_cascode_dsn(DesignModule):
         highswing_outer = opp_drain_conn[1] in ('GN<0>', 'GP<0>')
 
         opp_drain_conn_conv = [conv_drain_conn(d_conn) for d_conn in opp_drain_conn]
-        ckt = LTICircuit()
+        if ckt == None:
+            ckt = LTICircuit()
 
         # Input pair
         inp_conn = 'gnd' if meas_side=='n' else 'inp'
@@ -580,6 +658,25 @@ class bag2_analog__amp_folded_cascode_dsn(DesignModule):
 
         return gain, fbw, ugf, pm
 
+    def _get_ss_batch(self, op_dict:Mapping[str,Any],
+                      nf_dict:Mapping[str,Any],
+                      opp_drain_conn:Mapping[str,str],
+                      cload:float) -> Tuple[np.ndarray,np.ndarray,np.ndarray,np.ndarray]:
+        '''
+        Same as _get_ss_lti, but for a whole batch of candidates at once.
+        Inputs:
+            op_dict: Dictionary of operating points. Values can be query_batch outputs.
+            nf_dict: Dictionary of number of fingers for devices. Values can be arrays.
+            opp_drain_conn: Drain connection dictionary, a la n_drain_conn or p_drain_conn
+            cload: Load capacitance in farads.
+        Outputs:
+            gain, fbw, ugf, pm: Arrays of the same figures of merit as _get_ss_lti.
+        '''
+        ckt = self.make_ltickt(op_dict=op_dict, nf_dict=nf_dict, meas_side='both',
+                               opp_drain_conn=opp_drain_conn, cload=cload,
+                               ckt=SmallSignalBatch())
+        return ckt.get_specs(in_dict={'inp' : 0.5, 'inn' : -0.5}, out_name='out')
+
     def op_compare(self, op1:Mapping[str,Any], op2:Mapping[str,Any]):
         """Returns the best operating condition based on 
         minimizing bias current.
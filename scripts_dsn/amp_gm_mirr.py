@@ -5,13 +5,16 @@ from typing import Mapping, Tuple, Any
 import os
 import pkg_resources
 import numpy as np
+import logging
 from pprint import pprint
 from math import floor
 
 from bag.design.module import Module
-from . import DesignModule, get_mos_db, estimate_vth, parallel, verify_ratio, num_den_add
+from . import DesignModule, get_mos_db, estimate_vth, parallel, verify_ratio_vec, find_ratio_match, num_den_add, SmallSignalBatch, verify_ss, query_batch, op_from_batch
 from bag.data.lti import LTICircuit, get_w_3db, get_stability_margins, get_w_crossings
 
+logger = logging.getLogger(__name__)
+
 # noinspection PyPep8Naming
 class bag2_analog__amp_gm_mirr_dsn(DesignModule):
     """Module for library bag2_analog cell amp_gm_mirr.
@@ -48,7 +51,7 @@ class bag2_analog__amp_gm_mirr_dsn(DesignModule):
             iref = 'Reference current in amperes for biasing',
             cload = 'Output load capacitance in farads.',
             optional_params = 'Optional parameters. voutcm=output bias voltage, error_tol, \
-                res_vstep, vstar_min'
+                res_vstep, vstar_min, ss_verify=check batched small-signal results against LTICircuit, ss_rtol'
         ))
         return ans
 
@@ -89,6 +92,8 @@ class bag2_analog__amp_gm_mirr_dsn(DesignModule):
         vout_opt = optional_params.get('voutcm', None)
         error_tol = optional_params.get('error_tol', 0.1)
         res_vstep = optional_params.get('res_vstep', 10e-3)
+        ss_verify = optional_params.get('ss_verify', False)
+        ss_rtol = optional_params.get('ss_rtol', 1e-3)
 
         # Estimate threshold of each device TODO can this be more generalized?
         n_in = in_type=='n'
@@ -116,6 +121,24 @@ class bag2_analog__amp_gm_mirr_dsn(DesignModule):
         vtail_max = vincm-vth_in-vstar_in_min if n_in else vdd-vstar_min
         vtail_vec = np.arange(vtail_min, vtail_max, res_vstep)
         for vtail in vtail_vec:
+            # Tail and bias operating points for every tail gate voltage
+            # (see 5.), which only depend on the tail voltage
+            vgtail_min = vth_tail+vstar_min if n_in else vtail+vth_tail
+            vgtail_max = vtail+vth_tail if n_in else vdd+vth_tail-vstar_min
+            vgtail_vec = np.arange(vgtail_min, vgtail_max, 10e-3)
+            if len(vgtail_vec) < 1:
+                continue
+            tail_op_batch = query_batch(db_dict['tail'],
+                                        vgs=vgtail_vec-vb_tail,
+                                        vds=vtail-vb_tail,
+                                        vbs=0)
+            bias_op_batch = query_batch(db_dict['tail'],
+                                        vgs=vgtail_vec-vb_tail,
+                                        vds=vgtail_vec-vb_tail,
+                                        vbs=0)
+            tail_op_list = [op_from_batch(tail_op_batch, i) for i in range(len(vgtail_vec))]
+            bias_op_list = [op_from_batch(bias_op_batch, i) for i in range(len(vgtail_vec))]
+
             ### 2. Sweep out1 common mode
             vout1_min = vincm-vth_in if n_in else vstar_min+vth_load
             vout1_max = vdd+vth_load-vstar_min if n_in else vincm-vth_in
@@ -145,100 +168,119 @@ class bag2_analog__amp_gm_mirr_dsn(DesignModule):
                                                     vbs=0)
                     nf_in_max = int(floor(ibias_max/in_op['ibias'] * 0.5))
                     nf_in_vec = np.arange(2, nf_in_max, 2)
+                    # Match device sizing for input and load for all sizes at once
+                    match_load_vec, nf_load_vec = verify_ratio_vec(in_op['ibias'],
+                                                                   load_op['ibias'],
+                                                                   nf_in_vec, error_tol)
                     ### 4. Step input device size (integer steps)
-                    for nf_in in nf_in_vec:
+                    for nf_in, match_load, nf_load in zip(nf_in_vec, match_load_vec, nf_load_vec):
                         itail = in_op['ibias'] * 2*nf_in
 
-                        # Match device sizing for input and load
-                        match_load, nf_load = verify_ratio(in_op['ibias'],
-                                                           load_op['ibias'],
-                                                           nf_in, error_tol)
-
                         if not match_load:
-                            # print('load match')
+                            self.reject('load_match')
                             continue
 
-                        ### 5. Design tail to current match
-                        vgtail_min = vth_tail+vstar_min if n_in else vtail+vth_tail
-                        vgtail_max = vtail+vth_tail if n_in else vdd+vth_tail-vstar_min
-                        vgtail_vec = np.arange(vgtail_min, vgtail_max, 10e-3)
-                        for vgtail in vgtail_vec:
-                            tail_op = db_dict['tail'].query(vgs=vgtail-vb_tail,
-                                                            vds=vtail-vb_tail,
-                                                            vbs=0)
-                            bias_op = db_dict['tail'].query(vgs=vgtail-vb_tail,
-                                                            vds=vgtail-vb_tail,
-                                                            vbs=0)
-                            tail_success, nf_tail = verify_ratio(in_op['ibias']*2,
-                                                                 tail_op['ibias'],
-                                                                 nf_in, error_tol)
-                            if not tail_success:
-                                # print('tail match')
+                        ### 5. Design tail to current match for every tail gate voltage at once
+                        tail_success_vec, nf_tail_vec = verify_ratio_vec(in_op['ibias']*2,
+                                                                         tail_op_batch['ibias'],
+                                                                         nf_in, error_tol)
+                        for i_gtail, vgtail in enumerate(vgtail_vec):
+                            tail_op = tail_op_list[i_gtail]
+                            bias_op = bias_op_list[i_gtail]
+                            nf_tail = nf_tail_vec[i_gtail]
+                            if not tail_success_vec[i_gtail]:
+                                self.reject('tail_match')
                                 continue
 
                             ### 6. Step flip device size (integer steps)
                             ibias_left = ibias_max - itail
                             nf_flip_max = int(floor(ibias_left/flip_op['ibias'] * 0.5))
                             nf_flip_vec = np.arange(2, nf_flip_max, 2)
-                            for nf_flip in nf_flip_vec:
-                                # Match load copy device
-                                match_load_copy, nf_load_copy = verify_ratio(flip_op['ibias'],
-                                                                             load_copy_op['ibias'],
-                                                                             nf_flip, error_tol)
-                                if not match_load_copy:
-                                    # print('load copy match')
-                                    continue
+
+                            # Match load copy device for every flip size at once
+                            match_load_copy_vec, nf_load_copy_vec = verify_ratio_vec(flip_op['ibias'],
+                                                                                     load_copy_op['ibias'],
+                                                                                     nf_flip_vec, error_tol)
+                            nf_flip_vec = nf_flip_vec[match_load_copy_vec]
+                            nf_load_copy_vec = nf_load_copy_vec[match_load_copy_vec]
+                            if len(nf_flip_vec) < 1:
+                                self.reject('load_copy_match')
+                                continue
+
+                            # Small-signal figures of merit for every flip size at once
+                            ss_op_dict = {'in' : in_op,
+                                          'tail' : tail_op,
+                                          'load' : load_op,
+                                          'load_copy': load_copy_op,
+                                          'flip' : flip_op}
+                            ss_nf_dict = {'in' : nf_in,
+                                          'tail' : nf_tail,
+                                          'load' : nf_load,
+                                          'load_copy': nf_load_copy_vec,
+                                          'flip' : nf_flip_vec}
+                            ss_batch = self._get_ss_batch(op_dict=ss_op_dict,
+                                                          nf_dict=ss_nf_dict,
+                                                          cload=cload)
+
+                            for i_flip, nf_flip in enumerate(nf_flip_vec):
+                                nf_load_copy = nf_load_copy_vec[i_flip]
 
                                 ### 7. Design bias source/sink
                                 iref_mult_max = (ibias_max - itail - nf_flip*2*flip_op['ibias']) // iref_unit
                                 iref_mult_vec = np.arange(1, iref_mult_max, 1)
-                                for iref_mult in iref_mult_vec:
-                                    bias_success, nf_bias = verify_ratio(iref_unit,
-                                                                         bias_op['ibias'],
-                                                                         iref_mult,
-                                                                         error_tol)
-                                    if bias_success:
-                                        break
+                                bias_success, iref_mult, nf_bias = find_ratio_match(iref_unit,
+                                                                                    bias_op['ibias'],
+                                                                                    iref_mult_vec,
+                                                                                    error_tol)
                                 if not bias_success:
                                     continue
 
-                                op_dict = {'in' : in_op,
-                                           'tail' : tail_op,
-                                           'load' : load_op,
-                                           'load_copy': load_copy_op,
-                                           'flip' : flip_op,
-                                           'bias' : bias_op}
-
-                                nf_dict = {'in' : nf_in,
-                                           'tail' : nf_tail,
-                                           'load' : nf_load,
-                                           'load_copy': nf_load_copy,
-                                           'flip' : nf_flip,
-                                           'bias' : nf_bias}
-
                                 # Calculate figures of merit
-                                gain_lti, fbw_lti, ugf_lti, pm_lti = self._get_ss_lti(op_dict=op_dict,
-                                                                     nf_dict=nf_dict,
-                                                                     cload=cload)
+                                gain_lti, fbw_lti, ugf_lti, pm_lti = (x[i_flip] for x in ss_batch)
+
+                                # Check the batched evaluator against the full circuit
+                                if ss_verify:
+                                    op_dict = {'in' : in_op,
+                                               'tail' : tail_op,
+                                               'load' : load_op,
+                                               'load_copy': load_copy_op,
+                                               'flip' : flip_op,
+                                               'bias' : bias_op}
+
+                                    nf_dict = {'in' : nf_in,
+                                               'tail' : nf_tail,
+                                               'load' : nf_load,
+                                               'load_copy': nf_load_copy,
+                                               'flip' : nf_flip,
+                                               'bias' : nf_bias}
+                                    verify_ss(self._get_ss_lti(op_dict=op_dict, nf_dict=nf_dict, cload=cload),
+                                              (gain_lti, fbw_lti, ugf_lti, pm_lti),
+                                              rtol=ss_rtol)
 
                                 if gain_lti < gain_min or gain_lti > gain_max:
-                                    print(f'gain {gain_lti}')
+                                    self.reject('gain', gain_lti)
                                     continue
                                         
                                 if fbw_lti < fbw_min:
-                                    print(f'fbw {fbw_lti}')
+                                    self.reject('fbw', fbw_lti)
                                     continue
 
                                 if ugf_lti < ugf_min:
-                                    print(f'ugf {ugf_lti}' )
+                                    self.reject('ugf', ugf_lti)
                                     continue
 
                                 if pm_lti < pm_min:
-                                    if pm_lti >= 0:
-                                        print(f'pm {pm_lti}')
+                                    self.reject('pm', pm_lti)
                                     continue
 
-                                viable_op = dict(nf_dict=int(nf_dict),
+                                nf_dict = {'in' : int(nf_in),
+                                           'tail' : int(nf_tail),
+                                           'load' : int(nf_load),
+                                           'load_copy': int(nf_load_copy),
+                                           'flip' : int(nf_flip),
+                                           'bias' : int(nf_bias)}
+
+                                viable_op = dict(nf_dict=nf_dict,
                                                  vout=float(vout),
                                                  vout1=float(vout1),
                                                  vincm=float(vincm),
@@ -255,8 +297,7 @@ class bag2_analog__amp_gm_mirr_dsn(DesignModule):
                                                  cin=float(in_op['cgg']*nf_in))
 
                                 viable_op_list.append(viable_op)
-                                print("\n(SUCCESS)")
-                                pprint(viable_op)
+                                logger.debug('(SUCCESS)\n%s', viable_op)
 
         self.other_params = dict(db_dict=db_dict,
                                  l_dict=l_dict,
@@ -301,10 +342,21 @@ class bag2_analog__amp_gm_mirr_dsn(DesignModule):
 
         return gain, fbw, ugf, pm
 
+    def _get_ss_batch(self, op_dict:Mapping[str,Any],
+                      nf_dict:Mapping[str,Any],
+                      cload:float) -> Tuple[np.ndarray,np.ndarray,np.ndarray,np.ndarray]:
+        """Same as _get_ss_lti, but for a whole batch of candidates at once.
+        Operating points and finger counts can be arrays (e.g. from query_batch).
+        """
+        ckt = self.make_ltickt(op_dict=op_dict, nf_dict=nf_dict, cload=cload,
+                               meas_side='both', ckt=SmallSignalBatch())
+        return ckt.get_specs(in_dict={'inp' : 0.5, 'inn' : -0.5}, out_name='out')
+
     def make_ltickt(self, op_dict:Mapping[str,Any], nf_dict:Mapping[str,int], 
-                    cload:float, meas_side:str) -> LTICircuit:
+                    cload:float, meas_side:str, ckt:LTICircuit=None) -> LTICircuit:
 
-        ckt = LTICircuit()
+        if ckt == None:
+            ckt = LTICircuit()
         inp_conn = 'gnd' if meas_side=='n' else 'inp'
         inn_conn = 'gnd' if meas_side=='p' else 'inn'
         # Tail
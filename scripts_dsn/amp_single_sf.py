@@ -6,12 +6,15 @@ import os
 import pkg_resources
 import numpy as np
 import warnings
+import logging
 from pprint import pprint
 
 from bag.design.module import Module
 from . import DesignModule, get_mos_db, estimate_vth, parallel, verify_ratio, num_den_add
 from bag.data.lti import LTICircuit, get_w_3db, get_stability_margins
 
+logger = logging.getLogger(__name__)
+
 # noinspection PyPep8Naming
 class bag2_analog__amp_single_sf_dsn(DesignModule):
     """Module for library bag2_analog cell amp_single for 
@@ -211,11 +214,11 @@ class bag2_analog__amp_single_sf_dsn(DesignModule):
                                                                  cload=cload)
 
                             if gain_lti < gain_min or gain_lti > gain_max:
-                                # print(f'gain {gain_lti}')
+                                self.reject('gain', gain_lti)
                                 break
 
                             if fbw_lti < fbw_min:
-                                # print(f'fbw {fbw_lti}')
+                                self.reject('fbw', fbw_lti)
                                 continue
 
                             viable_op = dict(vout=voutcm,
@@ -234,8 +237,7 @@ class bag2_analog__amp_single_sf_dsn(DesignModule):
                                 if opp_stack > 0:
                                     viable_op['vgp'] = vg_opp
                                              
-                            print('(SUCCESS)')
-                            pprint(viable_op)
+                            logger.debug('(SUCCESS)\n%s', viable_op)
                             viable_op_list.append(viable_op)
 
         # Used for getting schematic parameters
@@ -5,13 +5,16 @@ from typing import Mapping, Tuple, Any, List
 import os
 import pkg_resources
 import numpy as np
+import logging
 
 from bag.design.module import Module
-from . import DesignModule, get_mos_db, estimate_vth, parallel, verify_ratio, num_den_add, enable_print, disable_print
+from . import DesignModule, get_mos_db, estimate_vth, parallel, verify_ratio, num_den_add
 from bag.data.lti import LTICircuit, get_w_3db, get_stability_margins
 from .amp_diff_mirr_bias import bag2_analog__amp_diff_mirr_bias_dsn
 from .constant_gm import bag2_analog__constant_gm_dsn
 
+logger = logging.getLogger(__name__)
+
 # noinspection PyPep8Naming
 class bag2_analog__bandgap_dsn(DesignModule):
     """Module for library bag2_analog cell bandgap.
@@ -152,7 +155,7 @@ class bag2_analog__bandgap_dsn(DesignModule):
                                    th_dict=amp_th_dict,
                                    l_dict=amp_l_dict,
                                    sim_env=sim_env))
-        print(f'Amp vincm: {passive_info["amp_vincm"]}')
+        logger.info('Amp vincm: %s', passive_info['amp_vincm'])
 
         # Spec out constant gm
         constgm_specfile_dict = dict()
@@ -179,11 +182,11 @@ class bag2_analog__bandgap_dsn(DesignModule):
         # Design active components
         for vg in vg_vec:
             # Match the PMOS size if possible
-            print(f"\nAttempting to match nf_p at vg={vg}")
+            logger.debug('Attempting to match nf_p at vg=%s', vg)
             match_p, nf_p = self.verify_pmos(db=db_dict['p'], vg=vg, vdd=vdd, vbg=vbg, ibias=idiode, error_tol=error_tol)
             if not match_p:
                 continue
-            print(f"Matched nf_p: {nf_p}")
+            logger.debug('Matched nf_p: %s', nf_p)
 
             # Find all possibilities for amplifiers
             p_op = db_dict['p'].query(vgs=vg-vdd, vds=vbg-vdd, vbs=0)
@@ -193,16 +196,13 @@ class bag2_analog__bandgap_dsn(DesignModule):
             amp_dsn_params.update(dict(cload=amp_cload,
                                        optional_params=amp_optional_params))
             
-            print(f'Attempting to design the amplifier...')
+            logger.info('Attempting to design the amplifier...')
             try:
-                disable_print()
-                amp_dsn_lst = amp_dsn_mod.meet_spec(**amp_dsn_params)
+                amp_dsn_lst = self.design_child(amp_dsn_mod, 'meet_spec', **amp_dsn_params)
             except ValueError:
                 continue
-            finally:
-                enable_print() 
 
-            print(f"{len(amp_dsn_lst)} amp possibilities")
+            logger.info('%d amp possibilities', len(amp_dsn_lst))
 
             # For each possibility, design the biasing
             for amp_dsn_info in amp_dsn_lst:
@@ -213,16 +213,13 @@ class bag2_analog__bandgap_dsn(DesignModule):
                     constgm_dsn_params.update(dict(vref=dict(p=amp_dsn_info['vgtail']),
                                                    res_side='p'))
 
-                print(f'Attempting to design constant gm...')
+                logger.info('Attempting to design constant gm...')
                 try:
-                    disable_print()
-                    _, constgm_dsn_info = constgm_dsn_mod.design(**constgm_dsn_params)
+                    _, constgm_dsn_info = self.design_child(constgm_dsn_mod, **constgm_dsn_params)
                 except ValueError as e:
                     assert False, f'{e}'
                     continue
-                finally:
-                    enable_print()
-                print(f"Constant gm: {constgm_dsn_info}")
+                logger.debug('Constant gm: %s', constgm_dsn_info)
 
                 # Keep track of all of the possibilities
                 viable_op = dict(constgm_dsn=constgm_dsn_info.copy(),
@@ -231,7 +228,7 @@ class bag2_analog__bandgap_dsn(DesignModule):
                                  nf_p=nf_p,
                                  ibias=passive_info['ibranch']*2 + amp_dsn_info['ibias'] + constgm_dsn_info['ibias'])
                 viable_op_list.append(viable_op)
-                print(f'(SUCCESS)\n{viable_op}')
+                logger.debug('(SUCCESS)\n%s', viable_op)
 
         self.other_params = dict(amp_dsn_mod=amp_dsn_mod,
                                  constgm_dsn_mod=constgm_dsn_mod,
@@ -5,11 +5,14 @@ from typing import Mapping, Tuple, Any, List
 import os
 import pkg_resources
 import numpy as np
+import logging
 
 from bag.design.module import Module
 from . import DesignModule, get_mos_db, estimate_vth, parallel, verify_ratio
 from bag.data.lti import LTICircuit, get_w_3db, get_stability_margins, get_w_crossings
 
+logger = logging.getLogger(__name__)
+
 # noinspection PyPep8Naming
 class span_ion__comparator_fd_cmfb_dsn(DesignModule):
     """Module for library span_ion cell comparator_fd_main.
@@ -102,7 +105,7 @@ class span_ion__comparator_fd_cmfb_dsn(DesignModule):
         vtail_min = vstar_min if n_in else vincm-vth_in
         vtail_max = vincm-vth_in if n_in else vdd-vstar_min
         vtail_vec = np.arange(vtail_min, vtail_max, res_vstep)
-        print(f'Sweeping tail from {vtail_min} to {vtail_max}')
+        logger.info('Sweeping tail from %s to %s', vtail_min, vtail_max)
         for vtail in vtail_vec:
             in_op = db_dict['in'].query(vgs=vincm-vtail,
                                         vds=voutcm-vtail,
@@ -114,11 +117,11 @@ class span_ion__comparator_fd_cmfb_dsn(DesignModule):
             # Step input device size (integer steps)
             nf_in_max = int(round(ibias_max/ibias_min))
             nf_in_vec = np.arange(1, nf_in_max, 1)
-            print(f'Number of input devices from 1 to {nf_in_max}')
+            logger.debug('Number of input devices from 1 to %d', nf_in_max)
             for nf_in in nf_in_vec:
                 ibias = ibias_min * nf_in
                 if ibias > ibias_max:
-                    print(f'ibias {ibias}')
+                    self.reject('ibias', ibias)
                     break
 
                 # Match load device size
@@ -128,7 +131,7 @@ class span_ion__comparator_fd_cmfb_dsn(DesignModule):
                                                  error_tol)
 
                 if not out_match:
-                    print("out match")
+                    self.reject('out_match')
                     continue
 
                 # Check target specs
@@ -161,22 +164,22 @@ class span_ion__comparator_fd_cmfb_dsn(DesignModule):
                 gain = -num[-1]/den[-1]
                 ugf = fbw * gain
                 if gain < gain_min:
-                    print(f'gain {gain}')
+                    self.reject('gain', gain)
                     break
 
                 if fbw < fbw_min:
-                    print(f"fbw {fbw}")
+                    self.reject('fbw', fbw)
                     continue
 
                 if ugf < ugf_min:
-                    print(f"ugf {ugf}")
+                    self.reject('ugf', ugf)
                     break
 
                 # Design matching tail
                 vgtail_min = vth_tail+vstar_min if n_in else vtail+vth_tail
                 vgtail_max = vtail+vth_tail if n_in else vdd+vth_tail-vstar_min
                 vgtail_vec = np.arange(vgtail_min, vgtail_max, res_vstep)
-                print(f"Tail gate from {vgtail_min} to {vgtail_max}")
+                logger.debug('Tail gate from %s to %s', vgtail_min, vgtail_max)
                 for vgtail in vgtail_vec:
                     tail_op = db_dict['tail'].query(vgs=vgtail-vb_tail,
                                                     vds=vtail-vb_tail,
@@ -187,10 +190,8 @@ class span_ion__comparator_fd_cmfb_dsn(DesignModule):
                                                        error_tol)
 
                     if not tail_match:
-                        print("tail match")
+                        self.reject('tail_match')
                         continue
-
-                    print('(SUCCESS)')
                     viable_op = dict(nf_in=nf_in,
                                      nf_out=nf_out,
                                      nf_tail=nf_tail,
@@ -200,7 +201,7 @@ class span_ion__comparator_fd_cmfb_dsn(DesignModule):
                                      ugf=ugf,
                                      vtail=vtail,
                                      ibias=abs(tail_op['ibias'])*nf_tail)
-                    print(viable_op)
+                    logger.debug('(SUCCESS)\n%s', viable_op)
                     viable_op_list.append(viable_op)
         self.other_params = dict(in_type=in_type,
                                  lch_dict=l_dict,
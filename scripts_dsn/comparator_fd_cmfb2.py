@@ -6,11 +6,14 @@ import os
 import pkg_resources
 import numpy as np
 import warnings
+import logging
 
 from bag.design.module import Module
 from . import DesignModule, get_mos_db, estimate_vth, parallel, verify_ratio
 from bag.data.lti import LTICircuit, get_w_3db, get_stability_margins, get_w_crossings
 
+logger = logging.getLogger(__name__)
+
 # noinspection PyPep8Naming
 class span_ion__comparator_fd_cmfb2_dsn(DesignModule):
     """Module for library span_ion cell comparator_fd_cmfb2.
@@ -105,7 +108,7 @@ class span_ion__comparator_fd_cmfb2_dsn(DesignModule):
         vtail_min = vstar_min if n_in else vincm-vth_in
         vtail_max = vincm-vth_in if n_in else vdd-vstar_min
         vtail_vec = np.arange(vtail_min, vtail_max, res_vstep)
-        print(f'Sweeping tail from {vtail_min} to {vtail_max}')
+        logger.info('Sweeping tail from %s to %s', vtail_min, vtail_max)
 
         # Get out1 common mode range
         vout1_min = vincm-vth_in if n_in else vth_load+vstar_min
@@ -152,7 +155,7 @@ class span_ion__comparator_fd_cmfb2_dsn(DesignModule):
                                                        error_tol)
 
                     if not load_match:
-                        print(f"load match {nf_load}")
+                        self.reject('load_match', nf_load)
                         # assert False, 'blep'
                         continue
 
@@ -171,7 +174,7 @@ class span_ion__comparator_fd_cmfb2_dsn(DesignModule):
                                                                      nf_out,
                                                                      error_tol)
                         if not load_copy_match:
-                            print('load copy match')
+                            self.reject('load_copy_match')
                             continue
 
                         # Check target specs
@@ -206,22 +209,22 @@ class span_ion__comparator_fd_cmfb2_dsn(DesignModule):
                         gain = -num[-1]/den[-1]
                         ugf = fbw * gain
                         if fbw < fbw_min:
-                            print(f"fbw {fbw}")
+                            self.reject('fbw', fbw)
                             continue
 
                         if ugf < ugf_min:
-                            print(f"ugf {ugf}")
+                            self.reject('ugf', ugf)
                             break
 
                         if gain < gain_min:
-                            print(f'gain {gain}')
+                            self.reject('gain', gain)
                             break
 
                         # Design matching tail
                         vgtail_min = vth_tail+vstar_min if n_in else vtail+vth_tail
                         vgtail_max = vtail+vth_tail if n_in else vdd+vth_tail-vstar_min
                         vgtail_vec = np.arange(vgtail_min, vgtail_max, res_vstep)
-                        print(f"Tail gate from {vgtail_min} to {vgtail_max}")
+                        logger.debug('Tail gate from %s to %s', vgtail_min, vgtail_max)
                         for vgtail in vgtail_vec:
                             tail_op = db_dict['tail'].query(vgs=vgtail-vb_tail,
                                                             vds=vtail-vb_tail,
@@ -232,10 +235,8 @@ class span_ion__comparator_fd_cmfb2_dsn(DesignModule):
                                                                error_tol)
 
                             if not tail_match:
-                                print("tail match")
+                                self.reject('tail_match')
                                 continue
-
-                            print('(SUCCESS)')
                             viable_op = dict(nf_in=nf_in,
                                              nf_load=nf_load,
                                              nf_load_copy=nf_load_copy,
@@ -250,7 +251,7 @@ class span_ion__comparator_fd_cmfb2_dsn(DesignModule):
                                              itail=itail,
                                              iflip_branch=nf_out*out_op['ibias'],
                                              ibias=itail+2*nf_out*out_op['ibias'])
-                            print(viable_op)
+                            logger.debug('(SUCCESS)\n%s', viable_op)
                             viable_op_list.append(viable_op)
         self.other_params = dict(in_type=in_type,
                                  lch_dict=l_dict,
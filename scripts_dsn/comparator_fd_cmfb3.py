@@ -5,11 +5,13 @@ from typing import Mapping, Tuple, Any, List
 import os
 import pkg_resources
 import numpy as np
+import logging
 
 from bag.design.module import Module
 from . import DesignModule, get_mos_db, estimate_vth, parallel, verify_ratio, num_den_add
 from bag.data.lti import LTICircuit, get_w_3db, get_stability_margins, get_w_crossings
 
+logger = logging.getLogger(__name__)
 
 # noinspection PyPep8Naming
 class span_ion__comparator_fd_cmfb3_dsn(DesignModule):
@@ -108,7 +110,7 @@ class span_ion__comparator_fd_cmfb3_dsn(DesignModule):
         vtail_min = vstar_min if n_in else vincm-vth_in+vstar_in_min
         vtail_max = vincm-vth_in-vstar_in_min if n_in else vdd-vstar_min
         vtail_vec = np.arange(vtail_min, vtail_max, res_vstep)
-        print(f'Sweeping tail from {vtail_min} to {vtail_max}')
+        logger.info('Sweeping tail from %s to %s', vtail_min, vtail_max)
         for vtail in vtail_vec:
             in_op = db_dict['in'].query(vgs=vincm - vtail,
                                         vds=voutcm - vtail,
@@ -120,11 +122,11 @@ class span_ion__comparator_fd_cmfb3_dsn(DesignModule):
             # Step input device size (integer steps)
             nf_in_max = int(round(ibias_max / ibias_min))
             nf_in_vec = np.arange(1, nf_in_max, 1)
-            print(f'Number of input devices from 1 to {nf_in_max}')
+            logger.debug('Number of input devices from 1 to %d', nf_in_max)
             for nf_in in nf_in_vec:
                 ibias = ibias_min * nf_in
                 if ibias > ibias_max:
-                    print(f'ibias {ibias}')
+                    self.reject('ibias', ibias)
                     break
 
                 # Match load device size
@@ -134,14 +136,14 @@ class span_ion__comparator_fd_cmfb3_dsn(DesignModule):
                                                  error_tol)
 
                 if not out_match:
-                    print("out match")
+                    self.reject('out_match')
                     continue
 
                 # Design tail
                 vgtail_min = vth_tail + vstar_min if n_in else vtail + vth_tail
                 vgtail_max = vtail + vth_tail if n_in else vdd + vth_tail - vstar_min
                 vgtail_vec = np.arange(vgtail_min, vgtail_max, res_vstep)
-                print(f"Tail gate from {vgtail_min} to {vgtail_max}")
+                logger.debug('Tail gate from %s to %s', vgtail_min, vgtail_max)
                 for vgtail in vgtail_vec:
                     tail_op = db_dict['tail'].query(vgs=vgtail - vb_tail,
                                                     vds=vtail - vb_tail,
@@ -152,7 +154,7 @@ class span_ion__comparator_fd_cmfb3_dsn(DesignModule):
                                                        error_tol)
 
                     if not tail_match or nf_tail%2 != 0:
-                        print(f"tail match {nf_tail}" if not tail_match else f'tail even {nf_tail}')
+                        self.reject('tail_even' if tail_match else 'tail_match', nf_tail)
                         continue
 
                     # Check spec
@@ -169,22 +171,20 @@ class span_ion__comparator_fd_cmfb3_dsn(DesignModule):
                                                                           cload=cload)
 
                     if gain_lti < gain_min or gain_lti > gain_max:
-                        print(f'gain {gain_lti}')
+                        self.reject('gain', gain_lti)
                         break
 
                     if fbw_lti < fbw_min:
-                        print(f'fbw {fbw_lti}')
+                        self.reject('fbw', fbw_lti)
                         continue
 
                     if ugf_lti < ugf_min:
-                        print(f'ugf {ugf_lti}')
+                        self.reject('ugf', ugf_lti)
                         continue
 
                     if pm_lti < pm_min:
-                        print(f'pm {pm_lti}')
+                        self.reject('pm', pm_lti)
                         continue
-
-                    print('(SUCCESS)')
                     viable_op = dict(nf_in=nf_in,
                                      nf_out=nf_out,
                                      nf_tail=nf_tail,
@@ -195,7 +195,7 @@ class span_ion__comparator_fd_cmfb3_dsn(DesignModule):
                                      pm=pm_lti,
                                      vtail=vtail,
                                      ibias=abs(tail_op['ibias']) * nf_tail)
-                    print(viable_op)
+                    logger.debug('(SUCCESS)\n%s', viable_op)
                     viable_op_list.append(viable_op)
         self.other_params = dict(in_type=in_type,
                                  lch_dict=l_dict,
@@ -5,11 +5,14 @@ from typing import Mapping, Tuple, Any, List
 import os
 import pkg_resources
 import numpy as np
+import logging
 
 from bag.design.module import Module
 from . import DesignModule, get_mos_db, estimate_vth, parallel, verify_ratio
 from bag.data.lti import LTICircuit, get_w_3db, get_stability_margins
 
+logger = logging.getLogger(__name__)
+
 # noinspection PyPep8Naming
 class span_ion__comparator_fd_main2_dsn(DesignModule):
     """Module for library span_ion cell comparator_fd_main2.
@@ -94,7 +97,7 @@ class span_ion__comparator_fd_main2_dsn(DesignModule):
         vtail_min = vstar_min if n_in else vincm-vth_in
         vtail_max = vincm-vth_in if n_in else vdd-vstar_min
         vtail_vec = np.arange(vtail_min, vtail_max, res_vstep)
-        print(f'Sweeping tail from {vtail_min} to {vtail_max}')
+        logger.info('Sweeping tail from %s to %s', vtail_min, vtail_max)
         for vtail in vtail_vec:
             voutcm_min = vincm-vth_in if n_in else vstar_min
             voutcm_max = vdd-vstar_min if n_in else vincm-vth_in
@@ -131,7 +134,7 @@ class span_ion__comparator_fd_main2_dsn(DesignModule):
                                                              error_tol)
 
                         if not load_success:
-                            print(f'load match {nf_load}')
+                            self.reject('load_match', nf_load)
                             continue
 
                         # Check gain, bandwidth
@@ -148,18 +151,18 @@ class span_ion__comparator_fd_main2_dsn(DesignModule):
                         fbw = wbw/(2*np.pi)
 
                         if gain < gain_min or gain > gain_max:
-                            print(f'gain: {gain}')
+                            self.reject('gain', gain)
                             break
 
                         if fbw < fbw_min:
-                            print(f'fbw: {fbw}')
+                            self.reject('fbw', fbw)
                             continue
 
                         # Design tail to current match
                         vgtail_min = vth_tail+vstar_min if n_in else vtail+vth_tail
                         vgtail_max = vtail+vth_tail if n_in else vdd+vth_tail-vstar_min
                         vgtail_vec = np.arange(vgtail_min, vgtail_max, res_vstep)
-                        print(f'vgtail {vgtail_min} to {vgtail_max}')
+                        logger.debug('vgtail %s to %s', vgtail_min, vgtail_max)
                         for vgtail in vgtail_vec:
                             tail_op = db_dict['tail'].query(vgs=vgtail-vb,
                                                             vds=vtail-vb,
@@ -169,7 +172,7 @@ class span_ion__comparator_fd_main2_dsn(DesignModule):
                                                                  nf_in,
                                                                  error_tol)
                             if not tail_success:
-                                print('tail match')
+                                self.reject('tail_match')
                                 continue
                             
                             viable_op = dict(nf_in=nf_in,
@@ -184,8 +187,7 @@ class span_ion__comparator_fd_main2_dsn(DesignModule):
                                              ibias=tail_op['ibias']*nf_tail,
                                              cmfb_cload=load_op['cgg']*nf_load)
                             viable_op_list.append(viable_op)
-                            print("\n(SUCCESS)")
-                            print(viable_op)
+                            logger.debug('(SUCCESS)\n%s', viable_op)
 
         self.other_params = dict(in_type=in_type,
                                  l_dict=l_dict,
@@ -1,15 +1,17 @@
 # -*- coding: utf-8 -*-
 
-from typing import Mapping, Tuple, Any, List
+from typing import Mapping, Tuple, Any, List, Iterator
 
 import os
 import pkg_resources
 import numpy as np
+import logging
 
 from bag.design.module import Module
-from . import DesignModule, get_mos_db, estimate_vth, parallel, verify_ratio
+from . import DesignModule, get_mos_db, estimate_vth, parallel, verify_ratio_vec, query_batch, op_from_batch, CandidateTable
 from bag.data.lti import LTICircuit, get_w_3db, get_stability_margins
 
+logger = logging.getLogger(__name__)
 
 # noinspection PyPep8Naming
 class span_ion__comparator_fd_stage_dsn(DesignModule):
@@ -18,6 +20,10 @@ class span_ion__comparator_fd_stage_dsn(DesignModule):
     does not require common mode feedback.
     """
 
+    parallel_sweep = True
+    adaptive_sweep_keys = ('vtail', 'voutcm', 'vgtail')
+    spec_limit_keys = ('gain_lim', 'fbw')
+
     @classmethod
     def get_params_info(cls) -> Mapping[str, str]:
         # type: () -> Dict[str, str]
@@ -43,15 +49,20 @@ class span_ion__comparator_fd_stage_dsn(DesignModule):
             ibias='Maximum bias current, in amperes.',
             iref = 'Minimum quantization of the tail current',
             cload='Output load capacitance in farads.',
-            optional_params='Optional parameters. voutcm=output common mode, vstar_min, res_vstep, error_tol'
+            optional_params='Optional parameters. voutcm=output common mode, vstar_min, res_vstep, error_tol, prune_slack=relative margin on bounds used to skip sweep points, res_vstep_coarse=coarse step for an adaptive sweep, res_vwindow, incremental=keep unfiltered candidates to re-filter when only gain_lim/fbw change'
         ))
         return ans
 
-    def meet_spec(self, **params) -> List[Mapping[str, Any]]:
+    def meet_spec(self, **params) -> CandidateTable:
         """To be overridden by subclasses to design this module.
 
         Raises a ValueError if there is no solution.
         """
+        return CandidateTable(self.iter_spec(**params))
+
+    def iter_spec(self, **params) -> Iterator[Mapping[str, Any]]:
+        """Yields viable operating points as they're found. See meet_spec.
+        """
         ### Get DBs for each device
         specfile_dict = params['specfile_dict']
         in_type = params['in_type']
@@ -79,6 +90,12 @@ class span_ion__comparator_fd_stage_dsn(DesignModule):
         vstar_min = optional_params.get('vstar_min', 0.2)
         res_vstep = optional_params.get('res_vstep', 10e-3)
         error_tol = optional_params.get('error_tol', 0.01)
+        prune_slack = optional_params.get('prune_slack', 0.1)
+
+        # Keep everything, filter_candidates applies the limits afterwards
+        if optional_params.get('incremental', False):
+            gain_min, gain_max = -np.inf, np.inf
+            fbw_min = -np.inf
 
         n_in = in_type == 'n'
 
@@ -89,14 +106,16 @@ class span_ion__comparator_fd_stage_dsn(DesignModule):
         vth_in = estimate_vth(is_nch=n_in, vgs=vtest, vbs=0, db=db_dict['in'], lch=l_dict['in'])
         vth_tail = estimate_vth(is_nch=n_in, vgs=vtest, vbs=0, db=db_dict['tail'], lch=l_dict['tail'])
 
-        # Keeping track of operating points which work for future comparison
-        viable_op_list = []
+        self.other_params = dict(in_type=in_type,
+                                 l_dict=l_dict,
+                                 w_dict={k: db.width_list[0] for k, db in db_dict.items()},
+                                 th_dict=th_dict)
 
         # Sweep tail voltage
         vtail_min = vstar_min if n_in else vincm - vth_in
         vtail_max = vincm - vth_in if n_in else vdd - vstar_min
-        vtail_vec = np.arange(vtail_min, vtail_max, res_vstep)
-        print(f'Sweeping tail from {vtail_min} to {vtail_max}')
+        vtail_vec = self.partition_sweep(self.sweep_range('vtail', np.arange(vtail_min, vtail_max, res_vstep)))
+        logger.info('Sweeping tail from %s to %s', vtail_min, vtail_max)
         for vtail in vtail_vec:
             voutcm_min = vincm - vth_in if n_in else 0
             voutcm_max = vdd if n_in else vincm - vth_in
@@ -104,18 +123,53 @@ class span_ion__comparator_fd_stage_dsn(DesignModule):
             voutcm = optional_params.get('voutcm', None)
 
             if voutcm == None:
-                voutcm_vec = np.arange(voutcm_min, voutcm_max, res_vstep)
+                voutcm_vec = self.sweep_range('voutcm', np.arange(voutcm_min, voutcm_max, res_vstep))
             else:
-                voutcm_vec = [voutcm]
+                voutcm_vec = np.asarray([voutcm], dtype=float)
+
+            # Tail gate voltages don't depend on the output bias or sizing
+            vgtail_min = vth_tail + vstar_min if n_in else vtail + vth_tail
+            vgtail_max = vtail + vth_tail if n_in else vdd + vth_tail - vstar_min
+            vgtail_vec = self.sweep_range('vgtail', np.arange(vgtail_min, vgtail_max, res_vstep))
+            logger.debug('vgtail %s to %s', vgtail_min, vgtail_max)
+            if len(voutcm_vec) < 1 or len(vgtail_vec) < 1:
+                continue
+
+            # Query all bias points for this tail voltage at once
+            in_op_batch = query_batch(db_dict['in'],
+                                      vgs=vincm - vtail,
+                                      vds=voutcm_vec - vtail,
+                                      vbs=vb - vtail)
+            tail_op_batch = query_batch(db_dict['tail'],
+                                        vgs=vgtail_vec - vb,
+                                        vds=vtail - vb,
+                                        vbs=0)
+            ref_op_batch = query_batch(db_dict['tail'],
+                                       vgs=vgtail_vec - vb,
+                                       vds=vgtail_vec - vb,
+                                       vbs=0)
+            tail_op_list = [op_from_batch(tail_op_batch, i) for i in range(len(vgtail_vec))]
+            ref_op_list = [op_from_batch(ref_op_batch, i) for i in range(len(vgtail_vec))]
+
             # Sweep output common mode
-            for voutcm in voutcm_vec:
-                in_op = db_dict['in'].query(vgs=vincm - vtail,
-                                            vds=voutcm - vtail,
-                                            vbs=vb - vtail)
+            for i_outcm, voutcm in enumerate(voutcm_vec):
+                in_op = op_from_batch(in_op_batch, i_outcm)
                 ibias_min = 2 * in_op['ibias']
                 # Step input device size (integer steps)
                 nf_in_max = int(round(ibias_max / ibias_min))
                 nf_in_vec = np.arange(2, nf_in_max, 2)
+
+                # The load resistor scales with the input pair, so gain doesn't
+                # depend on sizing, and bandwidth is at most what the largest
+                # input pair gives without parasitics
+                vres = vdd - voutcm if n_in else voutcm
+                gout_unit = in_op['gds'] + in_op['ibias'] / vres
+                gain_bound = in_op['gm'] / gout_unit
+                fbw_bound = nf_in_max * gout_unit / (2 * np.pi * cload)
+                if self.prune('voutcm', gain_bound * (1 + prune_slack) < gain_min
+                                        or gain_bound > gain_max * (1 + prune_slack)
+                                        or fbw_bound * (1 + prune_slack) < fbw_min):
+                    continue
                 for nf_in in nf_in_vec:
                     ibias = ibias_min * nf_in
                     ibranch = ibias / 2
@@ -134,48 +188,34 @@ class span_ion__comparator_fd_stage_dsn(DesignModule):
                     fbw = wbw / (2 * np.pi)
 
                     if gain < gain_min or gain > gain_max:
-                        print(f'gain: {gain}')
+                        self.reject('gain', gain)
                         break
 
                     if fbw < fbw_min:
-                        print(f'fbw: {fbw}')
+                        self.reject('fbw', fbw)
                         continue
 
-                    # Design tail to current match
-                    vgtail_min = vth_tail + vstar_min if n_in else vtail + vth_tail
-                    vgtail_max = vtail + vth_tail if n_in else vdd + vth_tail - vstar_min
-                    vgtail_vec = np.arange(vgtail_min, vgtail_max, res_vstep)
-                    print(f'vgtail {vgtail_min} to {vgtail_max}')
-                    for vgtail in vgtail_vec:
-                        tail_op = db_dict['tail'].query(vgs=vgtail - vb,
-                                                        vds=vtail - vb,
-                                                        vbs=0)
-                        tail_success, nf_tail = verify_ratio(in_op['ibias'] * 2,
-                                                             tail_op['ibias'],
-                                                             nf_in,
-                                                             error_tol)
-
-                        if not tail_success:
-                            print('tail match')
-                            continue
+                    # Design tail to current match for every tail gate voltage
+                    tail_success_vec, nf_tail_vec = verify_ratio_vec(in_op['ibias'] * 2,
+                                                                     tail_op_batch['ibias'],
+                                                                     nf_in,
+                                                                     error_tol)
+                    for i_gtail in np.flatnonzero(tail_success_vec):
+                        vgtail = vgtail_vec[i_gtail]
+                        tail_op = tail_op_list[i_gtail]
+                        nf_tail = nf_tail_vec[i_gtail]
 
                         # Ensure that it's an appropriate duplicate of the baseline current
                         itail = tail_op['ibias'] * nf_tail
-                        ref_op = db_dict['tail'].query(vgs=vgtail-vb,
-                                                       vds=vgtail-vb,
-                                                       vbs=0)
+                        ref_op = ref_op_list[i_gtail]
                         iref_max = ibias_max - itail
                         nf_ref_max = int(round(iref_max / ref_op['ibias']))
                         nf_ref_vec = np.arange(1, nf_ref_max, 1)
-                        for nf_ref in nf_ref_vec:
+                        ref_success_vec, mult_ref_vec = verify_ratio_vec(ref_op['ibias'],
+                                                                         iref_min,
+                                                                         nf_ref_vec, error_tol)
+                        for nf_ref, mult_ref in zip(nf_ref_vec[ref_success_vec], mult_ref_vec[ref_success_vec]):
                             iref = ref_op['ibias'] * nf_ref
-                            ref_success, mult_ref = verify_ratio(ref_op['ibias'],
-                                                                 iref_min,
-                                                                 nf_ref, error_tol)
-
-                            if not ref_success:
-                                print('reference match')
-                                continue
 
                             viable_op = dict(nf_in=int(nf_in),
                                              nf_tail=int(nf_tail),
@@ -191,17 +231,22 @@ class span_ion__comparator_fd_stage_dsn(DesignModule):
                                              ibias=float(itail + iref),
                                              mult_ref=int(mult_ref),
                                              cin=float(in_op['cgg'] * nf_in))
-                            viable_op_list.append(viable_op)
-                            print("\n(SUCCESS)")
-                            print(viable_op)
-
-        self.other_params = dict(in_type=in_type,
-                                 l_dict=l_dict,
-                                 w_dict={k: db.width_list[0] for k, db in db_dict.items()},
-                                 th_dict=th_dict)
+                            logger.debug('(SUCCESS)\n%s', viable_op)
+                            yield viable_op
 
+    def filter_candidates(self, op_list: CandidateTable, **params) -> CandidateTable:
+        """Applies the gain and bandwidth limits to candidates
+        swept without them.
+        """
+        if len(op_list) < 1:
+            return op_list
 
-        return viable_op_list
+        # Same comparisons as iter_spec
+        gain_min, gain_max = params['gain_lim']
+        gain = op_list.column('gain')
+        mask = ~((gain < gain_min) | (gain > gain_max))
+        mask &= ~(op_list.column('fbw') < params['fbw'])
+        return op_list.filter(mask)
 
     def op_compare(self, op1: Mapping[str, Any], op2: Mapping[str, Any]):
         """Returns the best operating condition based on
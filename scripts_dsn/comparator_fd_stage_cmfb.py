@@ -5,16 +5,19 @@ from typing import Mapping, Tuple, Any
 import os
 import pkg_resources
 import numpy as np
+import logging
 
 from bag.design.module import Module
 from . import DesignModule, get_mos_db, estimate_vth, parallel, verify_ratio
 from bag.data.lti import LTICircuit, get_w_3db, get_stability_margins, get_w_crossings
 
-from . import DesignModule, get_mos_db, estimate_vth, parallel, verify_ratio, num_den_add, enable_print, disable_print
+from . import DesignModule, get_mos_db, estimate_vth, parallel, verify_ratio, num_den_add, quiet_output
 from .comparator_fd_main import span_ion__comparator_fd_main_dsn
 from .comparator_fd_cmfb2 import span_ion__comparator_fd_cmfb2_dsn
 from .constant_gm import bag2_analog__constant_gm_dsn
 
+logger = logging.getLogger(__name__)
+
 # noinspection PyPep8Naming
 class span_ion__comparator_fd_stage_cmfb_dsn(DesignModule):
     """Module for library span_ion cell comparator_fd_stage_cmfb.
@@ -145,34 +148,29 @@ class span_ion__comparator_fd_stage_cmfb_dsn(DesignModule):
         viable_op_list = []
 
         # Design the main amplifier with 0 additional load (i.e. ignores load from cmfb amp)
-        print('Designing the main amp...')
+        logger.info('Designing the main amp...')
         try:
-            disable_print()
-            main_dsn_lst = main_dsn_mod.meet_spec(**main_dsn_params)
+            with quiet_output():
+                main_dsn_lst = main_dsn_mod.meet_spec(**main_dsn_params)
         except ValueError:
-            print('0 load main amp failure')
-        finally:
-            enable_print()
-        print(f'{len(main_dsn_lst)} viable main amps')
+            logger.info('0 load main amp failure')
+        logger.info('%d viable main amps', len(main_dsn_lst))
 
         for main_dsn_info in main_dsn_lst:
             # print(main_dsn_info)
 
             # Design the cmfb amp
-            print('Designing the cmfb amp...')
+            logger.info('Designing the cmfb amp...')
             cmfb_dsn_params.update(dict(cload=main_dsn_info['cmfb_cload'],
                                         ibias=ibias_max-main_dsn_info['ibias'],
                                         vincm=main_dsn_info['voutcm'],
                                         voutcm=main_dsn_info['vgtail']))
             try:
-                disable_print()
-                cmfb_dsn_lst = cmfb_dsn_mod.meet_spec(**cmfb_dsn_params)
+                cmfb_dsn_lst = self.design_child(cmfb_dsn_mod, 'meet_spec', **cmfb_dsn_params)
             except ValueError:
                 continue
-            finally:
-                enable_print()
 
-            print(f'{len(cmfb_dsn_lst)} viable cmfb amps')
+            logger.info('%d viable cmfb amps', len(cmfb_dsn_lst))
 
             for cmfb_dsn_info in cmfb_dsn_lst:
                 # Check the small signal parameters with the real capacitive load
@@ -220,15 +218,15 @@ class span_ion__comparator_fd_stage_cmfb_dsn(DesignModule):
                 gain_lti, fbw_lti = self._get_ss_lti(op_dict=op_dict, nf_dict=nf_dict, cload=cload, rload=main_dsn_info['res_val'])
 
                 if gain_lti < gain_min or gain_lti > gain_max:
-                    print(f'gain {gain_lti}')
+                    self.reject('gain', gain_lti)
                     continue
 
                 if fbw_lti < fbw_min:
-                    print(f'fbw {fbw_lti}')
+                    self.reject('fbw', fbw_lti)
                     continue
 
                 # Design constant gm
-                print("Designing the constant gm...")
+                logger.info('Designing the constant gm...')
                 constgm_dsn_params['ibias'] = ibias_max - main_dsn_info['ibias'] - cmfb_dsn_info['ibias']
                 if not n_in:
                     constgm_dsn_params.update(dict(res_side='p',
@@ -238,12 +236,9 @@ class span_ion__comparator_fd_stage_cmfb_dsn(DesignModule):
                                                    vref=dict(n=cmfb_dsn_info['vgtail'])))
 
                 try:
-                    disable_print()
-                    _, constgm_dsn_info = constgm_dsn_mod.design(**constgm_dsn_params)
+                    _, constgm_dsn_info = self.design_child(constgm_dsn_mod, **constgm_dsn_params)
                 except ValueError:
                     continue
-                finally:
-                    enable_print()
 
                 # Keep track of all possibilities
                 viable_op = dict(constgm_dsn=constgm_dsn_info.copy(),
@@ -254,7 +249,7 @@ class span_ion__comparator_fd_stage_cmfb_dsn(DesignModule):
                                  ibias=main_dsn_info['ibias']+cmfb_dsn_info['ibias']+constgm_dsn_info['ibias'])
 
                 viable_op_list.append(viable_op)
-                print(f'(SUCCESS)\n{viable_op}')
+                logger.debug('(SUCCESS)\n%s', viable_op)
 
         return viable_op_list
 
@@ -5,11 +5,14 @@ from typing import Mapping, Tuple, Any, List
 import os
 import pkg_resources
 import numpy as np
+import logging
 
 from bag.design.module import Module
-from . import DesignModule, get_mos_db, estimate_vth, parallel, verify_ratio, num_den_add
+from . import DesignModule, get_mos_db, estimate_vth, parallel, verify_ratio, num_den_add, enumerate_ratio_pairs, verify_ratio_vec
 from bag.data.lti import LTICircuit, get_w_3db, get_stability_margins
 
+logger = logging.getLogger(__name__)
+
 # noinspection PyPep8Naming
 class bag2_analog__constant_gm_dsn(DesignModule):
     """Module for library bag2_analog cell constant_gm.
@@ -17,6 +20,8 @@ class bag2_analog__constant_gm_dsn(DesignModule):
     Fill in high level description here.
     """
 
+    parallel_sweep = True
+
     @classmethod
     def get_params_info(cls) -> Mapping[str,str]:
         # type: () -> Dict[str, str]
@@ -81,6 +86,7 @@ class bag2_analog__constant_gm_dsn(DesignModule):
         vth_p = estimate_vth(is_nch=False, vgs=-vdd/2, vbs=0, db=db_dict['p'], lch=l_dict['p'])
 
         vg_p_vec = [vp] if vp != None else np.arange(max(0, vn-vth_n, vn+vth_p), min(vdd, vdd+vth_p-vstar_min), res_vstep)
+        vg_p_vec = self.partition_sweep(vg_p_vec)
         vg_n_vec = [vn] if vn != None else np.arange(max(0, vth_n+vstar_min), min(vdd, vp+vth_n, vp-vth_p), res_vstep)
 
         viable_op_list = []
@@ -106,42 +112,45 @@ class bag2_analog__constant_gm_dsn(DesignModule):
 
                         imain_unit = main_diode_op['ibias']
                         nf_main_diode_max = int(round(ibias_max/imain_unit))
-                        nf_main_diode_vec = np.arange(1, nf_main_diode_max, 1)
-                        for nf_main_diode in nf_main_diode_vec:
-                            imain = imain_unit * nf_main_diode
-
-                            main_match, nf_main_nondiode = verify_ratio(main_diode_op['ibias'],
-                                                                        main_nondiode_op['ibias'],
-                                                                        nf_main_diode,
-                                                                        error_tol)
-                            if not main_match:
-                                continue
-
-                            nf_side_diode = nf_main_nondiode
-
-                            # Match the final device size
-                            match_side, nf_side_nondiode = verify_ratio(side_diode_op['ibias'],
-                                                                        side_nondiode_op['ibias'],
-                                                                        nf_side_diode,
-                                                                        error_tol)
-                            if not match_side:
-                                print("side match")
-                                continue
-
-                            if nf_side_nondiode == nf_main_diode:
-                                continue
-
-                            iside_unit = side_diode_op['ibias']
-                            iside = iside_unit * nf_side_diode
-                            res_val = vs_n/iside if res_n else (vdd-vs_p)/iside
-
-                            if res_val > res_max or res_val < res_min:
-                                print(f"res {res_val}")
-                                break
-
-                            if imain + iside > ibias_max:
-                                print(f"ibias {imain+iside}")
-                                break
+                        # Every main mirror ratio that works
+                        nf_main_diode_vec, nf_main_nondiode_vec = enumerate_ratio_pairs(main_diode_op['ibias'],
+                                                                                        main_nondiode_op['ibias'],
+                                                                                        error_tol,
+                                                                                        nf_main_diode_max)
+                        nf_side_diode_vec = nf_main_nondiode_vec
+
+                        # Match the final device size
+                        match_side_vec, nf_side_nondiode_vec = verify_ratio_vec(side_diode_op['ibias'],
+                                                                                side_nondiode_op['ibias'],
+                                                                                nf_side_diode_vec,
+                                                                                error_tol)
+                        keep = match_side_vec & (nf_side_nondiode_vec != nf_main_diode_vec)
+
+                        imain_vec = imain_unit * nf_main_diode_vec
+                        iside_unit = side_diode_op['ibias']
+                        iside_vec = iside_unit * nf_side_diode_vec
+                        res_val_vec = vs_n/iside_vec if res_n else (vdd-vs_p)/iside_vec
+
+                        # Larger sizes only make these worse, so stop at the first failure
+                        res_fail = (res_val_vec > res_max) | (res_val_vec < res_min)
+                        ibias_fail = imain_vec + iside_vec > ibias_max
+                        idx_fail = np.flatnonzero(keep & (res_fail | ibias_fail))
+                        if len(idx_fail) > 0:
+                            idx_stop = idx_fail[0]
+                            if res_fail[idx_stop]:
+                                self.reject('res', res_val_vec[idx_stop])
+                            else:
+                                self.reject('ibias', imain_vec[idx_stop]+iside_vec[idx_stop])
+                            keep[idx_stop:] = False
+
+                        for idx in np.flatnonzero(keep):
+                            nf_main_diode = nf_main_diode_vec[idx]
+                            nf_main_nondiode = nf_main_nondiode_vec[idx]
+                            nf_side_diode = nf_side_diode_vec[idx]
+                            nf_side_nondiode = nf_side_nondiode_vec[idx]
+                            imain = imain_vec[idx]
+                            iside = iside_vec[idx]
+                            res_val = res_val_vec[idx]
 
                             viable_op = dict(nf_diode_p=int(nf_main_diode if not res_n else nf_side_diode),
                                              nf_diode_n=int(nf_main_diode if res_n else nf_side_diode),
@@ -157,8 +166,7 @@ class bag2_analog__constant_gm_dsn(DesignModule):
                                              res_val=float(res_val),
                                              nf_side_nondiode=int(nf_side_nondiode))
                             viable_op_list.append(viable_op)
-                            print('\n(SUCCESS)')
-                            print(viable_op)
+                            logger.debug('(SUCCESS)\n%s', viable_op)
 
     
         self.other_params = dict(res_side=res_side,
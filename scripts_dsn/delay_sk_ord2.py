@@ -6,15 +6,18 @@ import os
 import pkg_resources
 import numpy as np
 import warnings
+import logging
 from pprint import pprint
 
 from bag.design.module import Module
-from . import DesignModule, get_mos_db, estimate_vth, parallel, verify_ratio, num_den_add, enable_print, disable_print
+from . import DesignModule, get_mos_db, estimate_vth, parallel, verify_ratio, num_den_add
 from bag.data.lti import LTICircuit, get_w_3db, get_stability_margins, get_w_crossings
 
 from .amp_gm_mirr import bag2_analog__amp_gm_mirr_dsn
 from .constant_gm import bag2_analog__constant_gm_dsn
 
+logger = logging.getLogger(__name__)
+
 # noinspection PyPep8Naming
 class span_ion__delay_sk_ord2_dsn(DesignModule):
     """Module for library span_ion cell delay_sk_ord2 for a 
@@ -89,7 +92,7 @@ class span_ion__delay_sk_ord2_dsn(DesignModule):
 
         ### Design feedback passives assuming an ideal amplifier
         passives_info_list = self.dsn_passives(tdelay, C1, C2, res_lim_list)
-        print(f'{len(passives_info_list)} solutions with passives')
+        logger.info('%d solutions with passives', len(passives_info_list))
 
         ### Designing amplifier and associated constant gm
         amp_dsn_mod = bag2_analog__amp_gm_mirr_dsn()
@@ -99,7 +102,7 @@ class span_ion__delay_sk_ord2_dsn(DesignModule):
         amp_optional_params = amp_dsn_params['optional_params'].copy()
         amp_optional_params.update(dict(voutcm=vincm))
 
-        print('Designing the amplifier...')
+        logger.info('Designing the amplifier...')
         amp_dsn_params.update(dict(vincm=vincm,
                                    cload=cload + C1*(1-beta_cap),
                                    specfile_dict=amp_specfile_dict,
@@ -115,13 +118,10 @@ class span_ion__delay_sk_ord2_dsn(DesignModule):
                                     sim_env=sim_env,
                                     res_side=amp_dsn_params['in_type']))
         try:
-            disable_print()
-            amp_info_list = amp_dsn_mod.meet_spec(**amp_dsn_params)
+            amp_info_list = self.design_child(amp_dsn_mod, 'meet_spec', **amp_dsn_params)
         except ValueError:
             amp_info_list = []
-        finally:
-            enable_print()
-        print(f'{len(amp_info_list)} amp solutions')
+        logger.info('%d amp solutions', len(amp_info_list))
 
         viable_op_list = []
 
@@ -131,19 +131,15 @@ class span_ion__delay_sk_ord2_dsn(DesignModule):
                 bias_dsn_params.update(dict(vref={amp_dsn_params['in_type'] : amp_dsn_info['vgtail']}))
                 
                 try:
-                    disable_print()
-                    bias_sch_params, bias_dsn_info = bias_dsn_mod.design(**bias_dsn_params)
+                    bias_sch_params, bias_dsn_info = self.design_child(bias_dsn_mod, **bias_dsn_params)
                 except ValueError:
                     continue
-                finally:
-                    enable_print()
 
                 # TODO lticircuit?
                 viable_op = dict(amp_dsn_info=amp_dsn_info,
                                  bias_dsn_info=bias_dsn_info,
                                  passives_info=passives_info)
-                print('(SUCCESS)')
-                pprint(viable_op)
+                logger.debug('(SUCCESS)\n%s', viable_op)
                 viable_op_list.append(viable_op)
         
         return viable_op_list
@@ -173,14 +169,14 @@ class span_ion__delay_sk_ord2_dsn(DesignModule):
 
         # No solution for strictly real resistor values 
         if sqrt_arg < 0:
-            print(f'Complex resistance value {sqrt_arg}')
+            self.reject('complex_resistance', sqrt_arg)
             return []
 
         R1_sols = [(k2 + np.sqrt(sqrt_arg)) / 2,
                    (k2 - np.sqrt(sqrt_arg)) / 2]
         R2_sols = [res_sum-R1 for R1 in R1_sols]
         R_sols_unfiltered = [(R1_sols[i], R2_sols[i]) for i in range(len(R1_sols))]
-        print(f'Unfiltered resistor solutions: {R_sols_unfiltered}')
+        logger.debug('Unfiltered resistor solutions: %s', R_sols_unfiltered)
         # Filter through computed solutions for constraints
         R_sols_filtered = []
         for i, R_vals in enumerate(R_sols_unfiltered):
@@ -6,14 +6,17 @@ import os
 import pkg_resources
 import numpy as np
 import warnings
+import logging
 
 from bag.design.module import Module
-from . import DesignModule, get_mos_db, estimate_vth, parallel, verify_ratio, num_den_add, enable_print, disable_print
+from . import DesignModule, get_mos_db, estimate_vth, parallel, verify_ratio, num_den_add
 from bag.data.lti import LTICircuit, get_w_3db, get_stability_margins, get_w_crossings
 
 from .amp_gm_mirr import bag2_analog__amp_gm_mirr_dsn
 from .constant_gm import bag2_analog__constant_gm_dsn
 
+logger = logging.getLogger(__name__)
+
 # noinspection PyPep8Naming
 class span_ion__delay_tt1_ord2_dsn(DesignModule):
     """Module for library span_ion cell delay_tt1_ord2 for a 
@@ -127,48 +130,39 @@ class span_ion__delay_tt1_ord2_dsn(DesignModule):
         # Design amplifiers
         amp_dsn_params_list[2].update(dict(cload=params['C2']))
         amp_dsn_params_list[2].update(amp_update_dict_list[2])
-        print('Designing AMP2...')
+        logger.info('Designing AMP2...')
         try:
-            disable_print()
-            amp2_dsn_lst = amp_dsn_mod.meet_spec(**(amp_dsn_params_list[2]))
+            amp2_dsn_lst = self.design_child(amp_dsn_mod, 'meet_spec', **(amp_dsn_params_list[2]))
         except ValueError:
             amp2_dsn_lst = []
-        finally:
-            enable_print()
 
-        print(f'{len(amp2_dsn_lst)} possibilities for AMP2')
-        print('Designing AMP1...')
+        logger.info('%d possibilities for AMP2', len(amp2_dsn_lst))
+        logger.info('Designing AMP1...')
         for amp2_dsn_info in amp2_dsn_lst:
             amp_dsn_params_list[1].update(dict(cload=cload+amp2_dsn_info['cin']))
             amp_dsn_params_list[1].update(amp_update_dict_list[1])
             try:
-                disable_print()
-                amp1_dsn_lst = amp_dsn_mod.meet_spec(**(amp_dsn_params_list[1]))
+                amp1_dsn_lst = self.design_child(amp_dsn_mod, 'meet_spec', **(amp_dsn_params_list[1]))
             except ValueError:
                 continue
-            finally:
-                enable_print()
 
-            print(f'{len(amp1_dsn_lst)} possibilities for AMP1')
+            logger.info('%d possibilities for AMP1', len(amp1_dsn_lst))
 
             for amp1_dsn_info in amp1_dsn_lst:
                 amp_dsn_params_list[0].update(dict(cload=params['C1']+amp1_dsn_info['cin']))
                 amp_dsn_params_list[0].update(amp_update_dict_list[0])
                 try:
-                    disable_print()
-                    amp0_dsn_lst = amp_dsn_mod.meet_spec(**(amp_dsn_params_list[0]))
+                    amp0_dsn_lst = self.design_child(amp_dsn_mod, 'meet_spec', **(amp_dsn_params_list[0]))
                 except ValueError:
                     continue
-                finally:
-                    enable_print()
 
-                print(f'{len(amp0_dsn_lst)} possibilities for AMP0')
+                logger.info('%d possibilities for AMP0', len(amp0_dsn_lst))
                 for amp0_dsn_info in amp0_dsn_lst:
                     amp_dsn_info_list.append([amp0_dsn_info.copy(), 
                                               amp1_dsn_info.copy(),
                                               amp2_dsn_info.copy()])
         
-        print('Designing biasing...')
+        logger.info('Designing biasing...')
         # Design biasing
         bias_dsn_mod_list = [bag2_analog__constant_gm_dsn()] * 3
         bias_update_dict_list = [dict(specfile_dict=bias_specfile_list[i],
@@ -179,7 +173,6 @@ class span_ion__delay_tt1_ord2_dsn(DesignModule):
                                       vdd=vdd) for i in range(3)]
         for amp_dsn_info in amp_dsn_info_list:
             try:
-                disable_print()
                 bias0_dsn_params = dict(bias_dsn_params_list[0])
                 bias0_dsn_params.update(dict(optional_params=bias_optional_params,
                                              vref={in_type_list[0] : amp_dsn_info[0]['vgtail']}))
@@ -195,13 +188,11 @@ class span_ion__delay_tt1_ord2_dsn(DesignModule):
                                              vref={in_type_list[2] : amp_dsn_info[2]['vgtail']}))
                 bias2_dsn_params.update(bias_update_dict_list[2])
 
-                bias0_sch_params, bias0_dsn_info = bias_dsn_mod_list[0].design(**bias0_dsn_params)
-                bias1_sch_params, bias1_dsn_info = bias_dsn_mod_list[1].design(**bias1_dsn_params)
-                bias2_sch_params, bias2_dsn_info = bias_dsn_mod_list[2].design(**bias2_dsn_params)
+                bias0_sch_params, bias0_dsn_info = self.design_child(bias_dsn_mod_list[0], **bias0_dsn_params)
+                bias1_sch_params, bias1_dsn_info = self.design_child(bias_dsn_mod_list[1], **bias1_dsn_params)
+                bias2_sch_params, bias2_dsn_info = self.design_child(bias_dsn_mod_list[2], **bias2_dsn_params)
             except ValueError:
                 continue
-            finally:
-                enable_print()
 
             viable_op = dict(amp_dsn_info=amp_dsn_info,
                              bias_sch_params=[bias0_sch_params.copy(),
@@ -210,8 +201,7 @@ class span_ion__delay_tt1_ord2_dsn(DesignModule):
                              bias_dsn_info=[bias0_dsn_info, bias1_dsn_info, bias2_dsn_info],
                              passives_info=passives_info)
             viable_op_list.append(viable_op)
-            print('(SUCCESS)')
-            pprint(viable_op)
+            logger.debug('(SUCCESS)\n%s', viable_op)
 
         self.other_params = dict(in_type_list=in_type_list,
                                  amp_specfile_list=amp_specfile_list,
@@ -6,17 +6,20 @@ import os
 import pkg_resources
 import numpy as np
 import warnings
+import logging
 from pprint import pprint
 
 from bag.design.module import Module
 from bag.core import BagProject
-from . import DesignModule, get_mos_db, estimate_vth, parallel, verify_ratio, num_den_add, enable_print, disable_print
+from . import DesignModule, get_mos_db, estimate_vth, parallel, verify_ratio, num_den_add, VerificationQueue, prepare_testbench, release_testbench
 from bag.data.lti import LTICircuit, get_w_3db, get_stability_margins
 from bag.io import load_sim_results, save_sim_results, load_sim_file
 
 from .amp_diff_mirr import bag2_analog__amp_diff_mirr_dsn
 from .constant_gm import bag2_analog__constant_gm_dsn
 
+logger = logging.getLogger(__name__)
+
 # noinspection PyPep8Naming
 class bag2_analog__regulator_ldo_series_dsn(DesignModule):
     """Module for library bag2_analog cell regulator_ldo_series
@@ -24,6 +27,8 @@ class bag2_analog__regulator_ldo_series_dsn(DesignModule):
     Fill in high level description here.
     """
 
+    parallel_sweep = True
+
     @classmethod
     def get_params_info(cls) -> Mapping[str,str]:
         # type: () -> Dict[str, str]
@@ -56,6 +61,7 @@ class bag2_analog__regulator_ldo_series_dsn(DesignModule):
             tb_stb_params = '',
             tb_loadreg_params = '',
             run_sim = 'True to check figures of merit against simulation rather than just LTI',
+            optional_params = 'Optional parameters. sim_workers=number of simulations to run at once with run_sim (default 1), amp_front=True to only bias amplifiers on the Pareto front of the amplifier candidates, amp_front_metrics=metrics for that front (default all, see DesignModule.metric_senses)',
         ))
         return ans
 
@@ -90,6 +96,9 @@ class bag2_analog__regulator_ldo_series_dsn(DesignModule):
         l_dict = params['l_dict']
         sim_env = params['sim_env']
         run_sim = params['run_sim']
+        optional_params = params.get('optional_params', dict())
+        amp_front = optional_params.get('amp_front', False)
+        amp_front_metrics = optional_params.get('amp_front_metrics', None)
 
         # TODO simulating
         tb_stb_params = params['tb_stb_params']
@@ -153,6 +162,10 @@ class bag2_analog__regulator_ldo_series_dsn(DesignModule):
         # Keep track of viable ops
         viable_op_list = []
 
+        # Candidates which pass LTI checks are simulated after the sweep
+        sim_queue = VerificationQueue(self.sim_backend, optional_params.get('sim_workers', 1))
+        sim_op_dict = dict()
+
         self.other_params = dict(l_dict=l_dict,
                                  w_dict={k:db.width_list[0] for k,db in db_dict.items()},
                                  th_dict=th_dict,
@@ -166,32 +179,33 @@ class bag2_analog__regulator_ldo_series_dsn(DesignModule):
         # Sweep gate bias voltage of the series device
         vg_min = vout+vth_ser
         vg_max = min(vdd+vth_ser, vdd)
-        vg_vec = np.arange(vg_min, vg_max, 10e-3)
+        vg_vec = self.partition_sweep(np.arange(vg_min, vg_max, 10e-3))
 
         for vg in vg_vec:
-            print('Designing the series device...')
+            logger.info('Designing the series device...')
             # Size the series device
             match_ser, ser_info = self.dsn_fet(vg=vg, **params)
             if not match_ser:
                 continue
-            print('Done')
+            logger.info('Done')
 
             # Design amplifier s.t. output bias = gate voltage
             # This is to maintain accuracy in the computational design proces
-            print('Designing the amplifier...')
+            logger.info('Designing the amplifier...')
             ser_op = ser_info['op']
             amp_cload = ser_op['cgg']
             amp_dsn_params.update(dict(cload=amp_cload,
                                        optional_params=dict(voutcm=vg),
                                        ibias=ibias_max))
             try:
-                disable_print()
-                amp_dsn_lst = amp_dsn_mod.meet_spec(**amp_dsn_params)
+                amp_dsn_lst = self.design_child(amp_dsn_mod, 'meet_spec', **amp_dsn_params)
             except ValueError:
                 continue
-            finally:
-                enable_print()
-            print(f'{len(amp_dsn_lst)} viable amps')
+            logger.info('%d viable amps', len(amp_dsn_lst))
+            if amp_front:
+                # Dominated amps are unlikely to give a better regulator
+                amp_dsn_lst = amp_dsn_mod.choose_pareto(amp_dsn_lst, amp_front_metrics)
+                logger.info('%d on the Pareto front', len(amp_dsn_lst))
 
             # For each possibility, design the biasing
             for amp_dsn_info in amp_dsn_lst:
@@ -204,15 +218,12 @@ class bag2_analog__regulator_ldo_series_dsn(DesignModule):
                                                 res_side='p'),
                                                 ibias=ibias_max-amp-dsn_info['ibias'])
 
-                print(f'Attempting to design biasing...')
+                logger.info('Attempting to design biasing...')
                 try:
-                    disable_print()
-                    _, bias_dsn_info = bias_dsn_mod.design(**bias_dsn_params)
+                    _, bias_dsn_info = self.design_child(bias_dsn_mod, **bias_dsn_params)
                 except ValueError:
                     continue
-                finally:
-                    enable_print()
-                print('Done')
+                logger.info('Done')
 
                 op_dict = {'in' : amp_dsn_info['op_in'],
                            'tail' : amp_dsn_info['op_tail'] ,
@@ -233,11 +244,11 @@ class bag2_analog__regulator_ldo_series_dsn(DesignModule):
                                               cload=cload)
 
                 if psrr_lti < psrr_min:
-                    print(f'psrr {psrr_lti}')
+                    self.reject('psrr', psrr_lti)
                     continue
 
                 if psrr_fbw_lti < psrr_fbw_min:
-                    print(f'psrr fbw {psrr_fbw_lti}')
+                    self.reject('psrr_fbw', psrr_fbw_lti)
                     continue
 
                 ## Check phase margin
@@ -251,13 +262,13 @@ class bag2_analog__regulator_ldo_series_dsn(DesignModule):
                     pm_lti = -1
 
                 if pm_lti < pm_min:
-                    print(f'pm {pm_lti}')
+                    self.reject('pm', pm_lti)
                     continue
 
                 ## Check load regulation
                 loadreg_eqn = self._get_loadreg_eqn()
                 if loadreg_eqn > loadreg_max:
-                    print(f'loadreg {loadreg_eqn}')
+                    self.reject('loadreg', loadreg_eqn)
                     continue
 
                 op = dict(amp_params=amp_dsn_info,
@@ -275,16 +286,15 @@ class bag2_analog__regulator_ldo_series_dsn(DesignModule):
 
                 ### Run simulations if desired
                 if run_sim:
-                    prj = BagProject()
                     tb_sch_params = self.get_sch_params(op)
                     ## Check PSRR
                     psrr_sim, psrr_fbw_sim = self._get_psrr_sim()
                     if psrr_sim < psrr_min:
-                        print(f'psrr {psrr_sim}')
+                        self.reject('psrr_sim', psrr_sim)
                         continue
                     
                     if psrr_fbw_sim < psrr_fbw_min:
-                        print(f'psrr fbw {psrr_fbw_sim}')
+                        self.reject('psrr_fbw_sim', psrr_fbw_sim)
                         continue
 
                     ## Check phase margin
@@ -293,23 +303,14 @@ class bag2_analog__regulator_ldo_series_dsn(DesignModule):
                                        VDD=vdd,
                                        VGTAIL=amp_dsn_info['vgtail'],
                                        VREF=vout)
-                    tb_stb_params = dict(tb_stb_params)
-                    tb_stb_params.update(dict(prj=prj,
-                                              params=tb_sch_params,
-                                              tb_vars=tb_stb_vars,
-                                              num=tb_num))
-
-                    print('Simulating stability...')
-                    pm_sim = self._get_stb_sim(**tb_stb_params)
-                    print('...done')
-
-                    if pm_sim < pm_min:
-                        print(f'pm {pm_sim}')
-                        tb_num = tb_num + 1
-                        continue
-
-                    ## Check load regulation
-                    tb_loadreg_params = dict(tb_loadreg_params)
+                    tb_stb_spec = dict(tb_lib=tb_stb_params['tb_lib'],
+                                       tb_cell=tb_stb_params['tb_cell'],
+                                       impl_lib=tb_stb_params['impl_lib'],
+                                       tb_gen_name=self._get_tb_gen_name(tb_stb_params['tb_gen_name'], tb_num),
+                                       params=tb_sch_params,
+                                       tb_vars=tb_stb_vars)
+
+                    ## Check load regulation, only simulated if stable
                     # Default values
                     tb_loadreg_vars_init = tb_loadreg_params['tb_vars']
                     tb_loadreg_vars = dict(DUTYCYCLE=0.5,
@@ -320,30 +321,45 @@ class bag2_analog__regulator_ldo_series_dsn(DesignModule):
                                            VDD=vdd,
                                            vref=vout)
                     tb_loadreg_vars.update(tb_loadreg_params['tb_vars'])
-                    tb_loadreg_params.update(dict(prj=prj,
-                                                  params=tb_sch_params,
-                                                  tb_vars=tb_loadreg_vars,
-                                                  num=tb_num))
-
-                    print('Simulating load regulation...')
-                    loadreg_sim = self._get_loadreg_sim(**tb_loadreg_params)
-                    print('...done')
-
-                    if loadreg_sim > loadreg_max:
-                        print(f'load reg {loadreg_sim}')
-                        tb_num = tb_num + 1
-                        continue
-                        
+                    tb_loadreg_spec = dict(tb_lib=tb_loadreg_params['tb_lib'],
+                                           tb_cell=tb_loadreg_params['tb_cell'],
+                                           impl_lib=tb_loadreg_params['impl_lib'],
+                                           tb_gen_name=self._get_tb_gen_name(tb_loadreg_params['tb_gen_name'], tb_num),
+                                           params=tb_sch_params,
+                                           tb_vars=tb_loadreg_vars)
+
+                    op.update(psrr=psrr_sim,
+                              psrr_fbw=psrr_fbw_sim)
+                    sim_queue.submit(('stb', tb_num), tb_stb_spec, self._get_stb_results)
+                    sim_op_dict[tb_num] = (op, tb_loadreg_spec)
                     tb_num = tb_num + 1
+                    continue
+
+                logger.debug('(SUCCESS)\n%s', op)
+                viable_op_list.append(op)
 
-                    op.update(pm=pm_sim,
-                              psrr=psrr_sim,
-                              psrr_fbw=psrr_fbw_sim,
-                              loadreg=loadreg_sim)
+        if len(sim_queue) > 0:
+            logger.info('Simulating %d candidates...', len(sim_queue))
+        sim_result_dict = dict()
+        for (sim_type, tb_num), sim_val in sim_queue.run():
+            op, tb_loadreg_spec = sim_op_dict[tb_num]
+            if sim_type == 'stb':
+                if sim_val < pm_min:
+                    self.reject('pm_sim', sim_val)
+                    continue
+                op.update(pm=sim_val)
+                sim_queue.submit(('loadreg', tb_num), tb_loadreg_spec, self._get_loadreg_results)
+                continue
 
+            if sim_val > loadreg_max:
+                self.reject('loadreg_sim', sim_val)
+                continue
+            op.update(loadreg=sim_val)
+            sim_result_dict[tb_num] = op
+            logger.debug('(SUCCESS)\n%s', op)
 
-                pprint(op)
-                viable_op_list.append(op)
+        # In submission order so the result doesn't depend on simulation times
+        viable_op_list.extend(sim_result_dict[k] for k in sorted(sim_result_dict.keys()))
 
         return viable_op_list
 
@@ -460,75 +476,52 @@ class bag2_analog__regulator_ldo_series_dsn(DesignModule):
         Outputs:
             pm: Simultaed phase margin in degrees
         '''
-        prj = spec['prj']
-        tb_vars = spec['tb_vars']
-        tb_lib = spec['tb_lib']
-        tb_cell = spec['tb_cell']
-        impl_lib = spec['impl_lib']
-        # impl_cell = spec['impl_cell']
-        tb_gen_name = self._get_tb_gen_name(spec['tb_gen_name'], spec['num'])
-
-        # generate testbench schematic
-        tb_dsn = prj.create_design_module(tb_lib, tb_cell)
-        tb_dsn.design(**spec['params'])
-        tb_dsn.implement_design(impl_lib, top_cell_name=tb_gen_name)
-
-        # copy and load ADEXL state of generated testbench
-        tb_obj = prj.configure_testbench(impl_lib, tb_gen_name)
-
-        # Assign testbench design variables (the ones that show in ADE)
-        for param_name, param_val in tb_vars.items():
-            tb_obj.set_parameter(param_name, param_val)
-
-        # Update testbench changes and run simulation
-        tb_obj.update_testbench()
-        print(f'Simulating testbench {tb_gen_name}')
-        save_dir = tb_obj.run_simulation()
-
-        # Load simulation results into Python
-        print('Simulation done, loading results')
-        results = load_sim_results(save_dir)
+        return self._get_stb_results(self._run_tb_sim(**spec))
 
+    def _get_stb_results(self, results:Mapping[str,Any]) -> float:
         pm = results.get('stb_pm', np.inf)
 
         return pm
 
     def _get_loadreg_sim(self, **spec):
-        prj = spec['prj']
-        tb_vars = spec['tb_vars']
-        tb_lib = spec['tb_lib']
-        tb_cell = spec['tb_cell']
-        impl_lib = spec['impl_lib']
-        # impl_cell = spec['impl_cell']
-        tb_gen_name = self._get_tb_gen_name(spec['tb_gen_name'], spec['num'])
+        return self._get_loadreg_results(self._run_tb_sim(**spec))
 
-        # Generate testbench schematic
-        tb_dsn = prj.create_design_module(tb_lib, tb_cell)
-        tb_dsn.design(**(spec['params']))
-        tb_dsn.implement_design(impl_lib, top_cell_name=tb_gen_name)
-
-        # Copy and load ADEXL state of generated testbench
-        tb_obj = prj.configure_testbench(impl_lib, tb_gen_name)
-
-        # Assign testbench design variables (the ones that show in ADE)
-        for param_name, param_val in tb_vars.items():
-            tb_obj.set_parameter(param_name, param_val)
+    def _get_loadreg_results(self, results:Mapping[str,Any]) -> float:
+        vreg = results['tran_vreg']
+        return abs(min(vreg)-max(vreg))
+        # return min(vreg), max(vreg)
 
-        # Update testbench changes and run simulation
-        tb_obj.update_testbench()
-        print(f'Simulating testbench {tb_gen_name}')
+    def _run_tb_sim(self, **spec) -> Mapping[str,Any]:
+        '''
+        Generates and simulates a testbench. Inputs are the same as _get_stb_sim.
+        Outputs:
+            results: Loaded simulation results.
+        '''
+        tb_gen_name = self._get_tb_gen_name(spec['tb_gen_name'], spec['num'])
+        tb_obj = prepare_testbench(prj=spec['prj'],
+                                   tb_lib=spec['tb_lib'],
+                                   tb_cell=spec['tb_cell'],
+                                   impl_lib=spec['impl_lib'],
+                                   tb_gen_name=tb_gen_name,
+                                   params=spec['params'],
+                                   tb_vars=spec['tb_vars'])
+
+        # Run simulation
+        logger.info('Simulating testbench %s', tb_gen_name)
         save_dir = tb_obj.run_simulation()
 
         # Load simulation results into Python
-        print("Simulation done, loading results")
+        logger.info('Simulation done, loading results')
         results = load_sim_results(save_dir)
-
-        vreg = results['tran_vreg']
-        return abs(min(vreg)-max(vreg))
-        # return min(vreg), max(vreg)
+        release_testbench(tb_obj)
+        return results
 
     def _get_tb_gen_name(self, base, num):
-        return f'{base}_{num}'
+        # Sweep chunks run in separate workers that each count from 0, so
+        # tag the name with the chunk index to keep testbenches distinct
+        if self.sweep_chunk == None:
+            return f'{base}_{num}'
+        return f'{base}_c{self.sweep_chunk[0]}_{num}'
 
 
     def op_compare(self, op1:Mapping[str,Any], op2:Mapping[str,Any]):
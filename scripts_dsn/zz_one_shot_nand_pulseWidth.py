@@ -6,15 +6,18 @@ import os
 import pkg_resources
 import numpy as np
 import warnings
+import logging
 from pprint import pprint
 import csv
 
 from bag.design.module import Module
 from bag.core import BagProject
-from . import DesignModule, get_mos_db, estimate_vth, parallel, verify_ratio, num_den_add, enable_print, disable_print
+from . import DesignModule, get_mos_db, estimate_vth, parallel, verify_ratio, num_den_add, enable_print, disable_print, VerificationQueue, get_pulse_widths, make_mc_records, append_mc_records, RunningStats, QuantileSketch
 from bag.data.lti import LTICircuit, get_w_3db, get_stability_margins, get_w_crossings
 from bag.io import load_sim_results, save_sim_results, load_sim_file
 
+logger = logging.getLogger(__name__)
+
 # noinspection PyPep8Naming
 class span_ion__zz_one_shot_nand_pulseWidth_dsn(DesignModule):
     """Module for library span_ion cell zz_one_shot_nand_pulseWidth
@@ -45,8 +48,9 @@ class span_ion__zz_one_shot_nand_pulseWidth_dsn(DesignModule):
             td_power = '',
             tstop = '',
             num_sims = 'Number of Monte Carlo sims for a single run',
-            output_fname = 'CSV file without suffix for pulse widths',
-            seed_offset = 'Offset from 1 for the seed for Monte Carlo simulations. Increment by 1 per simulation.'
+            output_fname = 'File without suffix for pulse widths',
+            seed_offset = 'Offset from 1 for the seed for Monte Carlo simulations. Increment by 1 per simulation.',
+            optional_params = 'Optional parameters. num_workers=number of simulations to run at once, checkpoint_size=number of rows per code to write at a time (default all at the end), output_format=csv for {output_fname}_{code}.csv (default) or bin for one {output_fname}.bin of every code (see load_mc_records), ci_target=stop a code once the confidence interval on its mean pulse width is within this fraction of the mean, ci_z=standard errors for that interval (default 1.96), min_sims=runs before stopping early (default 30), quantile_acc=relative accuracy of pulse width quantiles (default 0.01)',
         ))
         return ans
 
@@ -60,6 +64,15 @@ class span_ion__zz_one_shot_nand_pulseWidth_dsn(DesignModule):
         num_sims = params['num_sims']
         output_fname = params['output_fname']
         seed_offset = params['seed_offset']
+        optional_params = params.get('optional_params', dict())
+        num_workers = optional_params.get('num_workers', 1)
+        checkpoint_size = optional_params.get('checkpoint_size', None)
+        output_format = optional_params.get('output_format', 'csv')
+        assert output_format in ('csv', 'bin'), f'Unknown output format {output_format}'
+        ci_target = optional_params.get('ci_target', None)
+        ci_z = optional_params.get('ci_z', 1.96)
+        min_sims = optional_params.get('min_sims', 30)
+        quantile_acc = optional_params.get('quantile_acc', 0.01)
 
         assert num_bits < 3, f'Currently only supports up to 2 bits (not {num_bits})'
 
@@ -80,104 +93,125 @@ class span_ion__zz_one_shot_nand_pulseWidth_dsn(DesignModule):
                        TD_POWER=td_power,
                        TSTOP=tstop)
 
-        # Generate testbench schematic
-        prj = BagProject()
-        tb = prj.create_design_module(tb_lib, tb_cell)
-        tb.design(**dut_params)
-        tb.implement_design(impl_lib, top_cell_name=impl_cell)
-
-        # Copy and load ADEXL state of generated testbench
-        tb_obj = prj.configure_testbench(impl_lib, impl_cell)
+        def measure_pulse_widths(results):
+            return self._get_pulse_widths(results['time'], results['tran_vout'], vdd/2)
 
-        # Iterate across digital codes
+        # Every (code, seed) is its own job. Seeds belong to the job rather than
+        # the worker, so results don't depend on num_workers. Testbenches are
+        # reused between jobs, one per simulation running at once.
+        sim_queue = VerificationQueue(self.sim_backend, num_workers)
         num_codes = int(round(2**num_bits))
+        cap_val = dut_params['cap_params']['cap_val'] # Sometimes cap doesn't set correctly
         for code in range(num_codes):
-            # Specifying the code associated with the file
-            output_fname_full = f'{output_fname}_{code}.csv'
-
             # Assign testbench design variables (the ones that show in ADE)
-            var_b0 = code % 2
-            var_b1 = code // 2
-            cap_val = dut_params['cap_params']['cap_val'] # Sometimes cap doesn't set correctly
-
-            tb_vars.update(dict(b0=var_b0,
-                                b1=var_b1,
-                                CAP_VAL=cap_val))
-
-            for param_name, param_val in tb_vars.items():
-                tb_obj.set_parameter(param_name, param_val)
-
-            # Update testbench changes and run simulation
-            tb_obj.update_testbench()
-            print(f'Simulating code {code}...')
+            code_vars = dict(tb_vars,
+                             b0=code % 2,
+                             b1=code // 2,
+                             CAP_VAL=cap_val)
             for i in range(num_sims):
-                print(f'\t {i+1}/{num_sims}')
                 idx_run = i + 1 + seed_offset
-                save_dir = tb_obj.run_simulation(sim_type='mc', sim_info=dict(idx_run=idx_run))
-                # Load simulation results into Python
-                results = load_sim_results(save_dir)
-                t_vec = results['time']
-                v_vec = results['tran_vout']
-                data_dict = {t_vec[i]:v_vec[i] for i in range(len(t_vec))}
-
-                # Get pulse width data
-                pulse_widths = self._get_pulse_widths(data_dict, vdd/2)
-
-                # Write to a row in a CSV file
-                with open(output_fname_full, 'a', newline='') as csvfile:
-                    spamwriter = csv.writer(csvfile, delimiter=',')
-                    spamwriter.writerow(pulse_widths)
+                job_num = code*num_sims + i
+                tb_spec = dict(tb_lib=tb_lib,
+                               tb_cell=tb_cell,
+                               impl_lib=impl_lib,
+                               tb_gen_name=impl_cell if job_num == 0 else f'{impl_cell}_{job_num}',
+                               params=dut_params,
+                               tb_vars=code_vars)
+                sim_queue.submit((code, idx_run), tb_spec, measure_pulse_widths,
+                                 sim_kwargs=dict(sim_type='mc', sim_info=dict(idx_run=idx_run)))
+
+        # Live statistics of every pulse width, per code
+        self.mc_stats = {code:dict(num_runs=0,
+                                   moments=RunningStats(),
+                                   quantiles=QuantileSketch(quantile_acc)) for code in range(num_codes)}
+
+        # Rows go out (and into the statistics) in seed order, so only once
+        # every earlier seed of that code is done. Early stopping then
+        # doesn't depend on which simulations finish first.
+        row_dict = {code:dict() for code in range(num_codes)}
+        row_ready = {code:[] for code in range(num_codes)}
+        idx_next = {code:1+seed_offset for code in range(num_codes)}
+        code_done = set()
+        num_done = 0
+        logger.info('Simulating %d codes, %d runs each...', num_codes, num_sims)
+        for (code, idx_run), pulse_widths in sim_queue.run():
+            num_done = num_done + 1
+            logger.debug('\t %d/%d (code %d, run %d)', num_done, num_codes*num_sims, code, idx_run)
+            if code in code_done:
+                continue
+            row_dict[code][idx_run] = pulse_widths
+            code_stats = self.mc_stats[code]
+            while idx_next[code] in row_dict[code] and code not in code_done:
+                row = row_dict[code].pop(idx_next[code])
+                row_ready[code].append((idx_next[code], row))
+                idx_next[code] = idx_next[code] + 1
+                code_stats['num_runs'] = code_stats['num_runs'] + 1
+                code_stats['moments'].add(row)
+                code_stats['quantiles'].add(row)
+
+                moments = code_stats['moments']
+                if ci_target != None and code_stats['num_runs'] >= min_sims \
+                    and moments.ci_halfwidth(ci_z) <= ci_target*abs(moments.mean):
+                    logger.info('Code %d converged after %d runs', code, code_stats['num_runs'])
+                    code_done.add(code)
+                    idx_last = idx_next[code] - 1
+                    sim_queue.cancel(lambda tag, code=code, idx_last=idx_last: tag[0] == code and tag[1] > idx_last)
+
+            if checkpoint_size != None and len(row_ready[code]) >= checkpoint_size:
+                self._write_rows(output_fname, output_format, code, row_ready[code])
+                row_ready[code] = []
+                self._print_mc_stats(code, ci_z)
+
+        for code in range(num_codes):
+            self._write_rows(output_fname, output_format, code, row_ready[code])
+            self._print_mc_stats(code, ci_z)
         
         return []
 
-
-    def _get_pulse_widths(self, data_dict, sig_threshold, posedge=True):
+    def _print_mc_stats(self, code:int, ci_z:float) -> None:
+        if not logger.isEnabledFor(logging.INFO):
+            return
+        code_stats = self.mc_stats[code]
+        moments = code_stats['moments']
+        quantiles = code_stats['quantiles']
+        logger.info('Code %s: %d runs, %d pulses, mean %.4g +/- %.2g, std %.4g, p5/p50/p95 %.4g/%.4g/%.4g',
+                    code, code_stats['num_runs'], moments.count,
+                    moments.mean, moments.ci_halfwidth(ci_z), moments.std,
+                    quantiles.quantile(0.05), quantiles.quantile(0.5), quantiles.quantile(0.95))
+
+    def _write_rows(self, output_fname:str, output_format:str, code:int,
+                    rows:List[Tuple[int,List[float]]]) -> None:
+        '''
+        Appends pulse widths for a code to the output file(s).
+        Inputs:
+            output_fname:   File name without suffix.
+            output_format:  csv or bin, see get_params_info.
+            code:           Digital code the rows are for.
+            rows:           (seed, pulse widths) of each run, in order.
+        '''
+        if len(rows) < 1:
+            return
+        if output_format == 'bin':
+            seed_list, widths_list = zip(*rows)
+            append_mc_records(f'{output_fname}.bin', make_mc_records(code, seed_list, widths_list))
+            return
+        with open(f'{output_fname}_{code}.csv', 'a', newline='') as csvfile:
+            spamwriter = csv.writer(csvfile, delimiter=',')
+            spamwriter.writerows(widths for _, widths in rows)
+
+    def _get_pulse_widths(self, t_vec, sig_vec, sig_threshold, posedge=True):
         '''
         Inputs:
-            data_dict:      Key:value is time:signal value.
+            t_vec:          Sample times.
+            sig_vec:        Signal value at each time.
             sig_threshold:  Threshold for determining an edge crossing. Used for linear interpolation.
             posedge:        Boolean. True to indicate that a rising edge is the start of a pulse.
                             False indicates a pulse is active low.
         Outputs:
             Returns a list of pulse widths in the order in which they appear.
+            An edge ending a pulse before any pulse has started is ignored.
         '''
-        t_vec = list(data_dict.keys())
-        t_vec.sort()
-        sig_vec = [data_dict[t] for t in t_vec]
-        result = []
-
-        # Finding zero crossings of down-shifted signal vector
-        sig_vec_shifted = [sig_val-sig_threshold for sig_val in sig_vec]
-        zcross_start_idx = np.where(np.diff(np.signbit(sig_vec_shifted)))[0]
-
-        # Linear interpolation of times
-        for zcross_idx in zcross_start_idx:
-            val_start = sig_vec_shifted[zcross_idx]
-            val_stop = sig_vec_shifted[zcross_idx + 1]
-
-            frac = val_start / (val_start - val_stop)
-
-            tedge_start = t_vec[zcross_idx]
-            tedge_stop = t_vec[zcross_idx + 1]
-
-            t_cross = tedge_start + frac * (tedge_stop - tedge_start)
-
-            if val_start > val_stop:
-                t_negedge = t_cross
-                if posedge:
-                    result = result + [t_negedge - t_posedge]
-                    t_negedge = np.inf
-                    t_posedge = -np.inf
-            elif val_start < val_stop:
-                t_posedge = t_cross
-                if not posedge:
-                    result = result + [t_posedge - t_negedge]
-                    t_negedge = -np.inf
-                    t_posedge = np.inf
-            else:
-                raise ValueError("(get_pulse_widths) Edge detection isn't actually an edge!")
-
-        return result
+        return get_pulse_widths(t_vec, sig_vec, sig_threshold, posedge=posedge).tolist()
 
     def op_compare(self, op1:Mapping[str,Any], op2:Mapping[str,Any]):
         """Returns the best operating condition based on 
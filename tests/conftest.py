@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""Lets scripts_dsn be imported without BAG or the verification package,
+e.g. to test its numerical helpers offline. Only the names scripts_dsn
+imports at the module level are stubbed, and only if the real packages
+aren't installed.
+"""
+import os, sys, types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def _add_stub_module(name:str, **attrs) -> None:
+    mod = types.ModuleType(name)
+    mod.__dict__.update(attrs)
+    sys.modules[name] = mod
+    parent_name, _, child_name = name.rpartition('.')
+    if parent_name:
+        setattr(sys.modules[parent_name], child_name, mod)
+
+class _StubModule(object):
+    pass
+
+class _StubMOSDBDiscrete(object):
+    def __init__(self, *args, **kwargs):
+        raise RuntimeError('verification is not installed')
+
+class _StubFloatBinaryIterator(object):
+    def __init__(self, low, high, tol=1e-15, search_step=None):
+        self.low, self.high, self.tol = low, high, tol
+        self.current = (low+high)/2
+
+    def has_next(self):
+        return self.high - self.low > self.tol
+
+    def get_next(self):
+        return self.current
+
+    def up(self):
+        self.low = self.current
+        self.current = (self.low+self.high)/2
+
+    def down(self):
+        self.high = self.current
+        self.current = (self.low+self.high)/2
+
+def _stub_load_sim_results(save_dir):
+    raise RuntimeError('bag is not installed')
+
+try:
+    import bag
+except ImportError:
+    _add_stub_module('bag')
+    _add_stub_module('bag.design')
+    _add_stub_module('bag.design.module', Module=_StubModule)
+    _add_stub_module('bag.util')
+    _add_stub_module('bag.util.search', FloatBinaryIterator=_StubFloatBinaryIterator)
+    _add_stub_module('bag.io', load_sim_results=_stub_load_sim_results)
+
+try:
+    import verification.mos.query
+except ImportError:
+    _add_stub_module('verification')
+    _add_stub_module('verification.mos')
+    _add_stub_module('verification.mos.query', MOSDBDiscrete=_StubMOSDBDiscrete)
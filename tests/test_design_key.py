@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+import os
+
+from scripts_dsn import DesignModule, get_design_key, invalidate_mos_db
+
+class _Design(DesignModule):
+    pass
+
+def _make_device(tmp_path):
+    data_dir = tmp_path / 'nch_data'
+    data_dir.mkdir()
+    (data_dir / 'ibias.hdf5').write_bytes(b'0')
+    spec_file = tmp_path / 'nch.yaml'
+    spec_file.write_text(f'root_dir: {data_dir}\nsummary_fname: summary.yaml\nlch: [1, 2]\n')
+    return str(spec_file), data_dir
+
+def test_spec_file_edit(tmp_path):
+    spec_file, _ = _make_device(tmp_path)
+    params = dict(specfile_dict=dict(n=spec_file), vdd=1.0)
+    key = get_design_key(_Design, params)
+    assert get_design_key(_Design, dict(params)) == key
+    assert get_design_key(_Design, dict(params, vdd=1.1)) != key
+
+    with open(spec_file, 'a') as f:
+        f.write('# edited\n')
+    invalidate_mos_db(spec_file)
+    assert get_design_key(_Design, params) != key
+
+def test_recharacterized(tmp_path):
+    spec_file, data_dir = _make_device(tmp_path)
+    params = dict(specfile_dict=dict(n=spec_file), vdd=1.0)
+    key = get_design_key(_Design, params)
+
+    # New data without touching the spec file
+    data_file = data_dir / 'ibias.hdf5'
+    data_file.write_bytes(b'1')
+    mtime = os.path.getmtime(data_file) + 10
+    os.utime(data_file, (mtime, mtime))
+    # Data is only checked again after invalidating
+    assert get_design_key(_Design, params) == key
+    invalidate_mos_db(spec_file)
+    key_new = get_design_key(_Design, params)
+    assert key_new != key
+
+    (data_dir / 'gm.hdf5').write_bytes(b'0')
+    invalidate_mos_db()
+    assert get_design_key(_Design, params) != key_new
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from scripts_dsn import DesignModule, invalidate_mos_db, set_prefilter_cache_params, clear_prefilter_cache
+
+class _CountingDesign(DesignModule):
+    spec_limit_keys = ('gain',)
+    num_sweeps = 0
+
+    def meet_spec(self, **params):
+        type(self).num_sweeps += 1
+        return [dict(gain=g, ibias=params['scale']*g) for g in range(10)]
+
+    def filter_candidates(self, op_list, **params):
+        return [op for op in op_list if op['gain'] >= params['gain']]
+
+@pytest.fixture(autouse=True)
+def _reset_cache():
+    set_prefilter_cache_params(max_size=16)
+    _CountingDesign.num_sweeps = 0
+    yield
+    clear_prefilter_cache()
+
+def _write_spec(tmp_path, name):
+    spec_file = tmp_path / name
+    spec_file.write_text('root_dir: data\n')
+    return str(spec_file)
+
+def test_refilter(tmp_path):
+    spec_file = _write_spec(tmp_path, 'nch.yaml')
+    dsn = _CountingDesign()
+    assert len(dsn.meet_spec_incremental(spec_file=spec_file, scale=1, gain=3, optional_params=dict())) == 7
+    assert len(dsn.meet_spec_incremental(spec_file=spec_file, scale=1, gain=8, optional_params=dict())) == 2
+    assert _CountingDesign.num_sweeps == 1
+
+def test_invalidate(tmp_path):
+    spec_n = _write_spec(tmp_path, 'nch.yaml')
+    spec_p = _write_spec(tmp_path, 'pch.yaml')
+    dsn = _CountingDesign()
+    dsn.meet_spec_incremental(spec_file=spec_n, scale=1, gain=3, optional_params=dict())
+    dsn.meet_spec_incremental(spec_file=spec_p, scale=1, gain=3, optional_params=dict())
+    assert _CountingDesign.num_sweeps == 2
+
+    # Only sweeps using the re-characterized device run again
+    invalidate_mos_db(spec_p)
+    dsn.meet_spec_incremental(spec_file=spec_n, scale=1, gain=5, optional_params=dict())
+    assert _CountingDesign.num_sweeps == 2
+    dsn.meet_spec_incremental(spec_file=spec_p, scale=1, gain=5, optional_params=dict())
+    assert _CountingDesign.num_sweeps == 3
+
+    invalidate_mos_db()
+    dsn.meet_spec_incremental(spec_file=spec_n, scale=1, gain=5, optional_params=dict())
+    assert _CountingDesign.num_sweeps == 4
+
+def test_max_size(tmp_path):
+    spec_file = _write_spec(tmp_path, 'nch.yaml')
+    set_prefilter_cache_params(max_size=2)
+    dsn = _CountingDesign()
+    for scale in (1, 2, 1, 3):
+        dsn.meet_spec_incremental(spec_file=spec_file, scale=scale, gain=3, optional_params=dict())
+    assert _CountingDesign.num_sweeps == 3
+    # scale=2 was the least recently used
+    dsn.meet_spec_incremental(spec_file=spec_file, scale=1, gain=3, optional_params=dict())
+    assert _CountingDesign.num_sweeps == 3
+    dsn.meet_spec_incremental(spec_file=spec_file, scale=2, gain=3, optional_params=dict())
+    assert _CountingDesign.num_sweeps == 4
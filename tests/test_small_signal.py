@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+from scripts_dsn import SmallSignalBatch
+
+def _get_tran_info(gm, gds, cdb=0.0, cgs=0.0):
+    zero = np.zeros_like(np.asarray(gm, dtype=float))
+    return dict(gm=gm, gb=zero, gds=gds, cgd=zero, cgs=zero+cgs, cgb=zero,
+                cds=zero, cdb=zero+cdb, csb=zero)
+
+def _single_pole_specs(gain, fp):
+    """(gain, fbw, ugf, pm) of gain/(1+s/(2*pi*fp))
+    """
+    gain = np.abs(gain)
+    ugf = fp*np.sqrt(gain**2-1)
+    pm = 180 - np.degrees(np.arctan(ugf/fp))
+    return gain, fp, ugf, pm
+
+def test_common_source():
+    gm = np.array([1e-3, 2e-3, 5e-3])
+    gds = np.array([1e-5, 4e-5, 2e-5])
+    cload = 1e-12
+    rload = 1e6
+
+    ss = SmallSignalBatch()
+    ss.add_transistor(_get_tran_info(gm, gds, cgs=5e-15), 'out', 'in', 'gnd')
+    ss.add_res(rload, 'out', 'gnd')
+    ss.add_cap(cload, 'out', 'gnd')
+    gain, fbw, ugf, pm = ss.get_specs({'in' : 1}, 'out')
+
+    gout = gds + 1/rload
+    gain_ref, fbw_ref, ugf_ref, pm_ref = _single_pole_specs(gm/gout, gout/(2*np.pi*cload))
+    assert gain.shape == gm.shape
+    assert np.all(gain < 0)
+    np.testing.assert_allclose(np.abs(gain), gain_ref, rtol=1e-9)
+    np.testing.assert_allclose(fbw, fbw_ref, rtol=1e-6)
+    np.testing.assert_allclose(ugf, ugf_ref, rtol=1e-6)
+    np.testing.assert_allclose(pm, pm_ref, atol=1e-3)
+
+def test_common_source_batch_shape():
+    # Finger counts broadcast against the operating points
+    gm = np.array([1e-3, 2e-3])[:, None]
+    nf = np.array([1, 2, 4])[None, :]
+    gds = 1e-5
+    cload = 1e-12
+
+    ss = SmallSignalBatch()
+    ss.add_transistor(_get_tran_info(gm, gds*np.ones_like(gm)), 'out', 'in', 'gnd', fg=nf)
+    ss.add_cap(cload, 'out', 'gnd')
+    gain, fbw, ugf, pm = ss.get_specs({'in' : 1}, 'out')
+
+    assert gain.shape == (2, 3)
+    np.testing.assert_allclose(gain, -gm/gds*np.ones(nf.shape), rtol=1e-9)
+    np.testing.assert_allclose(fbw, nf*gds/(2*np.pi*cload)*np.ones(gm.shape), rtol=1e-6)
+
+def test_no_unity_gain_crossing():
+    ss = SmallSignalBatch()
+    ss.add_transistor(_get_tran_info(np.array([1e-4]), np.array([2e-4])), 'out', 'in', 'gnd')
+    ss.add_cap(1e-12, 'out', 'gnd')
+    gain, fbw, ugf, pm = ss.get_specs({'in' : 1}, 'out')
+
+    np.testing.assert_allclose(gain, [-0.5], rtol=1e-9)
+    assert ugf[0] == 0
+    assert np.isinf(pm[0])
+
+def test_five_transistor_amp():
+    # NMOS input pair, PMOS mirror load, ideal tail current source
+    gm_in = np.array([1e-3, 2e-3])
+    gds_in = np.array([1e-5, 1e-5])
+    gm_load = np.array([2e-3, 4e-3])
+    gds_load = np.array([2e-5, 1e-5])
+    cload = 1e-12
+    cmirr = 1e-15
+
+    ss = SmallSignalBatch()
+    ss.add_transistor(_get_tran_info(gm_in, gds_in), 'mirr', 'inp', 'tail')
+    ss.add_transistor(_get_tran_info(gm_in, gds_in), 'out', 'inn', 'tail')
+    ss.add_transistor(_get_tran_info(gm_load, gds_load, cdb=cmirr), 'mirr', 'mirr', 'gnd')
+    ss.add_transistor(_get_tran_info(gm_load, gds_load), 'out', 'mirr', 'gnd')
+    ss.add_cap(cload, 'out', 'gnd')
+    gain, fbw, ugf, pm = ss.get_specs({'inp' : 0.5, 'inn' : -0.5}, 'out')
+
+    # The mirror pole is far above the UGF, so the usual single-pole
+    # approximations hold to well within a percent
+    rout = 1/(gds_in + gds_load)
+    assert np.all(gain > 0)
+    np.testing.assert_allclose(gain, gm_in*rout, rtol=1e-2)
+    np.testing.assert_allclose(fbw, 1/(2*np.pi*rout*cload), rtol=1e-2)
+    np.testing.assert_allclose(ugf, gm_in/(2*np.pi*cload), rtol=1e-2)
+    assert np.all(np.abs(pm - 90) < 2)
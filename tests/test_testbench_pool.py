@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from scripts_dsn import prepare_testbench, release_testbench, clear_tb_pool, get_tb_pool_stats
+
+class _FakeTestbench(object):
+    def __init__(self, cell_name):
+        self.cell_name = cell_name
+        self.tb_vars = dict()
+        self.num_updates = 0
+
+    def set_parameter(self, name, val):
+        self.tb_vars[name] = val
+
+    def update_testbench(self):
+        self.num_updates += 1
+
+class _FakeDesignModule(object):
+    def __init__(self, prj):
+        self.prj = prj
+
+    def design(self, **params):
+        self.params = params
+
+    def implement_design(self, impl_lib, top_cell_name):
+        self.prj.cells[top_cell_name] = self.params
+
+class _FakeProject(object):
+    """Records the schematic implemented in each cell.
+    """
+
+    def __init__(self):
+        self.cells = dict()
+        self.num_configured = 0
+
+    def create_design_module(self, tb_lib, tb_cell):
+        return _FakeDesignModule(self)
+
+    def configure_testbench(self, impl_lib, tb_gen_name):
+        self.num_configured += 1
+        return _FakeTestbench(tb_gen_name)
+
+def _get_params(seg_in, in_type='n'):
+    return dict(in_type=in_type,
+                diffpair_params=dict(th_dict=dict(n='lvt', p='lvt'),
+                                     seg_dict=dict(n=seg_in, p=2*seg_in)),
+                cascode_params=dict(n_params=dict(stack=2, seg_list=[seg_in, 1]),
+                                    n_drain_conn=['out']))
+
+@pytest.fixture(autouse=True)
+def _clear_pool():
+    clear_tb_pool()
+    yield
+    clear_tb_pool()
+
+def _prepare(prj, tb_gen_name, params, **tb_vars):
+    return prepare_testbench(prj, 'tb_lib', 'tb_cell', 'impl_lib', tb_gen_name, params, tb_vars)
+
+def test_reuse_across_sizes():
+    prj = _FakeProject()
+    tb_list = []
+    for idx, seg_in in enumerate((2, 4, 4, 8)):
+        tb_obj = _prepare(prj, f'tb_{idx}', _get_params(seg_in), VDD=1.0, VIN=0.1*idx)
+        # Every candidate sees its own sizing and variables
+        assert prj.cells[tb_obj.cell_name] == _get_params(seg_in)
+        assert tb_obj.tb_vars['VIN'] == 0.1*idx
+        tb_list.append(tb_obj)
+        release_testbench(tb_obj)
+
+    assert all(tb_obj is tb_list[0] for tb_obj in tb_list)
+    assert list(prj.cells.keys()) == ['tb_0']
+    assert prj.num_configured == 1
+    assert get_tb_pool_stats() == dict(hits=3, misses=1, resized=2)
+
+def test_new_topology():
+    prj = _FakeProject()
+    tb_n = _prepare(prj, 'tb_0', _get_params(2, in_type='n'))
+    release_testbench(tb_n)
+    tb_p = _prepare(prj, 'tb_1', _get_params(2, in_type='p'))
+    assert tb_p is not tb_n
+    assert prj.num_configured == 2
+    assert get_tb_pool_stats() == dict(hits=0, misses=2, resized=0)
+
+def test_leased_testbench_not_shared():
+    prj = _FakeProject()
+    tb_0 = _prepare(prj, 'tb_0', _get_params(2))
+    tb_1 = _prepare(prj, 'tb_1', _get_params(4))
+    assert tb_0 is not tb_1
+    release_testbench(tb_1)
+    release_testbench(tb_0)
+
+    # Both are idle now, and the one with matching sizes is picked
+    tb_obj = _prepare(prj, 'tb_2', _get_params(2))
+    assert tb_obj is tb_0
+    assert get_tb_pool_stats() == dict(hits=1, misses=2, resized=0)
+
+def test_no_reuse():
+    prj = _FakeProject()
+    tb_0 = _prepare(prj, 'tb_0', _get_params(2))
+    release_testbench(tb_0)
+    tb_1 = prepare_testbench(prj, 'tb_lib', 'tb_cell', 'impl_lib', 'tb_1', _get_params(2), dict(), reuse=False)
+    assert tb_1 is not tb_0
+    assert prj.num_configured == 2
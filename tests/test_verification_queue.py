@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+import asyncio, threading, time
+import pytest
+
+from scripts_dsn import VerificationQueue, FakeSimBackend, BagSimBackend
+
+class _DelayBackend(FakeSimBackend):
+    """Each testbench spec says how long its simulation takes.
+    """
+
+    async def simulate(self, tb_obj, **sim_kwargs):
+        self.delay = tb_obj['delay']
+        return await super().simulate(tb_obj, **sim_kwargs)
+
+def _get_val(results):
+    return results['val']
+
+def test_results_in_completion_order():
+    backend = _DelayBackend(lambda results: results)
+    queue = VerificationQueue(backend, max_concurrent=3)
+    for tag, delay in ((0, 0.06), (1, 0.02), (2, 0.04)):
+        queue.submit(tag, dict(val=tag, delay=delay), _get_val)
+    assert [tag for tag, _ in queue.run()] == [1, 2, 0]
+    assert backend.max_running == 3
+
+def test_serial_by_default():
+    backend = _DelayBackend(lambda results: results)
+    queue = VerificationQueue(backend)
+    for tag, delay in ((0, 0.03), (1, 0.01), (2, 0.02)):
+        queue.submit(tag, dict(val=10*tag, delay=delay), _get_val)
+    assert list(queue.run()) == [(0, 0), (1, 10), (2, 20)]
+    assert backend.max_running == 1
+
+def test_max_concurrent():
+    backend = FakeSimBackend(lambda results: results, delay=0.01)
+    queue = VerificationQueue(backend, max_concurrent=2)
+    for tag in range(6):
+        queue.submit(tag, dict(val=tag), _get_val)
+    assert sorted(queue.run()) == [(tag, tag) for tag in range(6)]
+    assert backend.num_sims == 6
+    assert backend.max_running == 2
+
+def test_submit_while_iterating():
+    backend = FakeSimBackend(lambda results: results)
+    queue = VerificationQueue(backend)
+    queue.submit(0, dict(val=0), _get_val)
+    tag_list = []
+    for tag, val in queue.run():
+        tag_list.append(tag)
+        if tag < 3:
+            queue.submit(tag+1, dict(val=tag+1), _get_val)
+    assert tag_list == [0, 1, 2, 3]
+
+def test_cancel():
+    backend = FakeSimBackend(lambda results: results, delay=0.01)
+    queue = VerificationQueue(backend)
+    for group in range(2):
+        for idx in range(4):
+            queue.submit((group, idx), dict(val=idx), _get_val)
+    # Cancelled before running
+    queue.cancel(lambda tag: tag == (1, 3))
+
+    tag_list = []
+    for tag, val in queue.run():
+        tag_list.append(tag)
+        if tag == (0, 1):
+            # Queued jobs of the same group are skipped once this fails
+            queue.cancel(lambda tag: tag[0] == 0 and tag[1] > 1)
+    # (0, 2) may have started simulating by the time (0, 1) comes back
+    assert [tag for tag in tag_list if tag != (0, 2)] == [(0, 0), (0, 1), (1, 0), (1, 1), (1, 2)]
+    assert backend.num_sims == len(tag_list)
+    assert len(queue) == 0
+
+def test_measure_exception():
+    def measure(results):
+        if results['val'] == 1:
+            raise ValueError('Bad results')
+        return results['val']
+
+    backend = FakeSimBackend(lambda results: results, delay=0.01)
+    queue = VerificationQueue(backend, max_concurrent=2)
+    for tag in range(4):
+        queue.submit(tag, dict(val=tag), measure)
+    tag_list = []
+    with pytest.raises(ValueError, match='Bad results'):
+        for tag, val in queue.run():
+            tag_list.append(tag)
+    assert 1 not in tag_list
+    # Nothing is left running or leased after the error
+    assert backend.num_running == 0
+    assert backend.num_leased == 0
+
+def test_simulate_exception():
+    class _FailBackend(FakeSimBackend):
+        async def simulate(self, tb_obj, **sim_kwargs):
+            if tb_obj['val'] == 0:
+                raise RuntimeError('Simulation failed')
+            return await super().simulate(tb_obj, **sim_kwargs)
+
+    backend = _FailBackend(lambda results: results)
+    queue = VerificationQueue(backend)
+    for tag in range(2):
+        queue.submit(tag, dict(val=tag), _get_val)
+    with pytest.raises(RuntimeError, match='Simulation failed'):
+        list(queue.run())
+    # The failed testbench goes back to the pool
+    assert backend.num_leased == 0
+
+def test_load_results_exception():
+    def result_fn(results):
+        raise OSError('No results')
+
+    backend = FakeSimBackend(result_fn, delay=0.01)
+    queue = VerificationQueue(backend, max_concurrent=2)
+    for tag in range(3):
+        queue.submit(tag, dict(val=tag), _get_val)
+    with pytest.raises(OSError, match='No results'):
+        list(queue.run())
+    assert backend.num_leased == 0
+
+def test_release_when_stopped_early():
+    backend = FakeSimBackend(lambda results: results, delay=0.01)
+    queue = VerificationQueue(backend, max_concurrent=3)
+    for tag in range(6):
+        queue.submit(tag, dict(val=tag), _get_val)
+    result_iter = queue.run()
+    next(result_iter)
+    # Cancels the simulations still running
+    result_iter.close()
+    assert backend.num_sims > 1
+    assert backend.num_leased == 0
+
+class _BlockingTestbench(object):
+    """Testbench with only the blocking run_simulation, which records how
+    many calls overlap.
+    """
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def run_simulation(self, **sim_kwargs):
+        with self.stats['lock']:
+            self.stats['running'] += 1
+            self.stats['max_running'] = max(self.stats['max_running'], self.stats['running'])
+        time.sleep(0.02)
+        with self.stats['lock']:
+            self.stats['running'] -= 1
+        return 'save_dir'
+
+@pytest.mark.parametrize('thread_safe, max_running', [(False, 1), (True, 3)])
+def test_bag_backend_serializes_project(thread_safe, max_running):
+    stats = dict(lock=threading.Lock(), running=0, max_running=0)
+    backend = BagSimBackend(prj=object(), thread_safe=thread_safe)
+
+    async def run_all():
+        return await asyncio.gather(*(backend.simulate(_BlockingTestbench(stats)) for _ in range(3)))
+
+    loop = asyncio.new_event_loop()
+    try:
+        assert loop.run_until_complete(run_all()) == ['save_dir']*3
+    finally:
+        loop.close()
+    assert stats['max_running'] == max_running
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+from scripts_dsn import get_vgs_lut, verify_vgs_lut
+
+class _SquareLawDB(object):
+    """Stands in for MOSDBDiscrete with a smooth square-law device, which is
+    monotonic in gate drive and has a closed-form inverse.
+    """
+    k = 1e-4
+    vth = 0.4
+    n_sub = 0.05 # Softens the turn-on, in volts
+    lam = 0.1
+
+    def __init__(self, is_nch:bool):
+        self.sgn = 1 if is_nch else -1
+
+    def _get_op(self, vgs, vds, vbs):
+        vgs, vds = self.sgn*np.asarray(vgs, dtype=float), self.sgn*np.asarray(vds, dtype=float)
+        x = (vgs - self.vth)/self.n_sub
+        vov = self.n_sub*np.logaddexp(0, x)
+        ibias = self.k*vov**2*(1 + self.lam*vds)
+        gm = 2*self.k*vov*(1 + self.lam*vds)/(1 + np.exp(-x))
+        return dict(ibias=ibias, gm=gm)
+
+    def get_vgs(self, ibias, vds):
+        vov = np.sqrt(ibias/(self.k*(1 + self.lam*self.sgn*vds)))
+        return self.sgn*(self.vth + self.n_sub*np.log(np.expm1(vov/self.n_sub)))
+
+    def query(self, vgs, vds, vbs):
+        return {k:float(v) for k, v in self._get_op(vgs, vds, vbs).items()}
+
+    def get_fun_arg(self, vgs, vds, vbs):
+        return np.array([vbs, vds, vgs])
+
+    def get_function(self, name):
+        return lambda arg: self._get_op(arg[..., 2], arg[..., 1], arg[..., 0])[name]
+
+@pytest.mark.parametrize('is_nch', [True, False])
+def test_vgs_error_bound(is_nch):
+    vdd = 1.2
+    db = _SquareLawDB(is_nch)
+    sgn = 1 if is_nch else -1
+    vds_vec = sgn*np.linspace(0.1, 1.1, 11)
+    lut = get_vgs_lut(db, is_nch=is_nch, vdd=vdd, vds_vec=vds_vec)
+
+    # Weak to strong inversion, on and between the vds grid points
+    itarget = np.logspace(-9, -5, 41)[:, None]
+    vds = sgn*np.linspace(0.1, 1.1, 21)[None, :]
+    success, vgs = lut.get_vgs(itarget, vds=vds, vbs=0)
+    assert np.all(success)
+
+    vgs_ref = db.get_vgs(itarget, vds)
+    # Far finer than the vdd/1000 resolution of match_vgs
+    assert np.max(np.abs(vgs - vgs_ref)) < 2e-5
+    ibias = db._get_op(vgs, vds, 0)['ibias']
+    assert np.max(np.abs(ibias/itarget - 1)) < 2e-4
+
+    # No worse than the binary search it replaces
+    err_dict = verify_vgs_lut(lut, itarget, vds=vds, vbs=0)
+    assert err_dict['num_missed'] == 0
+    assert err_dict['ibias_err_max'] <= err_dict['ibias_err_ref_max']
+
+def test_gm_id():
+    vdd = 1.2
+    db = _SquareLawDB(True)
+    lut = get_vgs_lut(db, is_nch=True, vdd=vdd, vds_vec=[0.6])
+    vgs_ref = np.linspace(0.45, 1.0, 12)
+    op = db._get_op(vgs_ref, 0.6, 0)
+    success, vgs = lut.get_vgs_gm_id(op['gm']/op['ibias'], vds=0.6, vbs=0)
+    assert np.all(success)
+    assert np.max(np.abs(vgs - vgs_ref)) < 1e-3*vdd
+
+def test_out_of_range():
+    db = _SquareLawDB(True)
+    lut = get_vgs_lut(db, is_nch=True, vdd=1.2, vds_vec=[0.2, 0.4])
+    # More current than the device gives at vgs=vdd, and vds off the grid
+    success, _ = lut.get_vgs([1e-1, 1e-6, 1e-6], vds=[0.3, 0.3, 0.5], vbs=0)
+    assert success.tolist() == [False, True, False]
+
+def test_shared():
+    db = _SquareLawDB(True)
+    lut = get_vgs_lut(db, is_nch=True, vdd=1.2, vds_vec=[0.4, 0.2])
+    assert get_vgs_lut(db, is_nch=True, vdd=1.2, vds_vec=[0.2, 0.4]) is lut
+    assert get_vgs_lut(db, is_nch=True, vdd=1.2, vds_vec=[0.2, 0.6]) is not lut